@@ -0,0 +1,106 @@
+# Compares the two match history formats (see `MATCH_HISTORY_FORMAT`): the
+# bytes stored per game, and how long it takes to reconstruct the current
+# position and the full history of a match.
+#
+# Run from `backend/api` with `python -m benchmarks.history_benchmark [games]`
+
+import os
+import sys
+import random
+import tempfile
+import statistics
+import time
+
+from config import Config
+from dark_chess_api import create_app, db
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match, DarkBoard
+
+# Random pseudo-legal games, as lists of uci moves, all ending the way matches
+# do (on checkmate or a captured king) or after `max_plies`.
+def random_games(count, seed=0, max_plies=150):
+	rng = random.Random(seed)
+	games = []
+	for i in range(count):
+		board = DarkBoard()
+		moves = []
+		while (len(moves) < max_plies and
+			not board.is_checkmate() and not board.king_captured()):
+			move = rng.choice(list(board.pseudo_legal_moves))
+			board.push(move)
+			moves.append(move.uci())
+		games.append(moves)
+	return games
+
+def play(games):
+	u1 = User('user1', 'user1@example.com', 'password')
+	u2 = User('user2', 'user2@example.com', 'password')
+	db.session.add_all([u1, u2])
+	db.session.commit()
+	for moves in games:
+		m = Match()
+		db.session.add(m)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		for uci in moves:
+			assert m.attempt_move(m.current_player, uci)
+		db.session.commit()
+
+def stored_bytes():
+	return db.session.execute(
+		'SELECT sum(pgsize) FROM dbstat '
+		'WHERE name IN (\'match_state\', \'ix_match_state_match_id_ply\')'
+	).scalar()
+
+def median_ms(f, match_ids):
+	times = []
+	for match_id in match_ids:
+		db.session.remove()
+		m = Match.query.get(match_id)
+		start = time.perf_counter()
+		f(m)
+		times.append(time.perf_counter() - start)
+	return statistics.median(times) * 1e3
+
+def run(game_count=200):
+	games = random_games(game_count)
+	plies = sum(len(moves) for moves in games)
+	directory = tempfile.mkdtemp()
+	results = {}
+	for history_format in ['full', 'compact']:
+		path = os.path.join(directory, f'{history_format}.db')
+		class BenchmarkConfig(Config):
+			SECRET_KEY = 'benchmark'
+			SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+			MATCH_HISTORY_FORMAT = history_format
+		app = create_app(BenchmarkConfig)
+		with app.app_context():
+			db.create_all()
+			play(games)
+			match_ids = [m.id for m in Match.query.all()]
+			results[history_format] = {
+				'bytes': stored_bytes(),
+				# A fresh session each time, so that the current state (and for
+				# compact histories, the moves since the last checkpoint) are
+				# loaded from the database.
+				'position': median_ms(lambda m: m.snapshot.board, match_ids),
+				'history': median_ms(lambda m: m.history_fens('white'), match_ids)
+			}
+			db.session.remove()
+			db.engine.dispose()
+		os.remove(path)
+	os.rmdir(directory)
+	print(f'{game_count} games, {plies / game_count:.0f} plies per game on '
+		f'average, checkpoints every {Config.MATCH_CHECKPOINT_INTERVAL} plies')
+	print(f'\n{"":<10}{"bytes/game":>12}{"bytes/ply":>12}'
+		f'{"position (ms)":>16}{"history (ms)":>16}')
+	for history_format, result in results.items():
+		print(f'{history_format:<10}'
+			f'{result["bytes"] / game_count:>12.0f}'
+			f'{result["bytes"] / plies:>12.1f}'
+			f'{result["position"]:>16.2f}'
+			f'{result["history"]:>16.2f}')
+
+if __name__ == '__main__':
+	run(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,102 @@
+# How late websocket greenlets run while a burst of logins (each a PBKDF2 hash)
+# is being handled, with password hashing run inline on the event loop and
+# offloaded to eventlet's threadpool. A greenlet waking every few milliseconds
+# stands in for the websocket ones, which wait on the hub in the same way to
+# receive and broadcast moves. Also reports how quickly the logins get through.
+#
+# Needs eventlet, which the api is deployed with. Run from `backend/api` with
+# `python -m benchmarks.login_storm_benchmark [logins] [concurrency]`
+
+import eventlet
+eventlet.monkey_patch(psycopg=False) # the benchmark uses sqlite
+
+import os
+import sys
+import time
+import base64
+import tempfile
+import statistics
+
+from config import Config
+from dark_chess_api import create_app, db
+from dark_chess_api.modules.users import password_hasher
+from dark_chess_api.modules.users.models import User
+
+USERS = 20
+TICK = 0.005
+
+class BenchmarkConfig(Config):
+	SECRET_KEY = 'benchmark'
+	ENDPOINT_METRICS = False
+
+def basic_auth(username):
+	credentials = base64.b64encode(f'{username}:password'.encode()).decode()
+	return { 'Authorization': f'Basic {credentials}' }
+
+# Every login after the first for each user only reads, since their token's
+# already been issued.
+def setup(app):
+	with app.app_context():
+		db.create_all()
+		users = [
+			User(f'user{i}', f'user{i}@example.com', 'password')
+			for i in range(USERS)
+		]
+		db.session.add_all(users)
+		db.session.commit()
+		for u in users:
+			u.get_token()
+		db.session.remove()
+
+def storm(app, logins, concurrency):
+	lateness = []
+	done = False
+	def ticker():
+		while not done:
+			start = time.perf_counter()
+			eventlet.sleep(TICK)
+			lateness.append(time.perf_counter() - start - TICK)
+	def login(i):
+		res = app.test_client().get('/user/auth/token',
+			headers=basic_auth(f'user{i % USERS}')
+		)
+		assert res.status_code == 200, res.get_json()
+	ticking = eventlet.spawn(ticker)
+	eventlet.sleep(0.1)
+	pool = eventlet.GreenPool(concurrency)
+	start = time.perf_counter()
+	for result in pool.imap(login, range(logins)):
+		pass
+	elapsed = time.perf_counter() - start
+	if not logins:
+		eventlet.sleep(0.5)
+	done = True
+	ticking.wait()
+	lateness.sort()
+	return (
+		statistics.median(lateness) * 1e3,
+		lateness[min(int(len(lateness) * 0.99), len(lateness) - 1)] * 1e3,
+		lateness[-1] * 1e3,
+		logins / elapsed if logins else None
+	)
+
+def run(logins=200, concurrency=50):
+	with tempfile.TemporaryDirectory() as directory:
+		BenchmarkConfig.SQLALCHEMY_DATABASE_URI = \
+			f'sqlite:///{os.path.join(directory, "benchmark.db")}'
+		app = create_app(BenchmarkConfig)
+		setup(app)
+		print(f'{logins} logins, {concurrency} at a time, '
+			f'{password_hasher.method}; websocket greenlet lateness')
+		print(f'{"hashing":<12}{"p50 (ms)":>10}{"p99 (ms)":>10}'
+			f'{"max (ms)":>10}{"logins/s":>10}')
+		for name, offload, count in [('idle', True, 0), ('inline', False, logins),
+			('offloaded', True, logins)]:
+			app.config['PASSWORD_HASH_OFFLOAD'] = offload
+			password_hasher.init_app(app)
+			p50, p99, worst, rate = storm(app, count, concurrency)
+			print(f'{name:<12}{p50:>10.2f}{p99:>10.2f}{worst:>10.2f}'
+				f'{rate if rate is not None else 0:>10.1f}')
+
+if __name__ == '__main__':
+	run(*[int(arg) for arg in sys.argv[1:3]])
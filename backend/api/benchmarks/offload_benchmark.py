@@ -0,0 +1,116 @@
+# How late websocket greenlets run while requests for a long (300 ply) match
+# stored compactly are being served, each replaying its whole history, with
+# the replays done on the event loop, in eventlet's threadpool, and in worker
+# processes. A greenlet waking every few milliseconds stands in for the
+# websocket ones, as in `login_storm_benchmark`. Also reports how long the
+# requests took.
+#
+# Needs eventlet, which the api is deployed with. Run from `backend/api` with
+# `python -m benchmarks.offload_benchmark [requests] [concurrency]`
+
+import eventlet
+eventlet.monkey_patch(psycopg=False) # the benchmark uses sqlite
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+from config import Config
+from dark_chess_api import create_app, db, worker_pool
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match
+
+PLIES = 300
+TICK = 0.005
+
+class BenchmarkConfig(Config):
+	SECRET_KEY = 'benchmark'
+	ENDPOINT_METRICS = False
+	ENDPOINT_CACHE_URL = None
+	MATCH_HISTORY_FORMAT = 'compact'
+
+# Knights shuffling back and forth, so that the match lasts as long as needed.
+def setup(app):
+	with app.app_context():
+		db.create_all()
+		users = [
+			User('user1', 'user1@example.com', 'password'),
+			User('user2', 'user2@example.com', 'password')
+		]
+		db.session.add_all(users)
+		db.session.commit()
+		m = Match()
+		db.session.add(m)
+		m.join(users[0])
+		m.join(users[1])
+		db.session.commit()
+		shuffle = ['g1f3', 'g8f6', 'f3g1', 'f6g8']
+		for i in range(PLIES):
+			player = m.player_white if i % 2 == 0 else m.player_black
+			assert m.attempt_move(player, shuffle[i % 4])
+			db.session.commit()
+		token = m.player_white.get_token()
+		match_id = m.id
+		db.session.remove()
+	return match_id, token
+
+def load(app, match_id, token, requests, concurrency):
+	lateness = []
+	durations = []
+	done = False
+	def ticker():
+		while not done:
+			start = time.perf_counter()
+			eventlet.sleep(TICK)
+			lateness.append(time.perf_counter() - start - TICK)
+	def get_match(i):
+		start = time.perf_counter()
+		res = app.test_client().get(f'/match/{match_id}',
+			headers={'Authorization': f'Bearer {token}'}
+		)
+		durations.append(time.perf_counter() - start)
+		assert res.status_code == 200, res.get_json()
+	ticking = eventlet.spawn(ticker)
+	eventlet.sleep(0.1)
+	pool = eventlet.GreenPool(concurrency)
+	for result in pool.imap(get_match, range(requests)):
+		pass
+	done = True
+	ticking.wait()
+	lateness.sort()
+	return (
+		statistics.median(lateness) * 1e3,
+		lateness[min(int(len(lateness) * 0.99), len(lateness) - 1)] * 1e3,
+		lateness[-1] * 1e3,
+		statistics.median(durations) * 1e3
+	)
+
+def run(requests=40, concurrency=8):
+	with tempfile.TemporaryDirectory() as directory:
+		BenchmarkConfig.SQLALCHEMY_DATABASE_URI = \
+			f'sqlite:///{os.path.join(directory, "benchmark.db")}'
+		app = create_app(BenchmarkConfig)
+		match_id, token = setup(app)
+		print(f'{requests} requests for a {PLIES} ply match, {concurrency} at a '
+			f'time, {app.config["OFFLOAD_WORKERS"]} workers; websocket greenlet '
+			'lateness')
+		print(f'{"replays":<12}{"p50 (ms)":>10}{"p99 (ms)":>10}'
+			f'{"max (ms)":>10}{"request p50 (ms)":>18}')
+		for name, workers, mode in [('inline', 0, 'thread'),
+			('threads', None, 'thread'), ('processes', None, 'process')]:
+			app.config['OFFLOAD_WORKERS'] = (workers if workers is not None
+				else BenchmarkConfig.OFFLOAD_WORKERS)
+			app.config['OFFLOAD_MODE'] = mode
+			worker_pool.init_app(app)
+			# Workers are started by the first job, which isn't timed.
+			load(app, match_id, token, 1, 1)
+			p50, p99, worst, request = load(app, match_id, token, requests,
+				concurrency
+			)
+			print(f'{name:<12}{p50:>10.2f}{p99:>10.2f}{worst:>10.2f}{request:>18.1f}')
+		worker_pool.shutdown(wait=True)
+
+if __name__ == '__main__':
+	run(*[int(arg) for arg in sys.argv[1:3]])
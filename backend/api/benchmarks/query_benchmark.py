@@ -0,0 +1,202 @@
+# Benchmark for the match and invite listing queries on a large synthetic
+# SQLite database, with and without the indexes for them. Prints the query plan
+# and latency of each query both ways.
+#
+# Run from `backend/api` with `python -m benchmarks.query_benchmark [matches]`
+# (a million matches by default, which takes a minute or so to generate).
+
+import os
+import sys
+import random
+import tempfile
+import statistics
+import time
+from datetime import datetime
+
+import chess
+from sqlalchemy import or_
+
+from config import Config
+from dark_chess_api import create_app, db
+from dark_chess_api.endpoint_handler import Page
+from dark_chess_api.modules.matches.models import Match, MatchInvite
+from dark_chess_api.modules.matches.endpoints import where
+
+USERS = 10000
+QUERY_USERS = 50
+
+INDEXES = [
+	'ix_match_player_white_id_is_finished',
+	'ix_match_player_black_id_is_finished',
+	'ix_match_invite_inviter_id_match_id',
+	'ix_match_invite_invited_id_match_id',
+	'ix_match_current_player_id',
+]
+
+def populate(match_count, seed=0):
+	rng = random.Random(seed)
+	now = datetime.utcnow()
+	connection = db.engine.raw_connection()
+	cursor = connection.cursor()
+	cursor.execute('PRAGMA synchronous = OFF')
+	cursor.execute('PRAGMA journal_mode = MEMORY')
+	cursor.executemany(
+		'INSERT INTO user (id, username, email, email_confirmed, '
+		'registration_date, password_hash) VALUES (?, ?, ?, 0, ?, ?)',
+		((i, f'user{i}', f'user{i}@example.com', now, 'x')
+			for i in range(1, USERS + 1))
+	)
+	matches = []
+	states = []
+	for i in range(1, match_count + 1):
+		white = rng.randint(1, USERS)
+		black = rng.randint(1, USERS - 1)
+		black = black + 1 if black >= white else black
+		roll = rng.random()
+		# Matches are made when an invite is accepted, so hardly any are left
+		# waiting for a second player.
+		if roll < 0.001:
+			matches.append((i, str(i), white, None, False, None, 0, None, None,
+				None))
+			continue
+		# Most matches are long finished, the rest are in progress.
+		is_finished = roll > 0.2
+		ply = rng.randint(0, 80)
+		side = 'white' if ply % 2 == 0 else 'black'
+		current_player = None
+		if not is_finished:
+			current_player = white if side == 'white' else black
+		matches.append((i, str(i), white, black, is_finished, i, ply, side, now,
+			current_player))
+		states.append((i, chess.STARTING_FEN, ply, now, i))
+	cursor.executemany(
+		'INSERT INTO match (id, connection_token, player_white_id, '
+		'player_black_id, is_finished, current_state_id, ply_count, '
+		'side_to_move, last_move_at, current_player_id) '
+		'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+		matches
+	)
+	cursor.executemany(
+		'INSERT INTO match_state (id, fen, ply, created_on, match_id) '
+		'VALUES (?, ?, ?, ?, ?)',
+		states
+	)
+	invites = []
+	for i in range(1, match_count // 5 + 1):
+		inviter = rng.randint(1, USERS)
+		invited = rng.randint(1, USERS) if rng.random() < 0.5 else None
+		accepted = rng.random() < 0.9
+		invites.append((i, inviter, invited, i if accepted else None, now))
+	cursor.executemany(
+		'INSERT INTO match_invite (id, inviter_id, invited_id, match_id, '
+		'created_on) VALUES (?, ?, ?, ?, ?)',
+		invites
+	)
+	connection.commit()
+	connection.close()
+
+# The first page of each listing, built the same way as the endpoints build
+# them.
+def listing_queries(user_id):
+	involved = or_(
+		Match.player_black_id==user_id,
+		Match.player_white_id==user_id
+	)
+	invite_involved = or_(
+		MatchInvite.inviter_id==user_id,
+		MatchInvite.invited_id==user_id
+	)
+	invites = db.session.query(MatchInvite)
+	return {
+		'active matches': (Match.summary_query().filter(involved).filter(
+			where(Match.in_progress, True)
+		), Match.id),
+		'finished matches': (Match.summary_query().filter(involved).filter(
+			Match.is_finished==True
+		), Match.id),
+		'my turn': (Match.summary_query().filter(
+			Match.current_player_id==user_id
+		), Match.id),
+		'open matches': (Match.summary_query().filter(
+			where(Match.open, True)
+		), Match.id),
+		'pending invites': (invites.filter(invite_involved).filter(
+			where(MatchInvite.accepted, False)
+		), MatchInvite.id),
+		'sent invites': (invites.filter(
+			MatchInvite.inviter_id==user_id
+		).filter(where(MatchInvite.accepted, False)), MatchInvite.id),
+		'open invites': (invites.filter(where(MatchInvite.open, True)).filter(
+			where(MatchInvite.accepted, False)
+		), MatchInvite.id)
+	}
+
+def query_plan(query, key):
+	statement = query.order_by(key).limit(Page(20).limit + 1).statement
+	sql = str(statement.compile(db.engine,
+		compile_kwargs={ 'literal_binds': True }
+	))
+	plan = db.session.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+	return [row[-1] for row in plan]
+
+def measure(user_ids):
+	timings = {}
+	for user_id in user_ids:
+		for name, (query, key) in listing_queries(user_id).items():
+			start = time.perf_counter()
+			Page(20).paginate(query, key)
+			timings.setdefault(name, []).append(time.perf_counter() - start)
+	plans = {
+		name: query_plan(query, key)
+		for name, (query, key) in listing_queries(user_ids[0]).items()
+	}
+	return plans, {
+		name: statistics.median(times) * 1e3 for name, times in timings.items()
+	}
+
+def set_indexes(create):
+	tables = [Match.__table__, MatchInvite.__table__]
+	for index in [i for t in tables for i in t.indexes if i.name in INDEXES]:
+		if create:
+			index.create(db.engine)
+		else:
+			index.drop(db.engine)
+	db.session.execute('ANALYZE')
+
+def run(match_count=1000000):
+	directory = tempfile.mkdtemp()
+	class BenchmarkConfig(Config):
+		SECRET_KEY = 'benchmark'
+		SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+			directory, 'benchmark.db'
+		)
+	app = create_app(BenchmarkConfig)
+	with app.app_context():
+		db.create_all()
+		start = time.perf_counter()
+		set_indexes(False)
+		populate(match_count)
+		print(f'Generated {match_count} matches in '
+			f'{time.perf_counter() - start:.1f}s')
+		user_ids = random.Random(1).sample(range(1, USERS + 1), QUERY_USERS)
+		before_plans, before = measure(user_ids)
+		set_indexes(True)
+		after_plans, after = measure(user_ids)
+		for name in before:
+			print(f'\n{name}')
+			print('  before:')
+			for step in before_plans[name]:
+				print(f'    {step}')
+			print('  after:')
+			for step in after_plans[name]:
+				print(f'    {step}')
+		print(f'\n{"query":<20}{"before (ms)":>14}{"after (ms)":>14}')
+		for name in before:
+			print(f'{name:<20}{before[name]:>14.2f}{after[name]:>14.2f}')
+		db.session.remove()
+		db.engine.dispose()
+	os.remove(os.path.join(directory, 'benchmark.db'))
+	os.rmdir(directory)
+
+if __name__ == '__main__':
+	run(*[int(arg) for arg in sys.argv[1:2]])
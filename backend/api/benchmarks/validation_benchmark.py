@@ -0,0 +1,121 @@
+# Per-request payload validation overhead of every endpoint that accepts one:
+# `jsonschema.validate` (as every request used to do), the validator compiled
+# once, and the generated one, for a valid and an invalid payload each. Also
+# times whole `make-move` requests through the test client with each, for a
+# sense of how much of a request validation is.
+#
+# Run from `backend/api` with `python -m benchmarks.validation_benchmark [calls]`
+
+import sys
+import time
+import statistics
+from unittest import mock
+
+from jsonschema import validate, ValidationError
+
+from config import Config
+from dark_chess_api import create_app, db, endpointer
+from dark_chess_api.endpoint_handler.validation import PayloadValidator
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match
+
+VALID_VALUES = { 'string': 'e2e4', 'integer': 1, 'boolean': True }
+
+class BenchmarkConfig(Config):
+	SECRET_KEY = 'benchmark'
+	SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+def payloads(endpoint):
+	valid = {
+		key: VALID_VALUES[schema['type']]
+		for key, schema in endpoint.schema_base.items()
+	}
+	invalid = { key: [] for key in endpoint.schema_base }
+	return valid, invalid
+
+def microseconds(f, payload, calls):
+	def call():
+		try:
+			f(payload)
+		except ValidationError:
+			pass
+	times = []
+	for i in range(5):
+		start = time.perf_counter()
+		for j in range(calls):
+			call()
+		times.append((time.perf_counter() - start) / calls)
+	return min(times) * 1e6
+
+def validation(calls):
+	endpoints = [
+		endpoint for resource in endpointer.resources.values()
+		for endpoint in resource.endpoints.values() if endpoint.accepts
+	]
+	print(f'{"endpoint":<22}{"payload":>9}{"validate (us)":>16}'
+		f'{"compiled (us)":>16}{"generated (us)":>17}')
+	for endpoint in endpoints:
+		schema = endpoint.validation_schema
+		compiled = PayloadValidator(schema, generate=False)
+		generated = PayloadValidator(schema)
+		for name, payload in zip(['valid', 'invalid'], payloads(endpoint)):
+			print(f'{endpoint.name:<22}{name:>9}'
+				f'{microseconds(lambda p: validate(p, schema), payload, calls):>16.1f}'
+				f'{microseconds(compiled.validate, payload, calls):>16.1f}'
+				f'{microseconds(generated.validate, payload, calls):>17.1f}')
+
+# Moves back and forth on a fresh match, timed a request at a time.
+def make_move_requests(client, moves):
+	m = Match()
+	db.session.add(m)
+	m.join(User.query.get(1))
+	m.join(User.query.get(2))
+	db.session.commit()
+	headers = {
+		side: { 'Authorization': f'Bearer {player.get_token()}' }
+		for side, player in [('white', m.player_white), ('black', m.player_black)]
+	}
+	db.session.commit()
+	shuffle = ['g1f3', 'g8f6', 'f3g1', 'f6g8']
+	times = []
+	for i in range(moves):
+		side = 'white' if i % 2 == 0 else 'black'
+		start = time.perf_counter()
+		res = client.post(f'/match/{m.id}/make-move', headers=headers[side],
+			json={ 'uci_string': shuffle[i % 4] }
+		)
+		times.append(time.perf_counter() - start)
+		assert res.status_code == 200, res.get_json()
+	return statistics.median(times) * 1e3
+
+def move_requests(moves):
+	app = create_app(BenchmarkConfig)
+	make_move = endpointer.resources['matches'].endpoints['make_move']
+	validators = {
+		'validate': lambda p: validate(p, make_move.validation_schema),
+		'compiled': PayloadValidator(make_move.validation_schema,
+			generate=False
+		).validate,
+		'generated': make_move.validator.validate
+	}
+	with app.app_context():
+		db.create_all()
+		db.session.add_all([
+			User('user1', 'user1@example.com', 'password'),
+			User('user2', 'user2@example.com', 'password')
+		])
+		db.session.commit()
+		client = app.test_client()
+		print(f'\nmake-move requests, median of {moves}')
+		for name, f in validators.items():
+			with mock.patch.object(make_move.validator, 'validate', f):
+				print(f'{name:<12}{make_move_requests(client, moves):>8.2f}ms')
+		db.session.remove()
+
+def run(calls=10000):
+	create_app(BenchmarkConfig)
+	validation(calls)
+	move_requests(max(calls // 50, 20))
+
+if __name__ == '__main__':
+	run(*[int(arg) for arg in sys.argv[1:2]])
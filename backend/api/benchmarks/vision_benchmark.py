@@ -0,0 +1,75 @@
+# Micro-benchmark comparing the original move-list based dark fen rendering
+# with the bitboard based `DarkBoard.vision_mask`.
+#
+# Run from `backend/api` with `python -m benchmarks.vision_benchmark`
+
+import random
+import timeit
+import chess
+
+from dark_chess_api.modules.matches.models import DarkBoard
+
+def legacy_dark_fen(board, side):
+	player_side = chess.WHITE if side == 'white' else chess.BLACK
+	board.turn = player_side
+	attackable_squares = []
+	for move in board.pseudo_legal_moves:
+		attackable_squares.append(move.from_square)
+		attackable_squares.append(move.to_square)
+	dfen = ''
+	for rank in range(7, -1, -1):
+		for file in range(8):
+			square = chess.square(file, rank)
+			piece = board.piece_at(square)
+			if (square in attackable_squares or
+				(piece is not None and piece.color == player_side)):
+				dfen += piece.symbol() if piece is not None else '_'
+			else:
+				dfen += '?'
+		if rank > 0:
+			dfen += '/'
+	return dfen
+
+# Mid-game positions, taken from random legal games somewhere between move 10
+# and move 20.
+def midgame_fens(count, seed=0):
+	rng = random.Random(seed)
+	fens = []
+	while len(fens) < count:
+		board = chess.Board()
+		for ply in range(rng.randint(20, 40)):
+			moves = list(board.legal_moves)
+			if not moves:
+				break
+			board.push(rng.choice(moves))
+		if not board.is_game_over():
+			fens.append(board.fen())
+	return fens
+
+def run(count=200, repeat=5):
+	fens = midgame_fens(count)
+	boards = [DarkBoard(fen=fen) for fen in fens]
+	for board in boards:
+		for side in ['white', 'black']:
+			assert legacy_dark_fen(board.copy(), side) == board.dark_fen(side)
+
+	def legacy():
+		for board in boards:
+			legacy_dark_fen(board, 'white')
+			legacy_dark_fen(board, 'black')
+
+	def bitboard():
+		for board in boards:
+			board.dark_fen('white')
+			board.dark_fen('black')
+
+	legacy_time = min(timeit.repeat(legacy, number=1, repeat=repeat))
+	bitboard_time = min(timeit.repeat(bitboard, number=1, repeat=repeat))
+	renders = count * 2
+	print(f'{count} mid-game positions, {renders} dark fens per run')
+	print(f'legacy:   {legacy_time * 1e6 / renders:8.1f} us/fen')
+	print(f'bitboard: {bitboard_time * 1e6 / renders:8.1f} us/fen')
+	print(f'speedup:  {legacy_time / bitboard_time:8.1f}x')
+
+if __name__ == '__main__':
+	run()
@@ -17,7 +17,7 @@ def env_to_bool(value, default=False):
 def env_to_int(value, default):
 	try:
 		return int(value)
-	except Error:
+	except (TypeError, ValueError):
 		return default
 	return default
 
@@ -68,4 +68,117 @@ class Config:
 
 	TOKEN_LIFESPAN_MINUTES = env_to_int(os.environ.get('TOKEN_LIFESPAN_MINUTES'), 120)
 
-	BETA_KEYS_REQUIRED = env_to_bool(os.environ.get('BETA_KEYS_REQUIRED'), False)
\ No newline at end of file
+	# What kind of bearer tokens are issued. 'database' tokens are random, and
+	# looked up (along with their user) on every request. 'signed' tokens carry
+	# the user's id, signed with `SECRET_KEY`, and are checked without a lookup,
+	# other than of the user's token generation (bumped when their token is
+	# revoked), which each process caches for `TOKEN_GENERATION_TTL` seconds.
+	# Either kind is accepted whichever is chosen.
+	TOKEN_MODE = os.environ.get('TOKEN_MODE') or 'database'
+	TOKEN_GENERATION_TTL = env_to_int(os.environ.get('TOKEN_GENERATION_TTL'), 30)
+	TOKEN_GENERATION_CACHE_SIZE = env_to_int(
+		os.environ.get('TOKEN_GENERATION_CACHE_SIZE'), 10000
+	)
+
+	# Passwords are hashed with PBKDF2, using `PASSWORD_HASH_ALGORITHM` (any of
+	# hashlib's) and `PASSWORD_HASH_ITERATIONS`. Changing them (or the salt
+	# length) doesn't lock anyone out, each user's hash is redone the next time
+	# they log in. The defaults, salt length included, are werkzeug's, which
+	# every existing hash was made with, so none are redone unless they're
+	# changed. With `PASSWORD_HASH_OFFLOAD`, hashing runs in eventlet's
+	# threadpool when it's in use, or a pool of threads otherwise, at most
+	# `PASSWORD_HASH_WORKERS` hashes at a time.
+	PASSWORD_HASH_ALGORITHM = os.environ.get('PASSWORD_HASH_ALGORITHM') or 'sha256'
+	PASSWORD_HASH_ITERATIONS = env_to_int(
+		os.environ.get('PASSWORD_HASH_ITERATIONS'), 150000
+	)
+	PASSWORD_SALT_LENGTH = env_to_int(os.environ.get('PASSWORD_SALT_LENGTH'), 8)
+	PASSWORD_HASH_OFFLOAD = env_to_bool(os.environ.get('PASSWORD_HASH_OFFLOAD'), True)
+	# Leaving a core for everything else.
+	PASSWORD_HASH_WORKERS = env_to_int(os.environ.get('PASSWORD_HASH_WORKERS'),
+		max((os.cpu_count() or 2) - 1, 1)
+	)
+
+	BETA_KEYS_REQUIRED = env_to_bool(os.environ.get('BETA_KEYS_REQUIRED'), False)
+
+	# Comma separated usernames of the users allowed to use admin endpoints.
+	ADMIN_USERNAMES = [
+		username.strip() for username in
+		(os.environ.get('ADMIN_USERNAMES') or '').split(',') if username.strip()
+	]
+
+	# How match histories are stored. 'full' keeps every position as a fen,
+	# along with its rendered dark fens. 'compact' keeps only the move played,
+	# with a full position checkpoint every `MATCH_CHECKPOINT_INTERVAL` plies,
+	# and replays positions from the nearest checkpoint when they're needed.
+	# Histories stored either way can be read whichever is chosen.
+	MATCH_HISTORY_FORMAT = os.environ.get('MATCH_HISTORY_FORMAT') or 'full'
+	MATCH_CHECKPOINT_INTERVAL = env_to_int(
+		os.environ.get('MATCH_CHECKPOINT_INTERVAL'), 20
+	)
+	# Every ply's checked against it, so 0 would fail every move.
+	if MATCH_CHECKPOINT_INTERVAL < 1:
+		raise ValueError('MATCH_CHECKPOINT_INTERVAL must be at least 1')
+
+	# How many of the latest move events are kept for each side of a match, and
+	# for how many matches, so that clients reconnecting to the match socket
+	# can be sent just the moves they missed. Clients that have missed more
+	# than that are sent the whole position instead.
+	MOVE_EVENT_BUFFER_SIZE = env_to_int(
+		os.environ.get('MOVE_EVENT_BUFFER_SIZE'), 32
+	)
+	MOVE_EVENT_BUFFER_MATCHES = env_to_int(
+		os.environ.get('MOVE_EVENT_BUFFER_MATCHES'), 1000
+	)
+
+	# How many of the latest moves' phase timings are kept (see
+	# `/match/move-timings`), and how slow a move has to be, in milliseconds,
+	# for its timing to be logged.
+	MOVE_TIMINGS_SIZE = env_to_int(os.environ.get('MOVE_TIMINGS_SIZE'), 256)
+	SLOW_MOVE_MS = env_to_int(os.environ.get('SLOW_MOVE_MS'), 250)
+
+	# Websocket events only reach the clients of the process that sent them,
+	# unless every process shares a message queue, which is needed to run more
+	# than one worker. Either a url for redis or kombu (with that package
+	# installed), or `local://host:port` for the stand-in broker that comes
+	# with the api (`flask websockets broker`). Clusters sharing a queue should
+	# each use their own channel.
+	SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+	SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL') or 'flask-socketio'
+
+	# Where endpoints with a cache policy keep their responses, if anywhere
+	# (caching's off by default). 'memory://' keeps them in each process, which
+	# is only right for a single worker, since the others never hear about
+	# invalidations (and so serve what they have until it expires), and so
+	# isn't allowed with a `SOCKETIO_MESSAGE_QUEUE`. Otherwise a redis url
+	# (with that package installed), or `local://host:port` for the stand-in
+	# that comes with the api (`flask endpoints cache-server`).
+	ENDPOINT_CACHE_URL = os.environ.get('ENDPOINT_CACHE_URL') or None
+	ENDPOINT_CACHE_SIZE = env_to_int(os.environ.get('ENDPOINT_CACHE_SIZE'), 1024)
+
+	# Request counts, latencies, SQL statements and sizes for every endpoint,
+	# served in Prometheus' format at `/metrics` and tabled on the docs pages.
+	# Latency quantiles are of the last `ENDPOINT_METRICS_WINDOW` requests to
+	# each endpoint. Everything's per process, so scrape each worker.
+	ENDPOINT_METRICS = env_to_bool(os.environ.get('ENDPOINT_METRICS'), True)
+	ENDPOINT_METRICS_WINDOW = env_to_int(
+		os.environ.get('ENDPOINT_METRICS_WINDOW'), 1024
+	)
+
+	# CPU bound work, like replaying long match histories, is done by a pool
+	# of `OFFLOAD_WORKERS` workers (processes, or threads if `OFFLOAD_MODE` is
+	# 'thread'), so that it doesn't stall every other request and websocket on
+	# the event loop. Up to `OFFLOAD_QUEUE_SIZE` jobs wait for a worker, and any
+	# more are turned away with a 503. 0 workers does the work in place.
+	OFFLOAD_WORKERS = env_to_int(os.environ.get('OFFLOAD_WORKERS'),
+		max((os.cpu_count() or 2) - 1, 1)
+	)
+	OFFLOAD_MODE = os.environ.get('OFFLOAD_MODE') or 'process'
+	OFFLOAD_QUEUE_SIZE = env_to_int(os.environ.get('OFFLOAD_QUEUE_SIZE'), 32)
+
+	# Match histories with at least this many positions to replay (only ever
+	# compactly stored ones, see `MATCH_HISTORY_FORMAT`) are replayed by the
+	# worker pool. Shorter ones take less time than handing them over would.
+	MATCH_OFFLOAD_MIN_PLIES = env_to_int(
+		os.environ.get('MATCH_OFFLOAD_MIN_PLIES'), 60
+	)
\ No newline at end of file
@@ -12,6 +12,7 @@ from flask_talisman import Talisman
 
 from config import Config
 from dark_chess_api.endpoint_handler import Endpointer
+from dark_chess_api.worker_pool import WorkerPool
 
 ##############
 #  Services  #
@@ -23,19 +24,37 @@ socketio = SocketIO() # web-sockets
 talisman = Talisman() # security-defaults
 mocker = Faker() # mocking service
 endpointer = Endpointer() # endpoint validation and documentation
+worker_pool = WorkerPool() # cpu bound work off the event loop
+endpointer.metrics_source(worker_pool.prometheus_text)
 
 def create_app(config=Config):
 
 	app = Flask(__name__)
 	app.config.from_object(config)
+	# Sides in match rooms, signed tokens and the stand-in broker and cache
+	# server's connections are all signed with it, and nothing else would
+	# notice it missing until the first request that needs it.
+	if not app.config.get('SECRET_KEY'):
+		raise ValueError('SECRET_KEY must be set')
+	# A message queue means more than one worker, and a cache in each of them
+	# would go on serving responses the others had invalidated.
+	if (app.config.get('SOCKETIO_MESSAGE_QUEUE')
+		and (app.config.get('ENDPOINT_CACHE_URL') or '').startswith('memory://')):
+		raise ValueError('ENDPOINT_CACHE_URL must be shared between workers '
+			'(not memory://) when SOCKETIO_MESSAGE_QUEUE is set')
 
 	from dark_chess_api.modules.errors.handlers import error_response
 	endpointer.init_app(app, error_handler=error_response)
 
 	CORS(app, resources={'/socket.io/': {'origins': app.config['FRONTEND_ROOT']}})
 	db.init_app(app)
+	worker_pool.init_app(app)
 	migrate.init_app(app, db)
-	socketio.init_app(app, cors_allowed_origins=app.config['FRONTEND_ROOT'])
+	from dark_chess_api.modules.websockets.message_queue import client_manager
+	socketio.init_app(app,
+		cors_allowed_origins=app.config['FRONTEND_ROOT'],
+		client_manager=client_manager(app)
+	)
 	# we will enforce https upstream with nginx
 	talisman.init_app(app,
 		force_https=False
@@ -44,17 +63,23 @@ def create_app(config=Config):
 	from dark_chess_api.modules.errors import errors
 	app.register_blueprint(errors)
 
-	from dark_chess_api.modules.websockets import websockets
+	from dark_chess_api.modules.websockets import websockets, move_buffer
 	app.register_blueprint(websockets)
+	move_buffer.init_app(app)
 
-	from dark_chess_api.modules.users import users
+	from dark_chess_api.modules.users import (
+		users, token_generations, password_hasher
+	)
 	app.register_blueprint(users, url_prefix='/user')
+	token_generations.init_app(app)
+	password_hasher.init_app(app)
 
 	from dark_chess_api.modules.stats import stats
 	app.register_blueprint(stats, url_prefix='/stats')
 
-	from dark_chess_api.modules.matches import matches
+	from dark_chess_api.modules.matches import matches, move_timings
 	app.register_blueprint(matches, url_prefix='/match')
+	move_timings.init_app(app)
 
 	if not app.debug and app.config['MAIL_SERVER'] and app.config['ERROR_REPORT_EMAIL']:
 		auth = None
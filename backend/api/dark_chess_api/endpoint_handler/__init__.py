@@ -1,12 +1,26 @@
+import json
+import hashlib
+import binascii
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from functools import wraps
-from jsonschema import (
-	validate as validate_json,
-	ValidationError
-)
+from jsonschema import ValidationError
+import click
 from werkzeug.http import HTTP_STATUS_CODES
 from copy import deepcopy
 
-from flask import request, jsonify, render_template, abort, Blueprint
+from flask import (
+	request, jsonify, render_template, abort, make_response, Blueprint
+)
+
+from dark_chess_api.endpoint_handler.metrics import (
+	EndpointMetrics, MetricsCollector, prometheus_text
+)
+
+from dark_chess_api.endpoint_handler.validation import PayloadValidator
+from dark_chess_api.endpoint_handler.cache import (
+	ResponseCache, cache_backend, local_cache_address, local_cache_authkey,
+	serve_local_cache
+)
 
 # Custom middleware used to both validate and pass on payload arguments directly
 # to routes. This is it's own module a level above the app specific modules as
@@ -21,7 +35,10 @@ class Endpointer:
 		app=None,
 		documentation_root='docs',
 		error_handler=None,
-		help_keyword='help'
+		help_keyword='help',
+		page_size=20,
+		max_page_size=100,
+		generate_validators=True
 	):
 		self.app = None
 		self.endpoints = {}
@@ -29,6 +46,15 @@ class Endpointer:
 		self._error_handler = None
 		self.documentation_root = documentation_root
 		self.help_keyword = help_keyword
+		self.page_size = page_size
+		self.max_page_size = max_page_size
+		# Whether payload validators are generated as python code, as well
+		# as compiled (see `validation.py`).
+		self.generate_validators = generate_validators
+		self.cache = None
+		self._authenticators = {}
+		self.metrics = MetricsCollector()
+		self._metrics_sources = []
 
 		if app is not None:
 			self.init_app(app, error_handler)
@@ -36,8 +62,22 @@ class Endpointer:
 	def init_app(self, app, error_handler=None):
 		self.app = app
 		self._error_handler = error_handler
+		# Endpoints with a `cache` policy are only cached if the app has a
+		# backend for them (see `cache.py`).
+		cache_url = app.config.get('ENDPOINT_CACHE_URL')
+		self.cache = None
+		if cache_url:
+			authkey = b''
+			if cache_url.startswith('local://'):
+				authkey = local_cache_authkey(app.config.get('SECRET_KEY'))
+			self.cache = ResponseCache(cache_backend(cache_url,
+				size=app.config.get('ENDPOINT_CACHE_SIZE', 1024),
+				authkey=authkey
+			))
 
-		bp = Blueprint('endpoint_handler', __name__, template_folder='templates')
+		bp = Blueprint('endpoint_handler', __name__, template_folder='templates',
+			cli_group='endpoints'
+		)
 
 		# Browser based documentation pages. Request-based documentation is
 		# handled in the decorator.
@@ -59,6 +99,62 @@ class Endpointer:
 				)
 			abort(404)
 
+		# Every endpoint's metrics (see `metrics.py`) are collected unless
+		# turned off, and start over with each app.
+		if app.config.get('ENDPOINT_METRICS', True):
+			window = app.config.get('ENDPOINT_METRICS_WINDOW', 1024)
+			for resource in self.resources.values():
+				for endpoint in resource.endpoints.values():
+					endpoint.metrics.reset(window)
+			self.metrics.listen()
+
+			@app.before_request
+			def start_metrics():
+				endpoint = self.endpoints.get(request.endpoint)
+				self.metrics.start(
+					endpoint.metrics if endpoint is not None else None
+				)
+
+			@app.after_request
+			def finish_metrics(response):
+				self.metrics.finish(request, response)
+				return response
+
+			def prometheus_metrics():
+				text = prometheus_text([
+						(resource.name, endpoint)
+						for resource in self.resources.values()
+						for endpoint in resource.endpoints.values()
+					], self.cache.stats() if self.cache is not None else None)
+				text += ''.join(source() for source in self._metrics_sources)
+				return app.response_class(text,
+					mimetype='text/plain; version=0.0.4'
+				)
+			app.add_url_rule('/metrics', 'endpointer_metrics', prometheus_metrics)
+
+		# Cache hits and misses by endpoint, for this process.
+		@bp.route('/cache')
+		def cache_stats():
+			if self.cache is None:
+				return { 'enabled': False, 'endpoints': {} }
+			return { 'enabled': True, 'endpoints': self.cache.stats() }
+
+		# Serves the stand-in shared cache, by default at the address the app
+		# is configured to use.
+		@bp.cli.command('cache-server')
+		@click.option('-h', '--host', default=None)
+		@click.option('-p', '--port', default=None, type=int)
+		def cache_server(host, port):
+			default_host, default_port = local_cache_address(
+				app.config.get('ENDPOINT_CACHE_URL') or 'local://'
+			)
+			server = serve_local_cache((host or default_host, port or default_port),
+				authkey=local_cache_authkey(app.config.get('SECRET_KEY')),
+				size=app.config.get('ENDPOINT_CACHE_SIZE', 1024)
+			)
+			print(f'Cache listening at local://{server.address[0]}:{server.address[1]}')
+			server.serve_forever()
+
 		app.register_blueprint(bp, url_prefix=f'/{self.documentation_root}')
 
 	def handle_error_response(self, code, message):
@@ -66,11 +162,62 @@ class Endpointer:
 			return self._error_handler(code, message)
 		return abort(code)
 
+	# Cached responses can be served without calling the endpoint, and so
+	# without whatever decorators authenticate it. Instead, endpoints that are
+	# both cached and authenticated are authenticated by the function
+	# registered for their `auth`, which returns who's asking (for policies
+	# that vary by 'user'), or an error response.
+	def authenticator(self, auth):
+		def decorated(f):
+			self._authenticators[auth] = f
+			return f
+		return decorated
+
+	def authenticate(self, auth):
+		if auth not in self._authenticators:
+			raise ValueError(f'No authenticator for {auth}, which cached endpoints require.')
+		return self._authenticators[auth]()
+
+	# Registers a function returning more metrics (in Prometheus' text
+	# format) to be served at `/metrics` along with the endpoints'.
+	def metrics_source(self, f):
+		self._metrics_sources.append(f)
+		return f
+
+	# Drops every cached response with any of these tags.
+	def invalidate(self, *tags):
+		if self.cache is not None:
+			self.cache.invalidate(*tags)
+
+	# Reads the `limit` and `after` query string parameters of a paginated
+	# request. Returns a tuple of the page, and an error response if the
+	# parameters were invalid.
+	def parse_page(self):
+		limit = request.args.get('limit', self.page_size)
+		try:
+			limit = int(limit)
+		except ValueError:
+			return None, self.handle_error_response(400, 'Limit must be an integer.')
+		if not 1 <= limit <= self.max_page_size:
+			return None, self.handle_error_response(400,
+				f'Limit must be between 1 and {self.max_page_size}.'
+			)
+		after = request.args.get('after', None)
+		if after is not None:
+			try:
+				after = decode_cursor(after)
+			except ValueError:
+				return None, self.handle_error_response(400, 'Invalid cursor.')
+		return Page(limit, after), None
+
 	def route(self, rule, *args,
 		bp=None,
 		accepts=None,
 		optional=[],
 		responds=None,
+		paginate=None,
+		revision=None,
+		cache=None,
 		auth=None,
 		description=None,
 		**kwargs
@@ -90,46 +237,195 @@ class Endpointer:
 					raise ValueError(f'Flask-Endpointer requires routes to consist of a single method, {endpoint.__name__} was passed {kwargs["methods"]}.')
 				method = kwargs['methods'][0]
 			new_endpoint = Endpoint(rule, endpoint.__name__,
-				method=method, auth=auth, description=description
+				method=method, auth=auth, description=description,
+				revised=revision is not None, cache=cache
 			)
 			if accepts is not None:
-				new_endpoint.init_accepts(accepts, optional)
+				new_endpoint.init_accepts(accepts, optional,
+					generate=self.generate_validators
+				)
 			if responds is not None:
 				new_endpoint.init_responds(responds)
+			if paginate is not None:
+				new_endpoint.init_paginates(paginate)
 			resource.register_endpoint(new_endpoint)
+			# By the name Flask knows it by, for finding its metrics.
+			flask_name = kwargs.get('endpoint', endpoint.__name__)
+			if bp is not None:
+				flask_name = f'{bp.name}.{flask_name}'
+			self.endpoints[flask_name] = new_endpoint
 			# "Wrap" it all up
 			# Does this work?
 			wrapper = bp if bp is not None else self.app
+			# Paginated endpoints are passed the requested `page`, and return
+			# a list of results for it, which is wrapped up along with the
+			# cursor for the next page.
+			def call_endpoint(*args, **kwargs):
+				if paginate is None:
+					return endpoint(*args, **kwargs)
+				page, error = self.parse_page()
+				if error is not None:
+					return error
+				ret = endpoint(*args, page=page, **kwargs)
+				if isinstance(ret, list):
+					return { paginate: ret, 'next_cursor': page.next_cursor }
+				return ret
+			# Endpoints with a `cache` policy have their (json, successful)
+			# responses kept for `ttl` seconds, and served again to requests
+			# for the same thing. What counts as the same thing is given by
+			# `vary`: 'args' for the same arguments (the url's variables, the
+			# payload and the query string), and 'user' for the same user. A
+			# policy can also have a function for the `tags` of a response,
+			# called with the endpoint's (keyword) arguments, for invalidating
+			# it once what it was made from changes. Only GET requests are
+			# cached.
+			def call_cached(*args, **kwargs):
+				if (cache is None or self.cache is None or
+					request.method not in ('GET', 'HEAD')):
+					return call_endpoint(*args, **kwargs)
+				identity = None
+				if auth is not None:
+					identity = self.authenticate(auth)
+					if isinstance(identity, self.app.response_class):
+						return identity
+				vary = cache.get('vary', [])
+				varies = (
+					identity if 'user' in vary else None,
+					sorted(kwargs.items()) if 'args' in vary else None,
+					sorted(
+						(key, value) for key, value in request.args.items()
+						if key != self.help_keyword
+					) if 'args' in vary else None
+				)
+				tags = cache['tags'](**kwargs) if 'tags' in cache else []
+				key = self.cache.key(endpoint.__name__, varies, tags)
+				body = self.cache.get(endpoint.__name__, key)
+				if body is not None:
+					return self.app.response_class(body,
+						mimetype='application/json'
+					)
+				ret = call_endpoint(*args, **kwargs)
+				if not isinstance(ret, dict):
+					return ret
+				response = make_response(ret)
+				self.cache.set(endpoint.__name__, key, response.get_data(),
+					cache.get('ttl')
+				)
+				return response
+			# Endpoints with a `revision` are given a (weak) ETag of it, and
+			# requests that already have the current one are answered with a
+			# 304 before the endpoint runs. The revision is called with the
+			# same arguments as the endpoint, and should be whatever the
+			# response depends on (and nothing more expensive to get), e.g. the
+			# id and ply of a match, and who's asking. Since it can be called
+			# before the endpoint (and so before any decorators the endpoint
+			# has), it has to authenticate for itself, and can return a
+			# response (an auth error) to be sent instead. Returning None means
+			# there's no revision, e.g. for something that doesn't exist.
+			def current_etag(*args, **kwargs):
+				current = revision(*args, **kwargs)
+				if current is None or isinstance(current, self.app.response_class):
+					return current
+				return revision_etag(endpoint.__name__, current)
+			def call_revised(*args, **kwargs):
+				if revision is None or request.method not in ('GET', 'HEAD'):
+					return call_cached(*args, **kwargs)
+				etag = None
+				# Without a validator to compare there's no reason to get the
+				# revision first.
+				if request.if_none_match:
+					etag = current_etag(*args, **kwargs)
+					if isinstance(etag, self.app.response_class):
+						return etag
+					if etag is not None and request.if_none_match.contains_weak(etag):
+						response = self.app.response_class(status=304)
+						response.set_etag(etag, weak=True)
+						return response
+				response = make_response(call_cached(*args, **kwargs))
+				# Endpoints can set ETags of their own, which are left alone.
+				if response.status_code != 200 or response.get_etag()[0] is not None:
+					return response
+				if etag is None:
+					etag = current_etag(*args, **kwargs)
+				if isinstance(etag, str):
+					response.set_etag(etag, weak=True)
+				return response
 			@wrapper.route(rule, *args, **kwargs)
 			@wraps(endpoint)
 			def inner(*args, **kwargs):
-				if accepts is not None or responds is not None:
+				if accepts is not None or responds is not None or paginate is not None:
 					if request.args.get(self.help_keyword, None) is not None:
 						return new_endpoint.help_dict
 				if accepts is not None:
 					payload = request.get_json()
 					if payload is None:
 						if new_endpoint.payload_fully_optional:
-							return endpoint(*args, **kwargs)
+							return call_revised(*args, **kwargs)
 						return self.handle_error_response(400, 'No JSON payload.')
 					try:
 						# We don't bother to check for SchemaError, since
-						# that *should* cause the program to crash. A Schema
-						# error is caused by incorrectly formatting the
-						# schema dict, and so should be considered an
-						# application breaking bug, as the whole point of
-						# this middleware is to marry documentation and
-						# code. 
-						validate_json(payload, new_endpoint.validation_schema)
+						# that *should* cause the program to crash (and now
+						# does, when the endpoint is registered, which is
+						# when its validator is compiled). A Schema error is
+						# caused by incorrectly formatting the schema dict,
+						# and so should be considered an application
+						# breaking bug, as the whole point of this
+						# middleware is to marry documentation and code.
+						new_endpoint.validator.validate(payload)
 					except ValidationError as e:
 						return self.handle_error_response(400, e.message)
 					for key in new_endpoint.schema_base:
 						if key in payload:
 							kwargs[key] = payload[key]
-				return endpoint(*args, **kwargs)
+				return call_revised(*args, **kwargs)
 			return inner
 		return decorated
 
+# Revisions can be anything with a stable repr, which is hashed along with the
+# endpoint's name, so that different endpoints with the same revision (say, the
+# id of a match) have different ETags.
+def revision_etag(name, revision):
+	return hashlib.sha1(
+		f'{name}:{revision!r}'.encode('utf-8')
+	).hexdigest()
+
+# Cursors are opaque to clients, they're just the json encoded key of the last
+# result of a page. Every key paginated by is an integer id, so anything else
+# is turned away here rather than by the database.
+def encode_cursor(key):
+	return urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor):
+	try:
+		key = json.loads(urlsafe_b64decode(cursor.encode('utf-8')))
+	except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+		raise ValueError(f'Invalid cursor: {cursor}') from e
+	if type(key) is not int:
+		raise ValueError(f'Invalid cursor: {cursor}')
+	return key
+
+# Keyset pagination. Rather than counting through an offset, each page picks up
+# after the last key of the previous page, so that deep pages are as cheap as
+# the first and results aren't skipped or repeated when rows are added.
+class Page:
+
+	def __init__(self, limit, after=None):
+		self.limit = limit
+		self.after = after
+		self.next_cursor = None
+
+	# `key` must be a unique (and ideally indexed) column that `query` can be
+	# ordered by.
+	def paginate(self, query, key):
+		if self.after is not None:
+			query = query.filter(key > self.after)
+		# One extra result is fetched to find out if there's another page.
+		results = query.order_by(key).limit(self.limit + 1).all()
+		if len(results) > self.limit:
+			results = results[:self.limit]
+			self.next_cursor = encode_cursor(getattr(results[-1], key.key))
+		return results
+
 class Resource:
 
 	def __init__(self, name, error_handler=None):
@@ -164,7 +460,9 @@ class Endpoint:
 		optional=[],
 		method='GET',
 		auth=None,
-		description=None
+		description=None,
+		revised=False,
+		cache=None
 	):
 		self.rule = rule
 		self._function_name = function_name
@@ -176,12 +474,20 @@ class Endpoint:
 		# route can respond with 200?
 		self.responses = { 200: { 'message': '[Successful response]' } }
 		self.accepts = False
+		self.paginates = None
+		self.revised = revised
+		self.cache = cache
+		self.metrics = EndpointMetrics()
+		if revised:
+			self.responses[304] = {
+				'message': '[Empty, the `If-None-Match` ETag is still current]'
+			}
 		if responses is not None:
 			self.init_responds(responses)
 		if acceptance_schema is not None:
 			self.init_accepts(acceptance_schema)
 
-	def init_accepts(self, acceptance_schema, optional):
+	def init_accepts(self, acceptance_schema, optional, generate=True):
 		self.accepts = True
 		self.schema_base = acceptance_schema
 		self.optional = optional
@@ -196,6 +502,9 @@ class Endpoint:
 			'properties': deepcopy(self.schema_base),
 			'required': self.required
 		}
+		self.validator = PayloadValidator(self.validation_schema,
+			generate=generate
+		)
 		# If there's an acceptance schema than it's basically (but I guess not
 		# fully) guaranteed to potentially return a 400. If a user provides a
 		# custom response for 400 in the `responds` dict, that will overwrite
@@ -220,6 +529,17 @@ class Endpoint:
 						code, 'Unknown error'
 					)
 
+	def init_paginates(self, key):
+		self.paginates = key
+		self.responses[200] = {
+			key: self.responses[200],
+			'next_cursor': '[Cursor for the next page, or null if this is the last]'
+		}
+		self.responses[400] = {
+			'error': 'Bad Request',
+			'message': '[Validation error content]'
+		}
+
 	@property
 	def payload_fully_optional(self):
 		return len(self.required) == 0
@@ -237,10 +557,13 @@ class Endpoint:
 
 	@property
 	def help_dict(self):
-		return {
-			'payload': self.reference_schema,
+		ret = {
+			'payload': self.reference_schema if self.accepts else None,
 			'responses': self.responses
 		}
+		if self.paginates is not None:
+			ret['pagination'] = PAGINATION_PARAMETERS
+		return ret
 
 	def as_dict(self):
 		ret = {
@@ -251,11 +574,31 @@ class Endpoint:
 			'responses': self.responses,
 			'accepts': self.accepts,
 			'auth': self.auth,
-			'description': self.description
+			'description': self.description,
+			'paginates': self.paginates,
+			'revised': self.revised,
+			'cache': {
+				'ttl': self.cache.get('ttl'),
+				'vary': self.cache.get('vary', [])
+			} if self.cache is not None else None,
+			'metrics': self.metrics.as_dict()
 		}
 		if self.accepts:
 			ret.update({
 				'schema_base': self.schema_base,
 				'reference_schema': self.reference_schema
 			})
-		return ret
\ No newline at end of file
+		if self.paginates is not None:
+			ret['pagination'] = PAGINATION_PARAMETERS
+		return ret
+
+PAGINATION_PARAMETERS = {
+	'limit': {
+		'type': 'integer',
+		'description': 'The maximum number of results to return.'
+	},
+	'after': {
+		'type': 'string',
+		'description': 'The `next_cursor` of the previous page.'
+	}
+}
\ No newline at end of file
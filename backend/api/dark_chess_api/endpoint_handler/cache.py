@@ -0,0 +1,172 @@
+import time
+import uuid
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from multiprocessing.managers import BaseManager
+
+# Response caching for endpoints that declare a `cache` policy (see
+# `Endpointer.route`). Whatever an endpoint responds with is kept (as the
+# serialized body) under a key made from the endpoint's name, what the policy
+# varies on, and the current generation of each of the policy's tags.
+# Invalidating a tag just gives it a new generation, so nothing kept under the
+# old one is looked up again, and is left for the backend to evict. This means
+# backends only have to get and set, and a tag whose generation was evicted
+# is simply given a new one.
+
+# Backends keep values for `ttl` seconds after they're set (if they're given
+# one), or, once there are more than `size` of them, until they're the least
+# recently used.
+class LocalCache:
+
+	def __init__(self, size=1024):
+		self.size = size
+		self._values = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			entry = self._values.get(key)
+			if entry is None:
+				return None
+			expires, value = entry
+			if expires is not None and expires < time.monotonic():
+				del self._values[key]
+				return None
+			self._values.move_to_end(key)
+			return value
+
+	def get_many(self, keys):
+		return [self.get(key) for key in keys]
+
+	def set(self, key, value, ttl=None):
+		expires = time.monotonic() + ttl if ttl is not None else None
+		with self._lock:
+			self._values[key] = (expires, value)
+			self._values.move_to_end(key)
+			while len(self._values) > self.size:
+				self._values.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._values.clear()
+
+	def __len__(self):
+		return len(self._values)
+
+# Redis, for sharing a cache between processes (and machines), which needs the
+# redis package.
+class RedisCache:
+
+	def __init__(self, url, prefix='endpointer:'):
+		import redis
+		self._redis = redis.Redis.from_url(url)
+		self.prefix = prefix
+
+	def get(self, key):
+		return self.get_many([key])[0]
+
+	def get_many(self, keys):
+		values = self._redis.mget([self.prefix + key for key in keys])
+		return [pickle.loads(v) if v is not None else None for v in values]
+
+	def set(self, key, value, ttl=None):
+		self._redis.set(self.prefix + key, pickle.dumps(value),
+			ex=int(ttl) if ttl is not None else None
+		)
+
+	def clear(self):
+		for key in self._redis.scan_iter(self.prefix + '*'):
+			self._redis.delete(key)
+
+# A stand-in for a shared cache, for a handful of workers on one machine, or in
+# tests. A `LocalCache` is served from one process (see `serve_local_cache`),
+# and every other process talks to it through a proxy, authenticated with
+# `authkey`. Requests are unpickled, so an empty key (which anyone could
+# authenticate with) is refused. Every call is a round trip, so it's no
+# replacement for redis in production.
+class CacheManager(BaseManager):
+	pass
+
+CacheManager.register('cache')
+
+def local_cache_address(url):
+	url = urlparse(url)
+	return (url.hostname or '127.0.0.1', url.port or 6381)
+
+# The stand-in's authkey, from the app's secret key, which it can't do without.
+def local_cache_authkey(secret_key):
+	if not secret_key:
+		raise ValueError('SECRET_KEY must be set to use a local:// cache')
+	return secret_key.encode()
+
+def serve_local_cache(address, authkey=b'', size=1024):
+	if not authkey:
+		raise ValueError('The local cache needs an authkey')
+	cache = LocalCache(size)
+	manager = CacheManager(address, authkey=authkey)
+	manager.register('cache', callable=lambda: cache)
+	return manager.get_server()
+
+def connect_local_cache(address, authkey=b''):
+	if not authkey:
+		raise ValueError('The local cache needs an authkey')
+	manager = CacheManager(address, authkey=authkey)
+	manager.connect()
+	return manager.cache()
+
+# `memory://` for a cache for this process alone, `local://host:port` for the
+# stand-in, or a redis url.
+def cache_backend(url, size=1024, authkey=b''):
+	if url.startswith('memory://'):
+		return LocalCache(size)
+	if url.startswith('local://'):
+		return connect_local_cache(local_cache_address(url), authkey)
+	if url.startswith(('redis://', 'rediss://')):
+		return RedisCache(url)
+	raise ValueError(f'Unknown cache backend: {url}')
+
+class ResponseCache:
+
+	def __init__(self, backend):
+		self.backend = backend
+		self._counts = {}
+		self._lock = threading.Lock()
+
+	def _generations(self, tags):
+		keys = [f'tag:{tag}' for tag in tags]
+		generations = self.backend.get_many(keys) if keys else []
+		for i, generation in enumerate(generations):
+			if generation is None:
+				generations[i] = uuid.uuid4().hex
+				self.backend.set(keys[i], generations[i])
+		return generations
+
+	def key(self, name, varies, tags):
+		return 'response:' + hashlib.sha1(
+			repr((name, varies, self._generations(tags))).encode('utf-8')
+		).hexdigest()
+
+	def get(self, name, key):
+		body = self.backend.get(key)
+		self._count(name, 'hits' if body is not None else 'misses')
+		return body
+
+	def set(self, name, key, body, ttl):
+		self.backend.set(key, body, ttl)
+
+	def invalidate(self, *tags):
+		for tag in tags:
+			self.backend.set(f'tag:{tag}', uuid.uuid4().hex)
+
+	def _count(self, name, outcome):
+		with self._lock:
+			counts = self._counts.setdefault(name, { 'hits': 0, 'misses': 0 })
+			counts[outcome] += 1
+
+	# Hits and misses by endpoint, for this process.
+	def stats(self):
+		with self._lock:
+			return { name: dict(counts) for name, counts in self._counts.items() }
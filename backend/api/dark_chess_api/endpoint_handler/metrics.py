@@ -0,0 +1,186 @@
+import time
+import threading
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Request metrics for each endpoint: counts by status, latency, the number of
+# SQL statements run and the time spent on them, and the size of payloads and
+# responses. Everything's kept in memory, per process, as running totals along
+# with the latencies of the last `window` requests (which the quantiles are
+# taken from), so recording a request costs a handful of additions and an
+# append.
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class EndpointMetrics:
+
+	def __init__(self, window=1024):
+		self._lock = threading.Lock()
+		self.reset(window)
+
+	def reset(self, window=None):
+		with self._lock:
+			window = window or self.durations.maxlen
+			self.statuses = {}
+			self.durations = deque(maxlen=window)
+			self.count = 0
+			self.duration_seconds = 0.0
+			self.sql_statements = 0
+			self.sql_seconds = 0.0
+			self.request_bytes = 0
+			self.response_bytes = 0
+
+	def record(self, status, duration, sql_statements, sql_seconds,
+		request_bytes, response_bytes):
+		with self._lock:
+			self.statuses[status] = self.statuses.get(status, 0) + 1
+			self.durations.append(duration)
+			self.count += 1
+			self.duration_seconds += duration
+			self.sql_statements += sql_statements
+			self.sql_seconds += sql_seconds
+			self.request_bytes += request_bytes
+			self.response_bytes += response_bytes
+
+	# Latency quantiles (in seconds) of the most recent requests, None before
+	# there have been any.
+	def quantiles(self):
+		with self._lock:
+			durations = sorted(self.durations)
+		if not durations:
+			return { q: None for q in QUANTILES }
+		return {
+			q: durations[min(int(q * len(durations)), len(durations) - 1)]
+			for q in QUANTILES
+		}
+
+	def as_dict(self):
+		quantiles = self.quantiles()
+		count = self.count or 1
+		return {
+			'count': self.count,
+			'statuses': dict(self.statuses),
+			'p50_ms': ms(quantiles[0.5]),
+			'p95_ms': ms(quantiles[0.95]),
+			'p99_ms': ms(quantiles[0.99]),
+			'sql_statements': self.sql_statements / count,
+			'sql_ms': self.sql_seconds * 1e3 / count,
+			'request_bytes': self.request_bytes / count,
+			'response_bytes': self.response_bytes / count
+		}
+
+def ms(seconds):
+	return seconds * 1e3 if seconds is not None else None
+
+# What's been counted for the request being handled by each thread (or green
+# thread, under eventlet).
+class RequestTally:
+
+	def __init__(self, metrics):
+		self.metrics = metrics
+		self.start = time.perf_counter()
+		self.sql_statements = 0
+		self.sql_seconds = 0.0
+		self.sql_start = None
+
+class MetricsCollector:
+
+	def __init__(self):
+		self._local = threading.local()
+		self._listening = False
+
+	# Statements are counted for every engine, and put down to whichever
+	# request the thread running them is handling, if any.
+	def listen(self):
+		if self._listening:
+			return
+		event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+		event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+		self._listening = True
+
+	def _before_cursor_execute(self, *args):
+		tally = getattr(self._local, 'tally', None)
+		if tally is not None:
+			tally.sql_start = time.perf_counter()
+
+	def _after_cursor_execute(self, *args):
+		tally = getattr(self._local, 'tally', None)
+		if tally is not None and tally.sql_start is not None:
+			tally.sql_statements += 1
+			tally.sql_seconds += time.perf_counter() - tally.sql_start
+			tally.sql_start = None
+
+	# How long the request this thread is handling has been going, or None.
+	def elapsed(self):
+		tally = getattr(self._local, 'tally', None)
+		return time.perf_counter() - tally.start if tally is not None else None
+
+	def start(self, metrics):
+		self._local.tally = RequestTally(metrics) if metrics is not None else None
+
+	def finish(self, request, response):
+		tally = getattr(self._local, 'tally', None)
+		self._local.tally = None
+		if tally is None:
+			return
+		tally.metrics.record(response.status_code,
+			time.perf_counter() - tally.start,
+			tally.sql_statements,
+			tally.sql_seconds,
+			request.content_length or 0,
+			response.calculate_content_length() or 0
+		)
+
+# Prometheus' text format, for `/metrics`. Latencies are a summary of the
+# recent requests, everything else counters. `endpoints` are pairs of resource
+# names and endpoints.
+def prometheus_text(endpoints, cache_stats=None):
+	lines = []
+	def metric(name, kind, description):
+		lines.extend([f'# HELP {name} {description}', f'# TYPE {name} {kind}'])
+	def labels(**values):
+		return '{' + ','.join(
+			f'{key}="{escape(value)}"' for key, value in values.items()
+		) + '}'
+	endpoints = [
+		(labels(resource=resource, endpoint=endpoint.name), endpoint.metrics)
+		for resource, endpoint in endpoints
+	]
+	metric('endpointer_requests_total', 'counter',
+		'Requests handled, by endpoint and status.')
+	for endpoint_labels, metrics in endpoints:
+		for status, count in sorted(metrics.statuses.items()):
+			status_labels = endpoint_labels[:-1] + f',status="{status}"}}'
+			lines.append(f'endpointer_requests_total{status_labels} {count}')
+	name = 'endpointer_request_duration_seconds'
+	metric(name, 'summary', 'Request latency, by endpoint.')
+	for endpoint_labels, metrics in endpoints:
+		for q, value in metrics.quantiles().items():
+			if value is not None:
+				quantile_labels = endpoint_labels[:-1] + f',quantile="{q}"}}'
+				lines.append(f'{name}{quantile_labels} {value}')
+		lines.append(f'{name}_sum{endpoint_labels} {metrics.duration_seconds}')
+		lines.append(f'{name}_count{endpoint_labels} {metrics.count}')
+	totals = [
+		('sql_statements', 'SQL statements run'),
+		('sql_seconds', 'Time spent running SQL statements'),
+		('request_bytes', 'Request payload bytes'),
+		('response_bytes', 'Response body bytes')
+	]
+	for attribute, description in totals:
+		name = f'endpointer_{attribute}_total'
+		metric(name, 'counter', f'{description}, by endpoint.')
+		for endpoint_labels, metrics in endpoints:
+			lines.append(f'{name}{endpoint_labels} {getattr(metrics, attribute)}')
+	if cache_stats is not None:
+		for outcome in ['hits', 'misses']:
+			name = f'endpointer_cache_{outcome}_total'
+			metric(name, 'counter', f'Response cache {outcome}, by endpoint.')
+			for endpoint, counts in sorted(cache_stats.items()):
+				lines.append(f'{name}{labels(endpoint=endpoint)} {counts[outcome]}')
+	return '\n'.join(lines) + '\n'
+
+def escape(value):
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,110 @@
+import re
+from jsonschema import validators
+from jsonschema.exceptions import best_match
+
+# Payload validation, compiled once per endpoint rather than on every request
+# (which is what `jsonschema.validate` does, finding the validator class and
+# checking the schema itself each time).
+#
+# Schemas simple enough (flat objects of typed properties, which covers every
+# endpoint so far) also get a validator generated as python code, in the style
+# of fastjsonschema. It's only ever trusted to accept a payload. Anything it
+# turns down is validated again by jsonschema, so that errors (and their
+# messages) are exactly what they'd otherwise be, and anything it can't be
+# sure of is left to jsonschema as well.
+
+TYPE_CHECKS = {
+	'string': 'isinstance({}, str)',
+	'integer': '(isinstance({0}, int) and not isinstance({0}, bool))',
+	'number': '(isinstance({0}, (int, float)) and not isinstance({0}, bool))',
+	'boolean': 'isinstance({}, bool)',
+	'object': 'isinstance({}, dict)',
+	'array': 'isinstance({}, list)',
+	'null': '{} is None'
+}
+
+# Keywords that don't affect validation (formats are only checked when asked
+# for, and they aren't).
+IGNORED_KEYWORDS = { 'description', 'title', 'format' }
+
+class PayloadValidator:
+
+	def __init__(self, schema, generate=True):
+		cls = validators.validator_for(schema)
+		cls.check_schema(schema)
+		self.schema = schema
+		self._validator = cls(schema)
+		self.source, patterns = generate_source(schema) if generate else (None, {})
+		self._accepts = None
+		if self.source is not None:
+			namespace = dict(patterns)
+			exec(compile(self.source, '<payload validator>', 'exec'), namespace)
+			self._accepts = namespace['accepts']
+
+	# Raises the same `ValidationError` as `jsonschema.validate` would.
+	def validate(self, payload):
+		if self._accepts is not None and self._accepts(payload):
+			return
+		error = best_match(self._validator.iter_errors(payload))
+		if error is not None:
+			raise error
+
+# The source of an `accepts(payload)` function for `schema`, and the compiled
+# patterns it uses, or None if the schema has anything the generator doesn't
+# understand.
+def generate_source(schema):
+	if set(schema) - { 'type', 'properties', 'required' } - IGNORED_KEYWORDS:
+		return None, {}
+	if schema.get('type') != 'object':
+		return None, {}
+	patterns = {}
+	lines = [
+		'def accepts(payload):',
+		'	if not isinstance(payload, dict):',
+		'		return False'
+	]
+	for key in schema.get('required', []):
+		lines += [
+			f'	if {key!r} not in payload:',
+			'		return False'
+		]
+	for i, (key, subschema) in enumerate(schema.get('properties', {}).items()):
+		checks = property_checks(subschema, f'value_{i}', patterns)
+		if checks is None:
+			return None, {}
+		if not checks:
+			continue
+		lines += [
+			f'	if {key!r} in payload:',
+			f'		value_{i} = payload[{key!r}]'
+		]
+		for check in checks:
+			lines += [
+				f'		if not {check}:',
+				'			return False'
+			]
+	lines.append('	return True')
+	return '\n'.join(lines) + '\n', patterns
+
+def property_checks(schema, name, patterns):
+	checks = []
+	for keyword, value in schema.items():
+		if keyword in IGNORED_KEYWORDS:
+			continue
+		if keyword == 'type':
+			types = value if isinstance(value, list) else [value]
+			if any(t not in TYPE_CHECKS for t in types):
+				return None
+			checks.append('(' + ' or '.join(
+				TYPE_CHECKS[t].format(name) for t in types
+			) + ')')
+		elif keyword == 'pattern':
+			# Like jsonschema, patterns only apply to strings, and match
+			# anywhere in them.
+			pattern = f'pattern_{len(patterns)}'
+			patterns[pattern] = re.compile(value)
+			checks.append(f'(not isinstance({name}, str) or '
+				f'{pattern}.search({name}) is not None)')
+		else:
+			return None
+	return checks
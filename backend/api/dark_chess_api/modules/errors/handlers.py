@@ -3,6 +3,7 @@
 
 from flask import jsonify, request
 from dark_chess_api import db
+from dark_chess_api.worker_pool import WorkerPoolFull
 from dark_chess_api.modules.errors import errors
 from werkzeug.http import HTTP_STATUS_CODES
 
@@ -35,4 +36,11 @@ def unauthorized_error(error):
 
 @errors.app_errorhandler(400)
 def unauthorized_error(error):
-	return error_response(400)
\ No newline at end of file
+	return error_response(400)
+
+# Too much CPU bound work already waiting for the worker pool.
+@errors.app_errorhandler(WorkerPoolFull)
+def worker_pool_full_error(error):
+	response = error_response(503, 'Too busy, try again shortly')
+	response.headers['Retry-After'] = '1'
+	return response
\ No newline at end of file
@@ -1,7 +1,11 @@
+import click
 from flask import Blueprint
+from dark_chess_api.modules.matches.timing import MoveTimings
 
 matches = Blueprint('matches', __name__)
 
+move_timings = MoveTimings() # phase timings of recent moves
+
 # cli commands
 
 # Creates a list of mock matches. For now these are all open matches, but in
@@ -18,4 +22,94 @@ def mock():
 		db.session.flush()
 	db.session.commit()
 
+# Renders the stored dark fens for match states created before they were
+# persisted. States are walked in id order and committed in batches, so the
+# command can be safely interrupted and rerun.
+@matches.cli.command()
+@click.option('-b', '--batch-size', default=500, help='Number of states rendered per commit.')
+@click.option('-s', '--silent', is_flag=True)
+def backfill(batch_size, silent):
+	from sqlalchemy import or_
+	from dark_chess_api import db
+	from dark_chess_api.modules.matches.models import MatchState
+	last_id = 0
+	rendered = 0
+	while True:
+		states = MatchState.query.filter(
+			MatchState.id > last_id,
+			MatchState.fen != None,
+			or_(
+				MatchState.white_dark_fen == None,
+				MatchState.black_dark_fen == None,
+				MatchState.expanded_fen == None
+			)
+		).order_by(MatchState.id).limit(batch_size).all()
+		if len(states) == 0:
+			break
+		for state in states:
+			state.render()
+		db.session.commit()
+		last_id = states[-1].id
+		rendered += len(states)
+		if not silent:
+			print(f'Rendered {rendered} match states.')
+
+# Converts the histories of existing matches to the compact format (see
+# `MATCH_HISTORY_FORMAT`), keeping a fen every `MATCH_CHECKPOINT_INTERVAL`
+# plies. Matches are walked in id order and committed in batches, and
+# compacting a match twice does no harm, so this can be safely interrupted and
+# rerun.
+@matches.cli.command()
+@click.option('-b', '--batch-size', default=50, help='Number of matches compacted per commit.')
+@click.option('-s', '--silent', is_flag=True)
+def compact(batch_size, silent):
+	from flask import current_app
+	from dark_chess_api import db
+	from dark_chess_api.modules.matches.models import Match
+	interval = current_app.config['MATCH_CHECKPOINT_INTERVAL']
+	last_id = 0
+	compacted = 0
+	while True:
+		batch = Match.query.filter(
+			Match.id > last_id
+		).order_by(Match.id).limit(batch_size).all()
+		if len(batch) == 0:
+			break
+		for match in batch:
+			match.compact(interval)
+		db.session.commit()
+		last_id = batch[-1].id
+		compacted += len(batch)
+		if not silent:
+			print(f'Compacted {compacted} matches.')
+
+# Renders the views of finished matches that don't have them yet (see
+# `FinishedMatchView`), which would otherwise be rendered the first time each
+# match is viewed. Like the above, this can be safely interrupted and rerun.
+@matches.cli.command('render-finished')
+@click.option('-b', '--batch-size', default=50, help='Number of matches rendered per commit.')
+@click.option('-s', '--silent', is_flag=True)
+def render_finished(batch_size, silent):
+	from dark_chess_api import db
+	from dark_chess_api.modules.matches.models import Match, FinishedMatchView
+	last_id = 0
+	rendered = 0
+	while True:
+		batch = Match.query.filter(
+			Match.id > last_id,
+			Match.is_finished == True,
+			~db.session.query(FinishedMatchView).filter(
+				FinishedMatchView.match_id == Match.id
+			).exists()
+		).order_by(Match.id).limit(batch_size).all()
+		if len(batch) == 0:
+			break
+		for match in batch:
+			match.render_finished_views()
+		db.session.commit()
+		last_id = batch[-1].id
+		rendered += len(batch)
+		if not silent:
+			print(f'Rendered {rendered} finished matches.')
+
 from dark_chess_api.modules.matches import models, endpoints
\ No newline at end of file
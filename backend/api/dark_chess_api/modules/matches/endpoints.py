@@ -1,15 +1,24 @@
-from flask import jsonify, g, request
+from flask import jsonify, g, request, current_app
 from sqlalchemy import or_
 
 from dark_chess_api import db, endpointer
-from dark_chess_api.modules.matches import matches
+from dark_chess_api.worker_pool import WorkerPoolFull
+from dark_chess_api.modules.matches import matches, move_timings
+from dark_chess_api.modules.matches.timing import MoveTiming
 from dark_chess_api.modules.matches.models import Match, MatchInvite
 from dark_chess_api.modules.users.auth import token_auth
 from dark_chess_api.modules.errors.handlers import error_response
 from dark_chess_api.modules.websockets import events as ws_events
+from dark_chess_api.modules.websockets.connection_handler import side_token
 
 ### Query ###
 
+# Filtering with e.g. `Match.open == True` compiles to something like
+# `(player_white_id IS NULL OR player_black_id IS NULL) = 1`, which the database
+# won't use an index for, so the expression (or its negation) is used as is.
+def where(expression, value):
+	return expression if value else ~expression
+
 # Convenience endpoints
 
 # Previously you could just get any match you wanted, but obviously this allows
@@ -33,26 +42,70 @@ from dark_chess_api.modules.websockets import events as ws_events
 # 		return match.as_dict('black')
 # 	return error_response(403, 'You are not currently playing this match.')
 
+# Everything `get_match` depends on, from the match row alone.
+@token_auth.login_required
+def match_revision(id):
+	match = db.session.query(Match.player_white_id, Match.player_black_id,
+		Match.ply_count, Match.is_finished
+	).filter(Match.id==id).first()
+	if match is None:
+		return None
+	side = 'spectating'
+	if g.current_user_id == match.player_white_id:
+		side = 'white'
+	elif g.current_user_id == match.player_black_id:
+		side = 'black'
+	return (id, match.player_white_id, match.player_black_id, match.ply_count,
+		match.is_finished, side)
+
 @endpointer.route('/<int:id>', methods=['GET'], bp=matches,
 	responds={
 		200: { 'match': Match.mock_dict(game_state='finished') },
 		404: None
 	},
+	revision=match_revision,
+	cache={
+		'ttl': 30,
+		'vary': ['user', 'args'],
+		'tags': lambda id: [Match.cache_tag(id)]
+	},
 	auth='token (bearer)',
 	description=(
 		'Get details for a given match. The exact data returned can vary in '
 		'shape considerably depending on the state of the game, and who is '
-		'requesting the data.'
+		'requesting the data. Players of matches in progress are also given a '
+		'`side_token`, which their websocket connection presents to receive '
+		'their side\'s moves. Matches in progress have a weak `ETag`, which '
+		'changes with every move. Finished matches never change, and are '
+		'served with a strong `ETag` and cached indefinitely.'
 	)
 )
 @token_auth.login_required
 def get_match(id):
-	match = Match.query.get_or_404(id)
-	if g.current_user.id == match.player_white_id:
-		return match.as_dict(side='white')
-	elif g.current_user.id == match.player_black_id:
-		return match.as_dict(side='black')
-	return match.as_dict(side='spectating')
+	match = Match.query.options(*Match.as_dict_options()).get_or_404(id)
+	side = 'spectating'
+	if g.current_user_id == match.player_white_id:
+		side = 'white'
+	elif g.current_user_id == match.player_black_id:
+		side = 'black'
+	if match.is_finished:
+		return finished_match_response(match.finished_view(side))
+	ret = match.as_dict(side=side)
+	if side != 'spectating':
+		# Lets the player's websocket connection join their side's room.
+		ret['side_token'] = side_token(match, side, g.current_user_id)
+	return ret
+
+# Finished matches are served as they were rendered when they finished. They
+# can be cached for as long as anyone likes, but only privately, since what's in
+# them depends on who's asking.
+def finished_match_response(view):
+	response = current_app.response_class(view.body,
+		mimetype='application/json'
+	)
+	response.set_etag(view.etag)
+	response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+	return response.make_conditional(request)
 
 # Master query endpoint
 
@@ -65,19 +118,31 @@ def get_match(id):
 	accepts={
 		'user_id': { 'type': 'integer' },
 		'in_progress': { 'type': 'boolean' },
-		'is_open': { 'type' : 'boolean', 'description': 'Whether or not the match can be joined' }
+		'is_open': { 'type' : 'boolean', 'description': 'Whether or not the match can be joined' },
+		'my_turn': { 'type': 'boolean', 'description': 'Whether or not it\'s the requesting user\'s turn (false meaning it\'s someone else\'s)' }
+	},
+	optional=['user_id', 'in_progress', 'is_open', 'my_turn'],
+	responds={
+		200: ['...', Match.mock_summary_dict(), '...']
 	},
-	optional=['user_id', 'in_progress', 'is_open'],
-	responds={ 200: '[An array of matches]' },
+	paginate='matches',
 	auth='token (bearer)',
-	description='Query a list of matches'
+	description=(
+		'Query a list of matches. Matches are returned as summaries, for the '
+		'full details of a match see `/match/<id>`.'
+	)
 )
 @token_auth.login_required
-def query_matches(user_id=None, in_progress=None, is_open=None):
+def query_matches(page, user_id=None, in_progress=None, is_open=None, my_turn=None):
 	# maybe this should result in different behavior?
-	if (user_id is None and in_progress is None and is_open is None):
-		return jsonify([])
-	matches = db.session.query(Match)
+	if (
+		user_id is None and
+		in_progress is None and
+		is_open is None and
+		my_turn is None
+	):
+		return []
+	matches = Match.summary_query()
 	if user_id is not None:
 		matches = matches.filter(
 			or_(
@@ -86,12 +151,14 @@ def query_matches(user_id=None, in_progress=None, is_open=None):
 			)
 		)
 	if in_progress is not None:
+		matches = matches.filter(where(Match.in_progress, in_progress))
+	if is_open is not None:
+		matches = matches.filter(where(Match.open, is_open))
+	if my_turn is not None:
 		matches = matches.filter(
-			Match.in_progress==in_progress
+			where(Match.current_player_id==g.current_user_id, my_turn)
 		)
-	if is_open is not None:
-		matches = matches.filter(Match.open==is_open)
-	return jsonify([m.as_dict() for m in matches.all()])
+	return [Match.summary_as_dict(m) for m in page.paginate(matches, Match.id)]
 
 ###  Match Invites  ###
 
@@ -104,12 +171,16 @@ def query_matches(user_id=None, in_progress=None, is_open=None):
 		'is_open': { 'type' : 'boolean', 'description': 'Whether or not the invite can be accepted by anyone.' }
 	},
 	optional=['inviter_id', 'invited_id', 'involved_id', 'accepted', 'is_open'],
-	responds={ 200: '[An array of match invites]' },
+	responds={
+		200: ['...', MatchInvite.mock_dict(), '...']
+	},
+	paginate='match_invites',
 	auth='token (bearer)',
 	description='Query a list of match invites.'
 )
 @token_auth.login_required
 def query_match_invites(
+	page,
 	inviter_id=None,
 	invited_id=None,
 	involved_id=None,
@@ -124,8 +195,10 @@ def query_match_invites(
 		accepted is None and 
 		is_open is None
 	):
-		return jsonify([])
-	invites = db.session.query(MatchInvite)
+		return []
+	invites = db.session.query(MatchInvite).options(
+		*MatchInvite.as_dict_options()
+	)
 	if inviter_id is not None:
 		invites = invites.filter(MatchInvite.inviter_id==inviter_id)
 	if invited_id is not None:
@@ -138,10 +211,10 @@ def query_match_invites(
 			)
 		)
 	if accepted is not None:
-		invites = invites.filter(MatchInvite.accepted==accepted)
+		invites = invites.filter(where(MatchInvite.accepted, accepted))
 	if is_open is not None:
-		invites = invites.filter(MatchInvite.open==is_open)
-	return jsonify([i.as_dict() for i in invites.all()])
+		invites = invites.filter(where(MatchInvite.open, is_open))
+	return [i.as_dict() for i in page.paginate(invites, MatchInvite.id)]
 
 # TODO: Test
 @endpointer.route('/invite/create', methods=['POST'], bp=matches,
@@ -172,13 +245,13 @@ def create_match_invite(invited_id=None):
 		extant_invite = MatchInvite.query.filter(
 			MatchInvite.inviter_id==inviter.id,
 			MatchInvite.invited_id==invited_id,
-			MatchInvite.accepted==False
+			~MatchInvite.accepted
 		).first()
 	else:
 		extant_invite = MatchInvite.query.filter(
 			MatchInvite.inviter_id==inviter.id,
-			MatchInvite.open==True,
-			MatchInvite.accepted==False
+			MatchInvite.open,
+			~MatchInvite.accepted
 		).first()
 	match_invite = None
 	if extant_invite is not None:
@@ -209,7 +282,7 @@ def create_match_invite(invited_id=None):
 @token_auth.login_required
 def accept_match_invite(id):
 	invite = MatchInvite.query.get_or_404(id)
-	if invite.inviter_id == g.current_user.id:
+	if invite.inviter_id == g.current_user_id:
 		return error_response(400, 'Player cannot accept own invite')
 	if invite.accepted:
 		return error_response(410, 'Match invite has already been accepted')
@@ -267,12 +340,100 @@ def accept_match_invite(id):
 
 ### In Game Actions ###
 
+UCI_PATTERN = '^[a-h][1-8][a-h][1-8][r|n|b|q]?$'
+
+# Moves can be made through the api or over the match's websocket, and both go
+# through here. Returns None if the move was made, or otherwise the status and
+# message to refuse it with.
+# Each phase of it is timed into `timing` (see `timing.py`).
+def play_move(match, player, uci_string, timing):
+	with timing.phase('playing', 'chess'):
+		playing = match.playing(player)
+	if not playing:
+		return 403, 'Player not playing this match'
+	with timing.phase('players_turn', 'chess'):
+		players_turn = match.players_turn(player)
+	if not players_turn:
+		return 409, 'Not your turn'
+	with timing.phase('attempt_move', 'chess'):
+		moved = match.attempt_move(player, uci_string)
+	if not moved:
+		return 422, 'Move not possible'
+	with timing.phase('commit', 'db'):
+		db.session.commit()
+		match.invalidate_cached()
+	with timing.phase('broadcast_move_made', 'emit'):
+		ws_events.broadcast_move_made(
+			match=match,
+			player=player,
+			move=uci_string
+		)
+	if match.is_finished:
+		# Should this be handled by the match?
+		# match.update_stats()
+		with timing.phase('stats', 'stats'):
+			match.player_white.stat_block.add_match(match)
+			match.player_black.stat_block.add_match(match)
+		with timing.phase('render_finished_views', 'serialization'):
+			try:
+				match.render_finished_views()
+			except WorkerPoolFull:
+				# They're rendered when they're first asked for instead.
+				pass
+		with timing.phase('commit_finish', 'db'):
+			db.session.commit()
+			match.player_white.invalidate_cached()
+			match.player_black.invalidate_cached()
+		with timing.phase('broadcast_match_finish', 'emit'):
+			ws_events.broadcast_match_finish(
+				winning_player=player,
+				connection_token=match.connection_token
+			)
+	return None
+
+@endpointer.route('/move-timings', methods=['GET'], bp=matches,
+	responds={
+		200: {
+			'slow_move_ms': 250,
+			'phases': {
+				'attempt_move': {
+					'kind': 'chess', 'count': 256, 'p50_ms': 1.2, 'p95_ms': 4.5
+				}
+			},
+			'moves': [{
+				'match_id': 1,
+				'uci_string': 'e2e4',
+				'via': 'api',
+				'status': 200,
+				'total_ms': 12.5,
+				'by_kind_ms': { 'auth': 1.1, 'db': 6.2, 'chess': 1.2, 'emit': 2.5, 'serialization': 1.5 },
+				'phases': [{ 'name': 'attempt_move', 'kind': 'chess', 'ms': 1.2 }]
+			}]
+		},
+		403: None
+	},
+	auth='token (bearer), admin',
+	description=(
+		'How long each phase of the most recent moves took (newest first), '
+		'and the median and 95th percentile of each phase. Phases are of one '
+		'of the kinds auth, db, chess, stats, serialization or emit (sending '
+		'over websockets). Admins only.'
+	)
+)
+@token_auth.login_required(role='admin')
+def get_move_timings():
+	return {
+		'slow_move_ms': move_timings.slow_move_ms,
+		'phases': move_timings.summary(),
+		'moves': [timing.as_dict() for timing in move_timings.recent()]
+	}
+
 @endpointer.route('/<int:id>/make-move', methods=['POST'], bp=matches,
 	accepts={
 		'uci_string': { 
 			'type': 'string',
 			'description': 'The attempted move in uci format',
-			'pattern': '^[a-h][1-8][a-h][1-8][r|n|b|q]?$'
+			'pattern': UCI_PATTERN
 		},
 	},
 	responds={
@@ -286,39 +447,26 @@ def accept_match_invite(id):
 )
 @token_auth.login_required
 def make_move(uci_string, id):
-	match = Match.query.get_or_404(id)
-	player = g.current_user
-	if not match.playing(player):
-		return error_response(403,
-			'Player not playing this match'
-		)
-	if not match.players_turn(player):
-		return error_response(409,
-			'Not your turn'
-		)
-	req_json = request.get_json()
-	if not match.attempt_move(player, uci_string):
-		return error_response(422,
-			'Move not possible'
-		)
-	db.session.commit()
-	ws_events.broadcast_move_made(
-		player=player,
-		move=uci_string,
-		current_fen=match.current_fen,
-		connection_token=match.connection_token
-	)
-	if match.is_finished:
-		# Should this be handled by the match?
-		# match.update_stats()
-		match.player_white.stat_block.add_match(match)
-		match.player_black.stat_block.add_match(match)
-		db.session.commit()
-		ws_events.broadcast_match_finish(
-			winning_player=player,
-			connection_token=match.connection_token
-		)
-	return {
-		'message' : 'Move successfully made',
-		'match' : match.as_dict()
-	}
\ No newline at end of file
+	timing = MoveTiming(id, uci_string, 'api')
+	# Everything before the endpoint, which is mostly authentication.
+	elapsed = endpointer.metrics.elapsed()
+	if elapsed is not None:
+		timing.add_phase('auth', 'auth', elapsed)
+	try:
+		with timing.phase('load', 'db'):
+			match = Match.query.get_or_404(id)
+		refusal = play_move(match, g.current_user, uci_string, timing)
+		if refusal is not None:
+			timing.status = refusal[0]
+			return error_response(*refusal)
+		# The mover is sent the new state over websockets along with everyone
+		# else, so there's no need to load the whole history here.
+		with timing.phase('serialize', 'serialization'):
+			ret = {
+				'message' : 'Move successfully made',
+				'match' : match.as_dict(history=False)
+			}
+		timing.status = 200
+		return ret
+	finally:
+		move_timings.record(timing)
\ No newline at end of file
@@ -0,0 +1,50 @@
+import chess
+
+from dark_chess_api.modules.matches.models import DarkBoard
+
+# Work on matches that's given to the worker pool (see `worker_pool.py`), and so
+# takes and returns plain data only.
+
+# Where each view's rendered fen is in a state, after its fen and move. Like
+# `MatchState.dark_fen`, anything but white sees black's.
+def rendered_index(view):
+	if view == 'spectating':
+		return 2
+	return 0 if view == 'white' else 1
+
+# The history of a match as seen by each of `views` (either side, or
+# 'spectating' for the fully visible board), from its states as tuples of
+# `(fen, move, white_dark_fen, black_dark_fen, expanded_fen)`. Rendered fens
+# are used as they are, while the rest are replayed in order from the last
+# state with a fen, once for every view.
+def replay_histories(states, views):
+	histories = { view: [] for view in views }
+	board = None
+	previous_fen = None
+	for fen, move, *rendered in states:
+		if fen is None:
+			if board is None:
+				board = DarkBoard(fen=previous_fen)
+			board.push_encoded(move)
+		else:
+			board = None
+		for view in views:
+			view_fen = rendered[rendered_index(view)]
+			if view_fen is None:
+				if board is None:
+					board = DarkBoard(fen=fen)
+				if view == 'spectating':
+					view_fen = board.render_mask(chess.BB_ALL)
+				else:
+					view_fen = board.dark_fen(view)
+			histories[view].append(view_fen)
+		previous_fen = fen
+	return histories
+
+# How many of the states need replaying for any of `views`.
+def replays_needed(states, views):
+	indices = [rendered_index(view) for view in views]
+	return sum(
+		1 for fen, move, *rendered in states
+		if any(rendered[i] is None for i in indices)
+	)
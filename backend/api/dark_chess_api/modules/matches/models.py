@@ -1,14 +1,17 @@
+import zlib
 import chess
 import random
+from hashlib import sha256
 from uuid import uuid4
 from datetime import datetime, timezone
 
 from sqlalchemy import and_
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import aliased, joinedload
 from sqlalchemy.sql import and_, or_
-from flask import current_app
+from flask import current_app, json
 
-from dark_chess_api import db
+from dark_chess_api import db, endpointer, worker_pool
 
 # Note that this file is full of inneficient code, most notably many
 # instantiations of board objects for simple functions. In the future this may
@@ -20,37 +23,115 @@ from dark_chess_api import db
 # TODO: Convert most (all?) calls to `chess.Board` to use this class instead.
 class DarkBoard(chess.Board):
 
-	def dark_fen(self, side):
+	# A side can see every square it occupies, plus every square that one of
+	# its pseudo-legal moves could land on. Rather than generating the moves
+	# themselves, this ORs together the same bitboards chess.py uses to
+	# generate them, so the result is a single 64 bit integer.
+	def vision_mask(self, side):
 		player_side = chess.WHITE if side == 'white' else chess.BLACK
-		# We swap the board to the requesting side so that it can render the
-		# proper vision from `self.pseudo_legal_moves`
-		self.turn = player_side
-		attackable_squares = []
-		for move in self.pseudo_legal_moves:
-			attackable_squares.append(move.from_square)
-			attackable_squares.append(move.to_square)
-		dfen = ''
+		our_pieces = self.occupied_co[player_side]
+		mask = our_pieces
+		# Piece moves. Attacks onto our own pieces are harmless to include,
+		# since those squares are already visible.
+		for square in chess.scan_reversed(our_pieces & ~self.pawns):
+			mask |= self.attacks_mask(square)
+		pawns = self.pawns & our_pieces
+		if pawns:
+			# Pawn captures
+			for square in chess.scan_reversed(pawns):
+				mask |= (chess.BB_PAWN_ATTACKS[player_side][square] &
+					self.occupied_co[not player_side])
+			# Pawn advances
+			if player_side == chess.WHITE:
+				single_moves = pawns << 8 & ~self.occupied
+				double_moves = (single_moves << 8 & ~self.occupied &
+					(chess.BB_RANK_3 | chess.BB_RANK_4))
+			else:
+				single_moves = pawns >> 8 & ~self.occupied
+				double_moves = (single_moves >> 8 & ~self.occupied &
+					(chess.BB_RANK_6 | chess.BB_RANK_5))
+			mask |= single_moves | double_moves
+			# En passant
+			if self.ep_square and not chess.BB_SQUARES[self.ep_square] & self.occupied:
+				if (pawns & chess.BB_PAWN_ATTACKS[not player_side][self.ep_square] &
+					chess.BB_RANKS[4 if player_side else 3]):
+					mask |= chess.BB_SQUARES[self.ep_square]
+		# Castling. Whether or not the king may pass through the intervening
+		# squares is involved enough that it's left to chess.py, but it's rare
+		# enough to have castling rights at all that it costs next to nothing.
+		backrank = chess.BB_RANK_1 if player_side == chess.WHITE else chess.BB_RANK_8
+		if self.castling_rights & backrank:
+			turn = self.turn
+			self.turn = player_side
+			try:
+				for move in self.generate_castling_moves():
+					mask |= chess.BB_SQUARES[move.to_square]
+			finally:
+				self.turn = turn
+		return mask & chess.BB_ALL
+
+	# Renders the board a8 -> h1, with any square not in `mask` shown as '?'.
+	def render_mask(self, mask):
+		squares = ['?'] * 64
+		for square in chess.scan_forward(mask & ~self.occupied):
+			squares[square] = '_'
+		for color in chess.COLORS:
+			for piece_type in chess.PIECE_TYPES:
+				symbol = chess.piece_symbol(piece_type)
+				symbol = symbol.upper() if color == chess.WHITE else symbol
+				for square in chess.scan_forward(self.pieces_mask(piece_type, color) & mask):
+					squares[square] = symbol
 		# chess.py conceives of boards as being a1 -> h8 with white on top, but
 		# we use the traditional method of a8 -> h1 with black on top. Because
 		# of this, we iterate through the ranks in reverse.
-		for rank in range(7, -1, -1):
-			for file in range(8):
-				square = chess.square(file, rank)
-				piece = self.piece_at(square)
-				if (square in attackable_squares or
-					(piece is not None and piece.color == player_side)):
-					dfen += piece.symbol() if piece is not None else '_'
-				else:
-					dfen += '?'
-			if rank > 0:
-				dfen += '/'
-		return dfen
+		return '/'.join(
+			''.join(squares[rank * 8:rank * 8 + 8]) for rank in range(7, -1, -1)
+		)
+
+	def dark_fen(self, side):
+		return self.render_mask(self.vision_mask(side))
+
+	# The squares that differ between two rendered boards (dark or expanded
+	# fens), as a map of square names to their symbols in `after`.
+	@staticmethod
+	def render_delta(before, after):
+		before = before.replace('/', '')
+		after = after.replace('/', '')
+		return {
+			chess.SQUARE_NAMES[chess.square(i % 8, 7 - i // 8)]: symbol
+			for i, symbol in enumerate(after) if symbol != before[i]
+		}
 
 	def king_captured(self):
 		return self.king(self.turn) is None
 
-# TODO: Configure the join to load eagerly
+	# Moves are stored as `from | to << 6 | promotion << 12`, which fits in a
+	# 16 bit integer.
+	@staticmethod
+	def encode_move(move):
+		return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+	@staticmethod
+	def decode_move(value):
+		return chess.Move(value & 0x3f, value >> 6 & 0x3f, (value >> 12) or None)
+
+	# Plays a stored move. A fen only keeps the en passant square if the
+	# capture is legal, and so the same is done here, so that a replayed board
+	# always agrees with one parsed from the fen of the same position.
+	def push_encoded(self, value):
+		self.push(DarkBoard.decode_move(value))
+		if self.ep_square is not None and not self.has_legal_en_passant():
+			self.ep_square = None
+
 class MatchInvite(db.Model):
+
+	# Invites are looked up by who sent them or who they're for, usually only
+	# those that haven't been accepted yet (`match_id IS NULL`). Open invites
+	# are those with no invited user, and so are covered by the latter.
+	__table_args__ = (
+		db.Index('ix_match_invite_inviter_id_match_id', 'inviter_id', 'match_id'),
+		db.Index('ix_match_invite_invited_id_match_id', 'invited_id', 'match_id'),
+	)
 	
 	id = db.Column(db.Integer, primary_key=True)
 
@@ -85,24 +166,30 @@ class MatchInvite(db.Model):
 	def accepted(cls):
 		return cls.match_id != None
 
+	# Loader options for queries whose results will be serialized with
+	# `as_dict`, which would otherwise load each invite's users one at a time.
+	@staticmethod
+	def as_dict_options():
+		return (
+			joinedload(MatchInvite.inviter),
+			joinedload(MatchInvite.invited)
+		)
+
 	@staticmethod
 	def mock_dict(force_direct=False, force_accepted=False):
 		created_on = datetime.now(timezone.utc)
 		from dark_chess_api.modules.users.models import User
 
-		mock_inviter = User.mock_dict()
+		mock_inviter = User.mock_ref()
 		mock_invited = None
 		if force_direct or random.choice([True, False]):
-			mock_invited = User.mock_dict()
+			mock_invited = User.mock_ref()
 		match_id = None
 		if (force_accepted or random.choice([True, False])) and mock_invited is not None:
 			match_id = random.randint(1, 100)
 		ret = {
 			'id': random.randint(1, 100),
-			'inviter': {
-				'id': mock_inviter['id'],
-				'username': mock_inviter['username']
-			},
+			'inviter': mock_inviter,
 			'open': mock_invited is None,
 			'accepted': match_id is not None,
 			'created_on': {
@@ -112,10 +199,7 @@ class MatchInvite(db.Model):
 		}
 		if mock_invited is not None:
 			ret.update({
-				'invited': {
-					'id': mock_invited['id'],
-					'username': mock_invited['username']
-				}
+				'invited': mock_invited
 			})
 		if match_id is not None:
 			ret.update({
@@ -126,10 +210,7 @@ class MatchInvite(db.Model):
 	def as_dict(self):
 		ret = {
 			'id': self.id,
-			'inviter': {
-				'id': self.inviter.id,
-				'username': self.inviter.username
-			},
+			'inviter': self.inviter.as_ref(),
 			'open': self.open,
 			'accepted': self.accepted,
 			'created_on': {
@@ -139,10 +220,7 @@ class MatchInvite(db.Model):
 		}
 		if self.invited_id is not None:
 			ret.update({
-				'invited': {
-					'id': self.invited.id,
-					'username': self.invited.username
-				}
+				'invited': self.invited.as_ref()
 			})
 		if self.match_id is not None:
 			ret.update({
@@ -152,14 +230,163 @@ class MatchInvite(db.Model):
 
 class MatchState(db.Model):
 
+	__table_args__ = (
+		db.Index('ix_match_state_match_id_ply', 'match_id', 'ply', unique=True),
+	)
+
 	id = db.Column(db.Integer, primary_key=True)
 
-	fen = db.Column(db.String(256), nullable=False)
+	# Only checkpoints have a fen when the history is stored compactly (see
+	# `MATCH_HISTORY_FORMAT`), every other position is replayed from the moves
+	# played since the last checkpoint.
+	fen = db.Column(db.String(256))
+
+	# The move played to reach this state, encoded with `DarkBoard.encode_move`.
+	# Null for the initial state, and states played before moves were kept.
+	move = db.Column(db.SmallInteger)
+
+	# The number of half moves played to reach this state, so the initial state
+	# of every match is ply 0.
+	ply = db.Column(db.Integer, nullable=False)
+
+	created_on = db.Column(db.DateTime, default=datetime.utcnow)
+
+	# A state never changes once it's been played, so each side's vision (and
+	# the fully visible board) is rendered once when the state is created,
+	# rather than every time the match history is served. Rows created before
+	# these columns existed are filled in with `flask matches backfill`.
+	white_dark_fen = db.Column(db.String(71))
+	black_dark_fen = db.Column(db.String(71))
+	expanded_fen = db.Column(db.String(71))
 
 	match_id = db.Column(db.Integer, db.ForeignKey('match.id'), nullable=False)
 
+	# `board`, if given, must have been parsed from `fen`. It's accepted purely
+	# so that callers who already have one don't need to parse it twice.
+	def __init__(self, fen, ply=0, board=None, move=None, rendered=True):
+		self.fen = fen
+		self.ply = ply
+		self.move = move
+		self.created_on = datetime.utcnow()
+		if rendered:
+			self.render(board)
+
+	# Creates a state for the position on `board` (which must have been parsed
+	# from its fen), stored in the configured history format. `move` is the
+	# encoded move that reached it, if any.
+	@staticmethod
+	def create(board, ply=0, move=None):
+		if current_app.config['MATCH_HISTORY_FORMAT'] != 'compact':
+			return MatchState(board.fen(), ply=ply, board=board, move=move)
+		checkpoint = ply % current_app.config['MATCH_CHECKPOINT_INTERVAL'] == 0
+		return MatchState(board.fen() if checkpoint else None,
+			ply=ply,
+			move=move,
+			rendered=False
+		)
+
+	def render(self, board=None):
+		if board is None:
+			board = DarkBoard(fen=self.fen)
+		self.white_dark_fen = board.dark_fen('white')
+		self.black_dark_fen = board.dark_fen('black')
+		self.expanded_fen = board.render_mask(chess.BB_ALL)
+
+	def dark_fen(self, side):
+		return self.white_dark_fen if side == 'white' else self.black_dark_fen
+
+# Everything about a match state that requires parsing its fen, parsed exactly
+# once. Matches hand these out for their latest state through `Match.snapshot`,
+# so that a single request can ask as many questions of the current position as
+# it likes without rebuilding the board each time.
+class MatchSnapshot:
+
+	def __init__(self, state, board=None):
+		self.state = state
+		self.board = board if board is not None else DarkBoard(fen=state.fen)
+		self.side = 'white' if self.board.turn == chess.WHITE else 'black'
+		self._possible_moves = None
+
+	# Compactly stored states have nothing rendered (and usually no fen), so
+	# those are taken from the board instead.
+
+	@property
+	def fen(self):
+		if self.state.fen is None:
+			return self.board.fen()
+		return self.state.fen
+
+	@property
+	def expanded_fen(self):
+		if self.state.expanded_fen is None:
+			return self.board.render_mask(chess.BB_ALL)
+		return self.state.expanded_fen
+
+	def dark_fen(self, side):
+		dark_fen = self.state.dark_fen(side)
+		if dark_fen is None:
+			return self.board.dark_fen(side)
+		return dark_fen
+
+	# The side to move's moves, as a map of origin squares to destination
+	# squares. Note that be cause this is dark chess, the list of moves
+	# includes pseudo-legal ones, such as moves that leave the king in check.
+	@property
+	def possible_moves(self):
+		if self._possible_moves is None:
+			# List comprehensions may be nicer to look at here, but would be
+			# less performant
+			ret = {}
+			for move in self.board.pseudo_legal_moves:
+				if move.from_square in ret:
+					ret[move.from_square].append(move.to_square)
+				else:
+					ret[move.from_square] = [move.to_square]
+			self._possible_moves = ret
+		return self._possible_moves
+
+# What `Match.as_dict` gives one kind of viewer (either side, or spectators) of
+# a finished match, already serialized. Nothing about a match changes once it's
+# finished, so these are rendered once, when it finishes, and served as they
+# are from then on, along with an ETag taken from their content. They're kept
+# compressed, as most of each is a history of fens.
+class FinishedMatchView(db.Model):
+
+	match_id = db.Column(db.Integer, db.ForeignKey('match.id'), primary_key=True)
+	viewer = db.Column(db.String(10), primary_key=True)
+	compressed_body = db.Column(db.LargeBinary, nullable=False)
+	etag = db.Column(db.String(64), nullable=False)
+
+	def __init__(self, match_id, viewer, body):
+		self.match_id = match_id
+		self.viewer = viewer
+		self.body = body
+
+	@property
+	def body(self):
+		return zlib.decompress(self.compressed_body).decode()
+
+	@body.setter
+	def body(self, body):
+		body = body.encode()
+		self.compressed_body = zlib.compress(body, 9)
+		self.etag = sha256(body).hexdigest()
+
 class Match(db.Model):
 
+	# Matches are looked up by player, with either colour, and then usually by
+	# whether they're finished. Looking up both colours is an OR, which the
+	# database can answer with one index per side, and open matches (a missing
+	# player) are found through the same two indexes.
+	__table_args__ = (
+		db.Index('ix_match_player_white_id_is_finished',
+			'player_white_id', 'is_finished'
+		),
+		db.Index('ix_match_player_black_id_is_finished',
+			'player_black_id', 'is_finished'
+		),
+	)
+
 	id = db.Column(db.Integer, primary_key=True)
 	connection_token = db.Column(db.String(36), index=True, unique=True, nullable=False)
 
@@ -183,7 +410,33 @@ class Match(db.Model):
 		foreign_keys='Match.winning_player_id'
 	)
 
-	history = db.relationship('MatchState')
+	# The history is only ever needed in full when it's being served, so it's
+	# left as a query. Everything else should only need the current state,
+	# which is kept as a pointer so that it can be loaded on its own.
+	history = db.relationship('MatchState',
+		foreign_keys='MatchState.match_id',
+		order_by='MatchState.ply',
+		lazy='dynamic'
+	)
+
+	current_state_id = db.Column(db.Integer, db.ForeignKey('match_state.id',
+		use_alter=True, name='fk_match_current_state_id_match_state'
+	))
+	current_state = db.relationship('MatchState',
+		foreign_keys='Match.current_state_id',
+		post_update=True
+	)
+
+	# Denormalized from the current state, so that listings, and finding the
+	# matches where it's someone's turn, are answered from this table alone
+	# without parsing any fens. These are kept up to date by `advance`, and
+	# `current_player_id` is null whenever it isn't anyone's turn.
+	ply_count = db.Column(db.Integer, default=0, nullable=False)
+	side_to_move = db.Column(db.String(5))
+	last_move_at = db.Column(db.DateTime)
+	current_player_id = db.Column(db.Integer, db.ForeignKey('user.id'),
+		index=True
+	)
 
 	def join(self, player):
 		if not self.playing(player):
@@ -197,7 +450,22 @@ class Match(db.Model):
 			else:
 				self.player_white = player
 			if not self.open: # second player has joined, create initial state
-				self.history.append(MatchState(fen=chess.Board().fen()))
+				self.advance(MatchState.create(DarkBoard()))
+
+	# Appends `state` to the history as the new current state. Every match
+	# starts from the standard position, so the side to move follows from the
+	# number of plies played.
+	def advance(self, state):
+		self.history.append(state)
+		self.current_state = state
+		self.ply_count = state.ply
+		self.side_to_move = 'white' if state.ply % 2 == 0 else 'black'
+		self.last_move_at = state.created_on
+		# The player relationships are used rather than their ids, which for a
+		# match that's just been joined won't have been flushed yet.
+		current_player = (self.player_white
+			if self.side_to_move == 'white' else self.player_black)
+		self.current_player_id = current_player.id
 
 	@hybrid_property
 	def open(self):
@@ -211,53 +479,152 @@ class Match(db.Model):
 	def in_progress(self):
 		return not self.is_finished and not self.open
 
+	# Spelt out rather than negating `open`, so that it can be looked up in the
+	# player indexes.
 	@in_progress.expression
 	def in_progress(cls):
-		return and_(cls.is_finished == False, cls.open == False)
+		return and_(
+			cls.is_finished == False,
+			cls.player_white_id != None,
+			cls.player_black_id != None
+		)
 
 	@property
 	def current_player(self):
 		if not self.in_progress:
 			return None
-		board = chess.Board(fen=self.current_fen)
-		return self.player_white if (board.turn == chess.WHITE) else self.player_black
+		return self.player_white if self.side_to_move == 'white' else self.player_black
 
 	@property
 	def current_fen(self):
-		return self.history[-1].fen
+		return self.snapshot.fen
 
-	@staticmethod
-	def expand_fen(fen):
-		ret = []
-		positions = fen.split(' ')[0].split('/')
-		for row in positions:
-			new_row = [
-				square if square.isalpha() else '_' * int(square)
-				for square in row
-			]
-			ret.append(''.join(new_row))
-		return '/'.join(ret)
+	# Snapshots are cached on the instance, and so live as long as the session
+	# that loaded the match (for the api, that's a single request). A new one is
+	# taken whenever the current state changes.
+	@property
+	def snapshot(self):
+		state = self.current_state
+		if state is None:
+			return None
+		snapshot = getattr(self, '_snapshot', None)
+		if snapshot is None or snapshot.state is not state:
+			snapshot = self.snapshot_of(state)
+			self._snapshot = snapshot
+		return snapshot
+
+	# The snapshot of the state before the current one, which `attempt_move`
+	# keeps hold of, so that what a move changed can be worked out without
+	# loading anything. Otherwise it's loaded from the history.
+	@property
+	def previous_snapshot(self):
+		if self.current_state is None or self.ply_count == 0:
+			return None
+		snapshot = getattr(self, '_previous_snapshot', None)
+		if snapshot is None or snapshot.state.ply != self.ply_count - 1:
+			state = self.history.filter(
+				MatchState.ply == self.ply_count - 1
+			).first()
+			snapshot = self.snapshot_of(state)
+			self._previous_snapshot = snapshot
+		return snapshot
+
+	def snapshot_of(self, state):
+		board = None
+		if state.fen is None:
+			board = self.replay_to(state)
+		return MatchSnapshot(state, board=board)
+
+	# Reconstructs the position of a state without a fen, by replaying the
+	# moves played since the last state that has one. The states needed are
+	# loaded in a single query.
+	def replay_to(self, state):
+		checkpoint_ply = db.session.query(db.func.max(MatchState.ply)).filter(
+			MatchState.match_id == self.id,
+			MatchState.ply <= state.ply,
+			MatchState.fen != None
+		).as_scalar()
+		states = self.history.filter(
+			MatchState.ply >= checkpoint_ply,
+			MatchState.ply <= state.ply
+		).all()
+		board = DarkBoard(fen=states[0].fen)
+		for s in states[1:]:
+			board.push_encoded(s.move)
+		return board
+
+	# The dark fens of every state of the match as seen by `side`, or for
+	# spectators the fully visible boards.
+	def history_fens(self, side):
+		return self.histories([side])[side]
+
+	# The history as seen by each of `views`. Rendered states are served as
+	# they are, while the rest are replayed in order from the last state with
+	# a fen, so the whole history is reconstructed in a single pass (see
+	# `jobs.replay_histories`). Long replays are done by the worker pool.
+	def histories(self, views):
+		# Avoids circular import issue.
+		from dark_chess_api.modules.matches.jobs import (
+			replay_histories, replays_needed
+		)
+		states = [
+			(state.fen, state.move, state.white_dark_fen, state.black_dark_fen,
+				state.expanded_fen)
+			for state in self.history
+		]
+		replays = replays_needed(states, views)
+		if replays and replays >= current_app.config['MATCH_OFFLOAD_MIN_PLIES']:
+			return worker_pool.run(replay_histories, states, views)
+		return replay_histories(states, views)
+
+	# Converts the match's history to the compact format, keeping a fen every
+	# `interval` plies (and for any state whose move can't be worked out, which
+	# shouldn't happen). Moves are recovered by finding the one that leads from
+	# each position to the next.
+	def compact(self, interval):
+		previous_board = None
+		for state in self.history:
+			board = DarkBoard(fen=state.fen) if state.fen is not None else None
+			if state.move is None and previous_board is not None and board is not None:
+				for move in list(previous_board.pseudo_legal_moves):
+					previous_board.push(move)
+					if previous_board.fen() == state.fen:
+						state.move = DarkBoard.encode_move(move)
+					previous_board.pop()
+					if state.move is not None:
+						break
+			if board is None:
+				previous_board.push_encoded(state.move)
+			else:
+				previous_board = board
+			if state.ply % interval != 0 and state.move is not None:
+				state.fen = None
+			state.white_dark_fen = None
+			state.black_dark_fen = None
+			state.expanded_fen = None
 
 	@property
 	def current_expanded_fen(self):
-		board = chess.Board(fen=self.current_fen)
-		ret = ''
-		# chess.py conceives of boards as being a1 -> h8 with white on top, but
-		# we use the traditional method of a8 -> h1 with black on top. Because
-		# of this, we iterate through the ranks in reverse.
-		for rank in range(7, -1, -1):
-			for file in range(8):
-				square = chess.square(file, rank)
-				piece = board.piece_at(square)
-				ret += piece.symbol() if piece is not None else '_'
-			if rank > 0:
-				ret += '/'
-		return ret
+		return self.snapshot.expanded_fen
+
+	# The squares whose contents, as seen by `side` (or by spectators), changed
+	# with the last move. See `DarkBoard.render_delta`.
+	def vision_delta(self, side):
+		previous = self.previous_snapshot
+		if previous is None:
+			return None
+		if side == 'spectating':
+			return DarkBoard.render_delta(
+				previous.expanded_fen, self.snapshot.expanded_fen
+			)
+		return DarkBoard.render_delta(
+			previous.dark_fen(side), self.snapshot.dark_fen(side)
+		)
 
 	def current_dark_fen(self, side):
 		if not self.in_progress:
 			return None
-		return self.current_board(side).dark_fen(side)
+		return self.snapshot.dark_fen(side)
 		# This is kept for a while, but this will longer be cliffhanger dark.
 		# if side == self.current_side:
 		# 	return self.current_board(side).dark_fen(side)
@@ -280,14 +647,13 @@ class Match(db.Model):
 	def current_board(self, side):
 		if not self.in_progress:
 			return None
-		return DarkBoard(fen=self.current_fen)
+		return self.snapshot.board
 
 	@property
 	def current_side(self):
 		if not self.in_progress:
 			return None
-		white = chess.Board(fen=self.current_fen).turn
-		return 'white' if white else 'black'
+		return self.side_to_move
 
 	###########################################################################
 	# NOTE # The following functions are written very defensively. This may   #
@@ -307,9 +673,7 @@ class Match(db.Model):
 	def players_turn(self, player):
 		if not self.playing(player):
 			return False
-		board = chess.Board(fen=self.current_fen)
-		player_side = chess.BLACK if player.id == self.player_black_id else chess.WHITE
-		return player_side == board.turn
+		return player.id == self.current_player_id
 
 	# def player_side(self, player):
 	# 	if not self.playing(player):
@@ -323,16 +687,7 @@ class Match(db.Model):
 			return {}
 		if self.current_side != side:
 			return {}
-		moves = self.current_board(side).pseudo_legal_moves
-		# List comprehensions may be nicer to look at here, but would be less
-		# performant
-		ret = {}
-		for move in moves:
-			if move.from_square in ret:
-				ret[move.from_square].append(move.to_square)
-			else:
-				ret[move.from_square] = [move.to_square]
-		return ret
+		return self.snapshot.possible_moves
 
 	def possible_moves_as_names(self, side):
 		return {
@@ -344,16 +699,50 @@ class Match(db.Model):
 
 	def attempt_move(self, player, uci_string):
 		move = chess.Move.from_uci(uci_string)
-		board = DarkBoard(fen=self.current_fen)
-		if self.players_turn(player) and move in board.pseudo_legal_moves:
+		if not self.players_turn(player):
+			return False
+		previous_snapshot = self.snapshot
+		board = previous_snapshot.board.copy(stack=False)
+		if move in board.pseudo_legal_moves:
 			board.push(move)
-			self.history.append(MatchState(fen=board.fen()))
+			# The new state is rendered from a board parsed from its fen, so
+			# that it's identical to what any later request would load. That
+			# same board then becomes the new snapshot.
+			new_board = DarkBoard(fen=board.fen())
+			new_state = MatchState.create(new_board,
+				ply=self.current_state.ply + 1,
+				move=DarkBoard.encode_move(move)
+			)
+			self.advance(new_state)
+			self._snapshot = MatchSnapshot(new_state, board=new_board)
+			self._previous_snapshot = previous_snapshot
 			if board.is_checkmate() or board.king_captured():
 				self.is_finished = True
 				self.winning_player = player
+				self.current_player_id = None
 			return True
 		return False
 
+	# Cached responses made from a match are tagged with this, and dropped with
+	# `invalidate_cached` once changes to it are committed.
+	@staticmethod
+	def cache_tag(id):
+		return f'match:{id}'
+
+	def invalidate_cached(self):
+		endpointer.invalidate(Match.cache_tag(self.id))
+
+	# Loader options for queries whose results will be serialized with
+	# `as_dict`. The history is left out, since it's a query of its own anyway.
+	@staticmethod
+	def as_dict_options():
+		return (
+			joinedload(Match.player_white),
+			joinedload(Match.player_black),
+			joinedload(Match.current_state),
+			joinedload(Match.winning_player)
+		)
+
 	@staticmethod
 	def mock_dict(side=None, game_state=None):
 		# Avoids circular import issue.
@@ -369,9 +758,9 @@ class Match(db.Model):
 			if game_state == 'open':
 				mock_open = True
 				if random.choice([True, False]):
-					mock_player_black = User.mock_dict()
+					mock_player_black = User.mock_ref()
 				else:
-					mock_player_white = User.mock_dict()
+					mock_player_white = User.mock_ref()
 			elif game_state == 'in_progress':
 				mock_in_progress = True
 			elif game_state == 'finished':
@@ -381,8 +770,8 @@ class Match(db.Model):
 			mock_in_progress = False if mock_open else random.choice([True, False])
 			mock_finished = not (mock_in_progress or mock_open)
 		if mock_in_progress or mock_finished:
-			mock_player_black = User.mock_dict()
-			mock_player_white = User.mock_dict()
+			mock_player_black = User.mock_ref()
+			mock_player_white = User.mock_ref()
 			if side is None:
 				side = random.choice(['white', 'black', 'spectating'])
 		ret = {
@@ -390,14 +779,8 @@ class Match(db.Model):
 			'is_finished' : mock_finished,
 			'in_progress' : mock_in_progress,
 			'open' : mock_open,
-			'player_black': {
-				'id': mock_player_black['id'],
-				'username': mock_player_black['username']
-			} if mock_player_black is not None else None,
-			'player_white': {
-				'id': mock_player_white['id'],
-				'username': mock_player_white['username']
-			} if mock_player_white is not None else None
+			'player_black': mock_player_black,
+			'player_white': mock_player_white
 		}
 		if side is not None or mock_open:
 			ret.update({
@@ -443,24 +826,126 @@ class Match(db.Model):
 			})
 		return ret
 
+	# Summaries are the listing counterpart to `as_dict`. They're built
+	# entirely from columns of the match and its players, which `summary_query`
+	# selects in a single statement, so no chess is computed and no
+	# relationships are loaded per match.
+	@staticmethod
+	def summary_query():
+		# Avoids circular import issue.
+		from dark_chess_api.modules.users.models import User
+		white = aliased(User)
+		black = aliased(User)
+		return db.session.query(
+			Match.id,
+			Match.is_finished,
+			Match.player_white_id,
+			white.username.label('player_white_username'),
+			Match.player_black_id,
+			black.username.label('player_black_username'),
+			Match.ply_count,
+			Match.side_to_move,
+			Match.current_player_id,
+			Match.last_move_at
+		).outerjoin(white, Match.player_white_id == white.id
+		).outerjoin(black, Match.player_black_id == black.id)
+
+	@staticmethod
+	def summary_as_dict(row):
+		# Avoids circular import issue.
+		from dark_chess_api.modules.users.models import user_ref
+		is_open = row.player_white_id is None or row.player_black_id is None
+		in_progress = not row.is_finished and not is_open
+		ret = {
+			'id': row.id,
+			'is_finished': row.is_finished,
+			'in_progress': in_progress,
+			'open': is_open,
+			'player_black': user_ref(
+				row.player_black_id, row.player_black_username
+			) if row.player_black_id is not None else None,
+			'player_white': user_ref(
+				row.player_white_id, row.player_white_username
+			) if row.player_white_id is not None else None,
+			'ply_count': row.ply_count,
+			'last_move_on': {
+				'formatted': str(row.last_move_at),
+				'timestamp': int(row.last_move_at.replace(tzinfo=timezone.utc).timestamp())
+			} if row.last_move_at is not None else None
+		}
+		if in_progress:
+			ret.update({
+				'current_side': row.side_to_move,
+				'current_player_id': row.current_player_id
+			})
+		return ret
+
+	@staticmethod
+	def mock_summary_dict():
+		# Avoids circular import issue.
+		from dark_chess_api.modules.users.models import User
+		mock_player_black = User.mock_ref()
+		mock_player_white = User.mock_ref()
+		last_move_on = datetime.now(timezone.utc)
+		return {
+			'id': random.randint(1, 100),
+			'is_finished': False,
+			'in_progress': True,
+			'open': False,
+			'player_black': mock_player_black,
+			'player_white': mock_player_white,
+			'ply_count': 7,
+			'last_move_on': {
+				'formatted': str(last_move_on),
+				'timestamp': int(last_move_on.timestamp())
+			},
+			'current_side': 'black',
+			'current_player_id': mock_player_black['id']
+		}
+
+	VIEWERS = ['white', 'black', 'spectating']
+
+	# The view of this finished match for `viewer`, rendering the views for
+	# every viewer if they haven't been yet (for matches finished before they
+	# were kept). See `FinishedMatchView`.
+	def finished_view(self, viewer):
+		view = FinishedMatchView.query.get((self.id, viewer))
+		if view is None:
+			view = self.render_finished_views()[viewer]
+			db.session.commit()
+		return view
+
+	# Renders (or re-renders) the views of this finished match, which are added
+	# to the session, and returns them by viewer.
+	def render_finished_views(self):
+		if not self.is_finished:
+			raise ValueError('Match not finished')
+		views = {}
+		histories = self.histories(Match.VIEWERS)
+		for viewer in Match.VIEWERS:
+			view = FinishedMatchView(self.id, viewer,
+				json.dumps(self.as_dict(side=viewer, history=histories[viewer]))
+			)
+			views[viewer] = db.session.merge(view)
+		return views
+
 	# Some of the initial properties are mutually exclusive, and could
 	# therefore be inferred from eachother, but they are all left in for
 	# convienience of questioning. This whole method probably should be
 	# refactored.
-	def as_dict(self, side=None):
+	# Loading the history means loading every state of the match, so callers
+	# that don't need it can leave it out with `history=False`, and callers
+	# that already have it can pass it in.
+	def as_dict(self, side=None, history=True):
 		ret = {
 			'id' : self.id,
 			'is_finished' : self.is_finished,
 			'in_progress' : self.in_progress,
 			'open' : self.open,
-			'player_black': {
-				'id': self.player_black.id,
-				'username': self.player_black.username
-			} if self.player_black is not None else None,
-			'player_white': {
-				'id': self.player_white.id,
-				'username': self.player_white.username
-			} if self.player_white is not None else None
+			'player_black': self.player_black.as_ref()
+				if self.player_black is not None else None,
+			'player_white': self.player_white.as_ref()
+				if self.player_white is not None else None
 		}
 		# I guess it doesn't really matter to hide the connection hash ever,
 		# since until the match is full it's fully exposed and anyone can copy
@@ -469,15 +954,21 @@ class Match(db.Model):
 			ret.update({
 				'connection_token': self.connection_token
 			})
-		if side == 'spectating':
+		if not self.open:
+			ret.update({
+				'ply': self.ply_count
+			})
+		if history is True:
+			history = self.history_fens(side)
+		if not history:
+			pass
+		elif side == 'spectating':
 			ret.update({
-				'transparent_history': [Match.expand_fen(ms.fen) for ms in self.history]
+				'transparent_history': history
 			})
 		else:
 			ret.update({
-				f'{side}_vision_history': [
-					DarkBoard(fen=ms.fen).dark_fen(side) for ms in self.history
-				]
+				f'{side}_vision_history': history
 			})
 		if self.in_progress:
 			ret.update({
@@ -498,6 +989,6 @@ class Match(db.Model):
 			ret.update({
 				'winning_side': 'white' if self.winning_player_id == self.player_white_id else 'black',
 				'current_fen': self.current_expanded_fen,
-				'winner': self.winning_player.as_dict()
+				'winner': self.winning_player.as_ref()
 			})
 		return ret
\ No newline at end of file
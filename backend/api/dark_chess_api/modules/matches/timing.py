@@ -0,0 +1,114 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# How long each phase of playing a move takes, so that when moves get slow it's
+# clear whether it's the database, the chess, stats, serialization, or sending
+# the move out over websockets. Every move's timing is kept in a ring buffer of
+# the last `MOVE_TIMINGS_SIZE` moves (see `/match/move-timings`), and any move
+# slower than `SLOW_MOVE_MS` is logged along with its phases.
+
+class MoveTiming:
+
+	def __init__(self, match_id, uci_string, via):
+		self.match_id = match_id
+		self.uci_string = uci_string
+		self.via = via
+		self.played_on = datetime.now(timezone.utc)
+		self.start = time.perf_counter()
+		self.phases = []
+		self.status = None
+
+	@contextmanager
+	def phase(self, name, kind):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add_phase(name, kind, time.perf_counter() - start)
+
+	# For time spent before the timing started, e.g. authentication.
+	def add_phase(self, name, kind, seconds):
+		self.phases.append((name, kind, seconds))
+
+	@property
+	def total_ms(self):
+		return sum(seconds for name, kind, seconds in self.phases) * 1e3
+
+	def by_kind(self):
+		kinds = {}
+		for name, kind, seconds in self.phases:
+			kinds[kind] = kinds.get(kind, 0) + seconds * 1e3
+		return kinds
+
+	def as_dict(self):
+		return {
+			'match_id': self.match_id,
+			'uci_string': self.uci_string,
+			'via': self.via,
+			'status': self.status,
+			'played_on': {
+				'formatted': str(self.played_on),
+				'timestamp': int(self.played_on.timestamp())
+			},
+			'total_ms': self.total_ms,
+			'by_kind_ms': self.by_kind(),
+			'phases': [
+				{ 'name': name, 'kind': kind, 'ms': seconds * 1e3 }
+				for name, kind, seconds in self.phases
+			]
+		}
+
+	def __str__(self):
+		phases = ', '.join(
+			f'{name} {seconds * 1e3:.1f}ms' for name, kind, seconds in self.phases
+		)
+		return (f'{self.uci_string} in match {self.match_id} ({self.via}) took '
+			f'{self.total_ms:.1f}ms: {phases}')
+
+class MoveTimings:
+
+	def __init__(self, app=None, size=256, slow_move_ms=250):
+		self.slow_move_ms = slow_move_ms
+		self.logger = None
+		self._timings = deque(maxlen=size)
+		self._lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.slow_move_ms = app.config['SLOW_MOVE_MS']
+		self.logger = app.logger
+		with self._lock:
+			self._timings = deque(maxlen=app.config['MOVE_TIMINGS_SIZE'])
+
+	def record(self, timing):
+		with self._lock:
+			self._timings.append(timing)
+		if (self.slow_move_ms is not None and self.logger is not None and
+			timing.total_ms > self.slow_move_ms):
+			self.logger.warning(f'Slow move: {timing}')
+
+	# Newest first
+	def recent(self):
+		with self._lock:
+			return list(reversed(self._timings))
+
+	# The median and 95th percentile of each phase, over the moves kept.
+	def summary(self):
+		phases = {}
+		for timing in self.recent():
+			for name, kind, seconds in timing.phases:
+				phases.setdefault((name, kind), []).append(seconds * 1e3)
+		ret = {}
+		for (name, kind), times in phases.items():
+			times.sort()
+			ret[name] = {
+				'kind': kind,
+				'count': len(times),
+				'p50_ms': times[len(times) // 2],
+				'p95_ms': times[min(int(len(times) * 0.95), len(times) - 1)]
+			}
+		return ret
@@ -1,7 +1,11 @@
 import click
 from flask import Blueprint
+from dark_chess_api.modules.users.tokens import TokenGenerations
+from dark_chess_api.modules.users.passwords import PasswordHasher
 
 users = Blueprint('users', __name__)
+token_generations = TokenGenerations() # for checking signed tokens
+password_hasher = PasswordHasher() # hashes off the event loop
 
 # cli commands
 
@@ -1,11 +1,15 @@
 # The following auth code is taken almost verbatim from "microblog",
 # (see README.md)
 
-from flask import g
+from flask import g, request, current_app
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
+from werkzeug.local import LocalProxy
 
+from dark_chess_api import db, endpointer
 from dark_chess_api.modules.errors.handlers import error_response
+from dark_chess_api.modules.users import token_generations
 from dark_chess_api.modules.users.models import User, BetaCode
+from dark_chess_api.modules.users.tokens import is_signed, read_token
 
 basic_auth = HTTPBasicAuth()
 token_auth = HTTPTokenAuth()
@@ -16,16 +20,69 @@ def verify_password(username, password):
 	if user is None:
 		return False
 	g.current_user = user
-	return user.check_password(password)
+	g.current_user_id = user.id
+	if not user.check_password(password):
+		return False
+	if user.password_needs_rehash():
+		user.set_password(password)
+		db.session.commit()
+	return True
 
+# Endpoints with a revision (see `Endpointer.route`) can be authenticated twice
+# in one request, and the user needn't be looked up again the second time. It's
+# kept on the request rather than `g`, which can outlive it.
+#
+# Signed tokens (see `tokens.py`) are checked without looking the user up, and
+# `g.current_user` only loads them if it's used. Endpoints that only need to
+# know who's asking should use `g.current_user_id`.
 @token_auth.verify_token
 def verify_token(token):
-	g.current_user = User.get_with_token(token) if token else None
+	if token and getattr(request, 'verified_token', None) == token:
+		return g.current_user is not None
+	request.verified_token = token
+	g.current_user = None
+	g.current_user_id = None
+	if not token:
+		return False
+	if is_signed(token):
+		user_id = read_token(token, token_generations)
+		if user_id is not None:
+			g.current_user = lazy_user(user_id)
+			g.current_user_id = user_id
+	else:
+		g.current_user = User.get_with_token(token)
+		if g.current_user is not None:
+			g.current_user_id = g.current_user.id
 	return g.current_user is not None
 
+# A stand in for the user, which is only looked up if it's used.
+def lazy_user(id):
+	user = None
+	def load():
+		nonlocal user
+		if user is None:
+			user = User.query.get(id)
+		return user
+	return LocalProxy(load)
+
+# Either 401, or 403 for users without the role an endpoint requires.
 @token_auth.error_handler
-def token_auth_error():
-	return error_response(401)
+def token_auth_error(status=401):
+	return error_response(status)
+
+# Admins are whoever's listed in `ADMIN_USERNAMES`, and can use endpoints that
+# require the 'admin' role.
+@token_auth.get_user_roles
+def get_user_roles(auth):
+	if g.current_user.username in current_app.config['ADMIN_USERNAMES']:
+		return ['admin']
+	return []
+
+# Lets the endpointer check who's asking before answering from its cache.
+@endpointer.authenticator('token (bearer)')
+@token_auth.login_required
+def token_identity():
+	return g.current_user_id
 
 # Temporary, should be removed once the application no longer needs it.
 def check_and_assign_beta_code(code, user):
@@ -33,23 +33,29 @@ def aquire_token():
 		200: { 'user': User.mock_dict() },
 		404: None
 	},
+	cache={
+		'ttl': 60,
+		'vary': ['args'],
+		'tags': lambda id: [User.cache_tag(id)]
+	},
 	auth='token (bearer)'
 )
 @token_auth.login_required
 def user_info(id):
-	u = User.query.get_or_404(id)
+	u = User.query.options(*User.as_dict_options()).get_or_404(id)
 	return u.as_dict()
 
 @endpointer.route('/all', methods=['GET'], bp=users,
 	responds={
 		200: ['...', User.mock_dict(), '...']
 	},
+	paginate='users',
 	auth='token (bearer)'
 )
 @token_auth.login_required
-def user_list():
-	us = User.query.all()
-	return jsonify([u.as_dict() for u in us])
+def user_list(page):
+	us = User.query.options(*User.as_dict_options())
+	return [u.as_dict() for u in page.paginate(us, User.id)]
 
 @endpointer.route('/search', methods=['POST'], bp=users,
 	accepts={
@@ -58,12 +64,15 @@ def user_list():
 	responds={
 		200: ['...', User.mock_dict(), '...']
 	},
+	paginate='users',
 	auth='token (bearer)'
 )
 @token_auth.login_required
-def user_search(username):
-	us = User.query.filter(User.username.ilike(f'%{username}%')).all()
-	return jsonify([u.as_dict() for u in us])
+def user_search(page, username):
+	us = User.query.options(*User.as_dict_options()).filter(
+		User.username.ilike(f'%{username}%')
+	)
+	return [u.as_dict() for u in page.paginate(us, User.id)]
 
 # Currently this requires a beta code. Once that period is over, this code
 # should be removed.
@@ -132,6 +141,7 @@ def change_password(id, current_password, new_password):
 		return error_response(403, 'Current password incorrect')
 	u.set_password(new_password)
 	db.session.commit()
+	u.invalidate_cached()
 	return {
 		'message' : 'Successfully changed password',
 		'user' : u.as_dict()
@@ -157,6 +167,8 @@ def invite_friend(id):
 		}, 201
 	g.current_user.invite_friend(u)
 	db.session.commit()
+	g.current_user.invalidate_cached()
+	u.invalidate_cached()
 	return {
 		'message': 'Successfully invited user to be your friend',
 		'user': u.as_dict()
@@ -183,6 +195,8 @@ def accept_friend_invite(id):
 		}, 201
 	g.current_user.accept_friend(u)
 	db.session.commit()
+	g.current_user.invalidate_cached()
+	u.invalidate_cached()
 	return {
 		'message': 'Successfully accepted friend invite',
 		'user': u.as_dict()
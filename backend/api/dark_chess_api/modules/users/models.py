@@ -7,9 +7,11 @@ from datetime import datetime, timedelta, timezone
 
 from flask import current_app
 from sqlalchemy import or_, and_
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import joinedload, selectinload
 
-from dark_chess_api import db, mocker
+from dark_chess_api import db, mocker, endpointer
+from dark_chess_api.modules.users import token_generations, password_hasher
+from dark_chess_api.modules.users.tokens import sign_token
 
 # Yes these three relationships could be configured to reside in a single table
 # with a discriminant Enum column or something, but that only really saves us
@@ -26,6 +28,20 @@ user_friend_invite = db.Table('user_friend_invite',
 	db.Column('invited_id', db.Integer, db.ForeignKey('user.id'), primary_key=True)
 )
  
+# The compact form users take when they're embedded in something else (matches,
+# invites, websocket events), a user reference. See `User.as_ref`. Listings
+# build these straight from the columns they select.
+def user_ref(id, username, rating=None):
+	ret = {
+		'id': id,
+		'username': username
+	}
+	if rating is not None:
+		ret.update({
+			'rating': rating
+		})
+	return ret
+
 class User(db.Model):
 
 	id = db.Column(db.Integer, primary_key=True)
@@ -41,6 +57,11 @@ class User(db.Model):
 	# token auth model taken from "microblog" (see README.md)
 	token = db.Column(db.String(64), index=True, unique=True)
 	token_expiration = db.Column(db.DateTime)
+	# Bumped whenever the user's token is revoked, which turns away any signed
+	# tokens (see `tokens.py`) issued before.
+	token_generation = db.Column(db.Integer, default=0, server_default='0',
+		nullable=False
+	)
 
 	matches = db.relationship('Match',
 		primaryjoin='or_('
@@ -94,7 +115,43 @@ class User(db.Model):
 			]
 		}
 
+	@staticmethod
+	def mock_ref(rating=False):
+		user = User.mock_dict()
+		return user_ref(user['id'], user['username'],
+			user['stats']['rating'] if rating else None
+		)
+
 	### account information methods ###
+
+	# Cached responses made from a user (and their stats and friends) are
+	# tagged with this, and dropped with `invalidate_cached` once changes to
+	# them are committed.
+	@staticmethod
+	def cache_tag(id):
+		return f'user:{id}'
+
+	def invalidate_cached(self):
+		endpointer.invalidate(User.cache_tag(self.id))
+
+	# Loader options for queries whose results will be serialized with
+	# `as_dict`, which would otherwise load each user's stats and friends one
+	# user at a time.
+	@staticmethod
+	def as_dict_options():
+		return (
+			joinedload(User.stat_block),
+			selectinload(User.friends)
+		)
+
+	# Only needs the user's own row, and its stats if asked for the rating, so
+	# unlike `as_dict` (which is kept for the user's own endpoints) building one
+	# never loads anything else.
+	def as_ref(self, rating=False):
+		return user_ref(self.id, self.username,
+			self.stat_block.rating if rating else None
+		)
+
 	def as_dict(self):
 		return {
 			'id' : self.id,
@@ -116,13 +173,20 @@ class User(db.Model):
 
 	### auth methods ###
 	def set_password(self, password):
-		self.password_hash = generate_password_hash(password)
+		self.password_hash = password_hasher.hash(password)
 
 	def check_password(self, password):
-		return check_password_hash(self.password_hash, password)
+		return password_hasher.check(self.password_hash, password)
+
+	# Hashes made with a different algorithm, cost or salt length than is
+	# configured are redone when the password's next given (see `passwords.py`).
+	def password_needs_rehash(self):
+		return password_hasher.needs_rehash(self.password_hash)
 
 	def get_token(self, lifespan_minutes=120):
 		now = datetime.utcnow()
+		if current_app.config['TOKEN_MODE'] == 'signed':
+			return self.get_signed_token(now, lifespan_minutes)
 		# if there is no token, or if the token is fewer than 5 minutes from
 		# expiring, generate a new one.
 		if not self.token or self.token_expiration < now + timedelta(minutes=5):
@@ -132,8 +196,20 @@ class User(db.Model):
 			db.session.commit()
 		return self.token
 
+	# Signed tokens aren't stored, but their expiration is, so that the same
+	# token is given out until it's close to expiring, like database tokens.
+	def get_signed_token(self, now, lifespan_minutes):
+		if (self.token_expiration is None or self.token_generation is None or
+			self.token_expiration < now + timedelta(minutes=5)):
+			self.token_expiration = now + timedelta(minutes=lifespan_minutes)
+			db.session.add(self)
+			db.session.commit()
+		return sign_token(self.id, self.token_expiration, self.token_generation)
+
 	def revoke_token(self):
 		self.token_expiration = datetime.utcnow() - timedelta(seconds=1)
+		self.token_generation = (self.token_generation or 0) + 1
+		token_generations.set(self.id, self.token_generation)
 
 	@staticmethod
 	def get_with_token(token):
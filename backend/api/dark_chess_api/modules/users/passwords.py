@@ -0,0 +1,74 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from dark_chess_api.worker_pool import green
+
+# Password hashing (PBKDF2, by design slow) kept off the event loop. Under
+# eventlet a hash would otherwise stall every greenlet in the worker, websockets
+# included, for as long as it takes, so a burst of logins freezes every live
+# match. When eventlet's monkey patching is in effect hashes are run in its
+# threadpool (`eventlet.tpool`), and otherwise in a pool of threads, which
+# hashlib releases the GIL for. Either way no more than `PASSWORD_HASH_WORKERS`
+# run at once. Any more than there are spare cores and they compete with the
+# event loop's thread for them (with eventlet's default of 20 threads on one
+# core, websockets stall for about as long as they would've without any).
+#
+# The algorithm, cost and salt length come from the config. Hashes made with
+# anything else still check out, and are replaced by a fresh one the next time
+# their user logs in.
+
+class PasswordHasher:
+
+	def __init__(self, app=None):
+		self.method = 'pbkdf2:sha256:150000'
+		self.salt_length = 8
+		self.offload = False
+		self._executor = None
+		self._slots = None
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		algorithm = app.config['PASSWORD_HASH_ALGORITHM']
+		# Raises a ValueError for algorithms hashlib doesn't have.
+		hashlib.new(algorithm)
+		self.method = f'pbkdf2:{algorithm}:{app.config["PASSWORD_HASH_ITERATIONS"]}'
+		self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+		self.offload = app.config['PASSWORD_HASH_OFFLOAD']
+		workers = app.config['PASSWORD_HASH_WORKERS']
+		if self._executor is not None:
+			self._executor.shutdown(wait=False)
+		# Threads are only started as they're needed.
+		self._executor = ThreadPoolExecutor(workers,
+			thread_name_prefix='password-hash'
+		)
+		self._slots = None
+		if green():
+			from eventlet.semaphore import Semaphore
+			self._slots = Semaphore(workers)
+
+	def run(self, f, *args):
+		if not self.offload:
+			return f(*args)
+		if self._slots is not None:
+			from eventlet import tpool
+			with self._slots:
+				return tpool.execute(f, *args)
+		return self._executor.submit(f, *args).result()
+
+	def hash(self, password):
+		return self.run(generate_password_hash, password, self.method,
+			self.salt_length
+		)
+
+	def check(self, pwhash, password):
+		return self.run(check_password_hash, pwhash, password)
+
+	# Whether a hash was made some other way than is configured now.
+	def needs_rehash(self, pwhash):
+		if pwhash.count('$') < 2:
+			return True
+		method, salt, hashval = pwhash.split('$', 2)
+		return method != self.method or len(salt) != self.salt_length
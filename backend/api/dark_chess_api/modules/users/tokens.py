@@ -0,0 +1,95 @@
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from datetime import timezone
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+
+# Signed bearer tokens, issued when `TOKEN_MODE` is 'signed'. They carry the
+# user's id, when they expire, and the user's token generation, signed (HMAC
+# SHA-256) with the app's secret key, so checking one doesn't need the user to
+# be looked up. Revoking a user's token bumps their generation, which every
+# process keeps cached for up to `TOKEN_GENERATION_TTL` seconds, so a token
+# revoked in one process is turned away by the others within that long (and by
+# the one that revoked it straight away).
+#
+# Database tokens are hex, and signed tokens always have a '.' in them, so both
+# are accepted whichever mode tokens are being issued in. Switching modes
+# doesn't log anyone out.
+
+@lru_cache(maxsize=4)
+def serializer(secret_key):
+	return URLSafeSerializer(secret_key, salt='bearer-token',
+		signer_kwargs={ 'digest_method': hashlib.sha256 }
+	)
+
+def is_signed(token):
+	return '.' in token
+
+# `expiration` is a naive UTC datetime, like `User.token_expiration`.
+def sign_token(user_id, expiration, generation):
+	expires = int(expiration.replace(tzinfo=timezone.utc).timestamp())
+	return serializer(current_app.config['SECRET_KEY']).dumps(
+		[user_id, expires, generation]
+	)
+
+# The id of the user the token belongs to, or None if it isn't valid, has
+# expired, or has been revoked.
+def read_token(token, generations):
+	try:
+		user_id, expires, generation = serializer(
+			current_app.config['SECRET_KEY']
+		).loads(token)
+	except (BadSignature, ValueError, TypeError):
+		return None
+	if expires < time.time():
+		return None
+	if generation is None or generations.get(user_id) != generation:
+		return None
+	return user_id
+
+# Each user's current token generation, as last read from the database.
+class TokenGenerations:
+
+	def __init__(self, app=None, ttl=30, size=10000):
+		self.ttl = ttl
+		self.size = size
+		self._generations = OrderedDict()
+		self._lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.ttl = app.config['TOKEN_GENERATION_TTL']
+		self.size = app.config['TOKEN_GENERATION_CACHE_SIZE']
+		self.clear()
+
+	# None for users that don't exist.
+	def get(self, user_id):
+		now = time.monotonic()
+		with self._lock:
+			entry = self._generations.get(user_id)
+			if entry is not None and entry[1] > now:
+				self._generations.move_to_end(user_id)
+				return entry[0]
+		# Avoids circular import issue.
+		from dark_chess_api import db
+		from dark_chess_api.modules.users.models import User
+		generation = db.session.query(User.token_generation).\
+			filter(User.id==user_id).scalar()
+		self.set(user_id, generation)
+		return generation
+
+	def set(self, user_id, generation):
+		with self._lock:
+			self._generations[user_id] = (generation, time.monotonic() + self.ttl)
+			self._generations.move_to_end(user_id)
+			while len(self._generations) > self.size:
+				self._generations.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._generations.clear()
@@ -1,5 +1,29 @@
-from flask import Blueprint
+import click
+from flask import Blueprint, current_app
+from dark_chess_api.modules.websockets.move_buffer import MoveEventBuffer
 
 websockets = Blueprint('websockets', __name__)
 
+move_buffer = MoveEventBuffer() # recent move events, for reconnecting clients
+
+# cli commands
+
+# Runs the stand-in message queue broker, by default at the address the app is
+# configured to use. See `message_queue.py`.
+@websockets.cli.command()
+@click.option('-h', '--host', default=None)
+@click.option('-p', '--port', default=None, type=int)
+def broker(host, port):
+	from dark_chess_api.modules.websockets.message_queue import (
+		LocalBroker, broker_address, broker_authkey
+	)
+	default_host, default_port = broker_address(
+		current_app.config['SOCKETIO_MESSAGE_QUEUE'] or 'local://'
+	)
+	broker = LocalBroker((host or default_host, port or default_port),
+		authkey=broker_authkey(current_app)
+	)
+	print(f'Message queue broker listening at {broker.url}')
+	broker.serve_forever()
+
 from dark_chess_api.modules.websockets import events
\ No newline at end of file
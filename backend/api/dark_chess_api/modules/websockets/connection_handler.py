@@ -1,14 +1,17 @@
 from flask import current_app, g
 from functools import wraps
 from flask_socketio import disconnect
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from dark_chess_api.modules.users import token_generations
 from dark_chess_api.modules.users.models import User
 
 # Token auth is currently not required while the entire model of api calls from
 # the browsers is being reworked. At this point in time, it's seen as ok for
 # clients to connect via ws without any form of authentication beyond the match
-# connection hash, as the api doesn't accept any input over ws, it only outputs
-# events. It's not really a big deal if a malicious user wants to 'listen in'
-# on some random game.
+# connection hash, as that only gets them what spectators see. It's not really
+# a big deal if a malicious user wants to 'listen in' on some random game.
+# Anything more (a side's vision, or making its moves) takes a side token, see
+# below.
 
 # The following method is kept for posterity's sake in case some kind of token
 # authentication is indeed required. If that occurs, the token used should NOT
@@ -29,4 +32,49 @@ from dark_chess_api.modules.users.models import User
 # 				print('No user for auth token, disconnecting.')
 # 			disconnect()
 # 		return func(*args, **kwargs)
-# 	return decorated
\ No newline at end of file
+# 	return decorated
+
+# Each side of a match has its own room, which is sent that side's vision of
+# the board as moves are made, so joining one has to be earned. Players are
+# handed a token for their side along with the match itself, which their
+# connection presents when authenticating. A connection authenticated for a
+# side may also make that side's moves, so the token is as good as the
+# player's api token for that one match, and goes the same way: it expires
+# after `TOKEN_LIFESPAN_MINUTES`, and revoking the player's api token (which
+# bumps their token generation, see `users/tokens.py`) revokes it too. The
+# tokens are signed rather than stored, and only ever handed to the player
+# themselves, over the api.
+
+def side_serializer():
+	return URLSafeTimedSerializer(current_app.config['SECRET_KEY'],
+		salt='match-side'
+	)
+
+def side_token(match, side, user_id):
+	return side_serializer().dumps({
+		'match': match.connection_token,
+		'side': side,
+		'user': user_id,
+		'generation': token_generations.get(user_id)
+	})
+
+# Returns the side the token grants for the given match, or None if it isn't
+# valid for it, has expired, or its player's token has been revoked since.
+def load_side_token(token, connection_token):
+	if token is None:
+		return None
+	try:
+		data = side_serializer().loads(token,
+			max_age=current_app.config['TOKEN_LIFESPAN_MINUTES'] * 60
+		)
+	except BadSignature:
+		return None
+	if not isinstance(data, dict) or data.get('match') != connection_token:
+		return None
+	generation = data.get('generation')
+	if generation is None or token_generations.get(data.get('user')) != generation:
+		return None
+	return data.get('side')
+
+def side_room(connection_token, side):
+	return f'{connection_token}-{side}'
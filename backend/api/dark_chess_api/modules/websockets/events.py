@@ -1,6 +1,12 @@
-from flask import g, current_app
-from flask_socketio import emit, join_room
+import re
+from flask import g, current_app, session
+from flask_socketio import emit, join_room, disconnect
 from dark_chess_api import socketio
+from dark_chess_api.modules.websockets import move_buffer
+from dark_chess_api.modules.matches.models import Match
+from dark_chess_api.modules.websockets.connection_handler import (
+	load_side_token, side_room
+)
 # See the note in `connection_handler.py` concerning this function
 # from dark_chess_api.modules.websockets.connection_handler import (
 # 	token_auth_required
@@ -15,16 +21,124 @@ def handle_connect():
 	if current_app.config['DEBUG']:
 		current_app.logger.info('(WS) Client connection event.')
 
+# Clients without a valid side token are spectators. Nones for payloads
+# without a connection token, which are turned away.
+def client_side(json):
+	if not isinstance(json, dict):
+		return None, None
+	connection_token = json.get('connectionToken')
+	if not isinstance(connection_token, str):
+		return None, None
+	side = load_side_token(json.get('sideToken'), connection_token)
+	return connection_token, side if side is not None else 'spectating'
+
+# Every client joins the match's room, and the room for its side.
+#
+# Clients reconnecting to a match they were already following send the last
+# ply they saw (`lastSeenPly`), and are caught up with the move events they
+# missed if those are still buffered, or a snapshot otherwise.
 @socketio.on('authenticate', namespace='/match-moves')
 def handle_authenticate(json):
+	connection_token, side = client_side(json)
+	if connection_token is None:
+		if current_app.config['DEBUG']:
+			current_app.logger.info('(WS) No connection token, disconnecting.')
+		disconnect()
+		return
+	last_seen_ply = json.get('lastSeenPly')
 	if current_app.config['DEBUG']:
-		current_app.logger.info(f'(WS) Client successfully authenticated. Connected from match {json["connectionToken"]}')
-		current_app.logger.info(f'(WS) Client joining room: {json["connectionToken"]}')
-	join_room(json['connectionToken'])
+		current_app.logger.info(f'(WS) Client successfully authenticated. Connected from match {connection_token}')
+		current_app.logger.info(f'(WS) Client joining room: {connection_token} ({side})')
+	join_room(connection_token)
+	join_room(side_room(connection_token, side))
+	# Remembered for the rest of the connection, for moves made over it.
+	session['connection_token'] = connection_token
+	session['side'] = side
+	session['side_token'] = json.get('sideToken')
+	emit('authenticated', { 'side': side })
+	if last_seen_ply is not None:
+		catch_up(connection_token, side, last_seen_ply)
 	# emit('authenticated', {
 	# 	'msg': f'user ({g.current_user.username}:{g.current_user.id}) authenticated'
 	# })
 
+# Clients that miss a move (see `broadcast_move_made`) ask for the whole
+# position again, which is sent to them alone.
+@socketio.on('request-snapshot', namespace='/match-moves')
+def handle_request_snapshot(json):
+	connection_token, side = client_side(json)
+	if connection_token is None:
+		return
+	match = Match.query.filter_by(connection_token=connection_token).first()
+	if match is None or match.current_state is None:
+		return
+	emit('snapshot', side_snapshot(match, side))
+
+# The buffer only has the moves this process sent, so it's checked against the
+# match itself, in case other processes (sharing a message queue) have sent
+# moves since.
+def catch_up(connection_token, side, last_seen_ply):
+	match = Match.query.filter_by(connection_token=connection_token).first()
+	if match is None or match.current_state is None:
+		return
+	missed = move_buffer.since(connection_token, side, last_seen_ply)
+	if missed is not None and last_seen_ply + len(missed) >= match.ply_count:
+		for event in missed:
+			emit('move-delta', event)
+		return
+	if match.ply_count != last_seen_ply or match.is_finished:
+		emit('snapshot', side_snapshot(match, side))
+
+# Players can make their moves over the connection they authenticated, rather
+# than through the api, acting as whichever player has the side their token
+# granted. The reply is sent as the event's acknowledgement, with the status
+# and message the api would have answered with, and if the move was made, the
+# side's new position. Everyone, the mover included, is sent the move as usual.
+@socketio.on('make-move', namespace='/match-moves')
+def handle_make_move(json):
+	# Avoids circular import issue.
+	from dark_chess_api.modules.matches import move_timings
+	from dark_chess_api.modules.matches.endpoints import play_move, UCI_PATTERN
+	from dark_chess_api.modules.matches.timing import MoveTiming
+
+	side = session.get('side')
+	if side not in ['white', 'black']:
+		return { 'status': 403, 'message': 'Player not playing this match' }
+	# The side token's checked again, as it may have expired or been revoked
+	# since the connection authenticated.
+	if load_side_token(session.get('side_token'),
+		session.get('connection_token')) != side:
+		return { 'status': 401, 'message': 'Side token expired or revoked' }
+	uci_string = json.get('uci_string') if isinstance(json, dict) else None
+	if not isinstance(uci_string, str) or not re.match(UCI_PATTERN, uci_string):
+		return { 'status': 400, 'message': 'Invalid uci string' }
+	timing = MoveTiming(None, uci_string, 'websocket')
+	try:
+		with timing.phase('load', 'db'):
+			match = Match.query.filter_by(
+				connection_token=session['connection_token']
+			).first()
+		if match is None:
+			timing.status = 404
+			return { 'status': 404, 'message': 'Match not found' }
+		timing.match_id = match.id
+		player = match.player_white if side == 'white' else match.player_black
+		refusal = play_move(match, player, uci_string, timing)
+		if refusal is not None:
+			status, message = refusal
+			timing.status = status
+			return { 'status': status, 'message': message }
+		with timing.phase('serialize', 'serialization'):
+			state = side_snapshot(match, side)
+		timing.status = 200
+		return {
+			'status': 200,
+			'message': 'Move successfully made',
+			'state': state
+		}
+	finally:
+		move_timings.record(timing)
+
 @socketio.on('disconnect', namespace='/match-moves')
 def handle_disconnect():
 	if current_app.config['DEBUG']:
@@ -37,19 +151,66 @@ def handle_disconnect():
 def broadcast_match_begun(connection_token):
 	socketio.emit('match-begun', room=connection_token, namespace='/match-moves')
 
-def broadcast_move_made(player, move, current_fen, connection_token):
-	socketio.emit('move-made', {
-			'player': player.as_dict(),
-			'current_fen': current_fen,
-			'uci_string': move
-		},
-		room=connection_token,
-		namespace='/match-moves'
-	)
+# Moves are sent as deltas: each side is sent only the squares of its vision
+# of the board that the move changed, and spectators the squares of the whole
+# board that did. That, along with whose turn it now is and the moves they
+# have, is everything a client needs to carry on without asking the api for
+# the match again. The move itself is only sent back to the side that made it.
+#
+# Deltas are numbered by ply (`seq`), and only apply on top of the one before.
+# A client that finds it's missed one asks for a snapshot instead.
+def broadcast_move_made(match, player, move):
+	moving_side = 'white' if player.id == match.player_white_id else 'black'
+	event = {
+		'seq': match.ply_count,
+		'player': player.as_ref(),
+		'current_side': match.current_side,
+		'current_player_id': match.current_player_id
+	}
+	side_events = {
+		side: {
+			**event,
+			'uci_string': move if side == moving_side else None,
+			'squares': match.vision_delta(side),
+			'possible_moves': match.possible_moves_as_names(side)
+		} for side in ['white', 'black']
+	}
+	side_events['spectating'] = {
+		**event,
+		'squares': match.vision_delta('spectating')
+	}
+	for side, side_event in side_events.items():
+		move_buffer.record(match.connection_token, side, side_event)
+		socketio.emit('move-delta', side_event,
+			room=side_room(match.connection_token, side),
+			namespace='/match-moves'
+		)
+
+# The whole position as seen by `side`, numbered the same way as the deltas.
+# Once a match is finished there's nothing left to hide, so everyone is sent
+# the full board, just as the api would.
+def side_snapshot(match, side):
+	snapshot = {
+		'seq': match.ply_count,
+		'is_finished': match.is_finished,
+		'current_side': match.current_side,
+		'current_player_id': match.current_player_id
+	}
+	if match.in_progress and side != 'spectating':
+		snapshot.update({
+			'current_dark_fen': match.current_dark_fen(side),
+			'possible_moves': match.possible_moves_as_names(side)
+		})
+	else:
+		snapshot.update({
+			'current_fen': match.current_expanded_fen
+		})
+	return snapshot
 
 def broadcast_match_finish(winning_player, connection_token):
+	move_buffer.discard(connection_token)
 	socketio.emit('match-finish', {
-			'winning_player': winning_player.as_dict(),
+			'winning_player': winning_player.as_ref(rating=True),
 		},
 		room=connection_token,
 		namespace='/match-moves'
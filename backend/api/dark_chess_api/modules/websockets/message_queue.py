@@ -0,0 +1,156 @@
+import time
+import threading
+from urllib.parse import urlparse
+from multiprocessing.connection import Listener, Client
+
+import socketio as python_socketio
+
+# Events are only sent to the clients connected to the process that sent them,
+# unless the processes share a message queue, through which every event is
+# passed on to every process. Any url Flask-SocketIO understands can be given
+# as `SOCKETIO_MESSAGE_QUEUE` (redis, or anything kombu supports, with those
+# packages installed), or a `local://host:port` url for the broker below.
+
+# The client manager to give SocketIO for the configured message queue, if any.
+# These are made here rather than by SocketIO itself, as it keeps whatever it's
+# given across calls to `init_app`, and so an app without a queue would end up
+# with the manager of the last app that had one.
+def client_manager(app):
+	url = app.config['SOCKETIO_MESSAGE_QUEUE']
+	channel = app.config['SOCKETIO_CHANNEL']
+	if not url:
+		return None
+	if url.startswith('local://'):
+		return LocalQueueManager(url,
+			channel=channel,
+			authkey=broker_authkey(app)
+		)
+	if url.startswith(('redis://', 'rediss://')):
+		return python_socketio.RedisManager(url, channel=channel)
+	return python_socketio.KombuManager(url, channel=channel)
+
+# Messages are pickled, so the broker has to know who's connecting. With an
+# empty authkey, multiprocessing skips authenticating connections altogether.
+def broker_authkey(app):
+	if not app.config.get('SECRET_KEY'):
+		raise ValueError('SECRET_KEY must be set to use a local:// message queue')
+	return app.config['SECRET_KEY'].encode()
+
+def broker_address(url):
+	url = urlparse(url)
+	return (url.hostname or '127.0.0.1', url.port or 6380)
+
+# A stand-in for a real message queue, for running a handful of workers on one
+# machine, or in tests, without needing one. Every message a publisher sends is
+# passed on to every subscriber, in the order received. Nothing's kept for
+# subscribers that aren't connected at the time, and a slow subscriber holds
+# up the rest, so it's no replacement for redis in production. Connections
+# are authenticated with the app's secret key.
+#
+# Run one with `flask websockets broker`.
+class LocalBroker:
+
+	def __init__(self, address=('127.0.0.1', 0), authkey=b''):
+		if not authkey:
+			raise ValueError('The broker needs an authkey')
+		self._listener = Listener(address, backlog=64, authkey=authkey)
+		self.address = self._listener.address
+		self._subscribers = []
+		self._lock = threading.Lock()
+		self._closed = False
+
+	@property
+	def url(self):
+		return f'local://{self.address[0]}:{self.address[1]}'
+
+	def start(self):
+		threading.Thread(target=self.serve_forever, daemon=True).start()
+		return self
+
+	def serve_forever(self):
+		while not self._closed:
+			try:
+				connection = self._listener.accept()
+			except Exception:
+				# Connections that fail to authenticate, or the listener having
+				# been closed
+				continue
+			threading.Thread(target=self._serve,
+				args=(connection,),
+				daemon=True
+			).start()
+
+	# The first message on every connection says what it's for.
+	def _serve(self, connection):
+		try:
+			role = connection.recv()
+			if role == 'subscribe':
+				with self._lock:
+					self._subscribers.append(connection)
+				return
+			while True:
+				self.publish(connection.recv())
+		except (EOFError, OSError):
+			connection.close()
+
+	def publish(self, message):
+		with self._lock:
+			for subscriber in list(self._subscribers):
+				try:
+					subscriber.send(message)
+				except (EOFError, OSError):
+					self._subscribers.remove(subscriber)
+
+	def close(self):
+		self._closed = True
+		self._listener.close()
+		with self._lock:
+			for subscriber in self._subscribers:
+				subscriber.close()
+			self._subscribers = []
+
+# The client manager for a `LocalBroker`. Messages are sent along with the
+# channel they're for, and every other channel's are ignored. If the broker
+# goes away, publishing raises, and listening retries until it's back.
+class LocalQueueManager(python_socketio.PubSubManager):
+
+	name = 'local'
+
+	def __init__(self, url, channel='flask-socketio', write_only=False,
+		authkey=b'', logger=None):
+		if not authkey:
+			raise ValueError('The broker needs an authkey')
+		super().__init__(channel=channel, write_only=write_only, logger=logger)
+		self.address = broker_address(url)
+		self.authkey = authkey
+		self._publisher = None
+		self._publisher_lock = threading.Lock()
+
+	def _connect(self, role):
+		connection = Client(self.address, authkey=self.authkey)
+		connection.send(role)
+		return connection
+
+	def _publish(self, data):
+		with self._publisher_lock:
+			try:
+				if self._publisher is None:
+					self._publisher = self._connect('publish')
+				self._publisher.send((self.channel, data))
+			except (EOFError, OSError):
+				# Once more with a fresh connection, in case the broker was
+				# restarted since the last message.
+				self._publisher = self._connect('publish')
+				self._publisher.send((self.channel, data))
+
+	def _listen(self):
+		while True:
+			try:
+				connection = self._connect('subscribe')
+				while True:
+					channel, data = connection.recv()
+					if channel == self.channel:
+						yield data
+			except (EOFError, OSError):
+				self._get_logger().error('Lost the message queue, retrying')
+				time.sleep(1)
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict, deque
+
+# Keeps the most recent move deltas sent to each side of each match, so that a
+# client that reconnects can be sent just the ones it missed rather than
+# reloading the whole match. Both the number of events kept per side and the
+# number of matches kept are bounded. The match that was least recently moved
+# in is the first to go, and a finished match is dropped straight away, since
+# there's nothing left to catch up on.
+#
+# The buffer lives in the memory of the process that broadcast the moves, and
+# so can be missing the latest of them (when another process handled those) as
+# well as older ones (after a restart). What it has is checked against the
+# match's ply before it's used, and a client that can't be caught up from it
+# is sent a snapshot instead, so it's only ever a shortcut.
+class MoveEventBuffer:
+
+	def __init__(self, app=None, size=32, max_matches=1000):
+		self.size = size
+		self.max_matches = max_matches
+		self._matches = OrderedDict()
+		self._lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.size = app.config['MOVE_EVENT_BUFFER_SIZE']
+		self.max_matches = app.config['MOVE_EVENT_BUFFER_MATCHES']
+		self.clear()
+
+	def clear(self):
+		with self._lock:
+			self._matches.clear()
+
+	def record(self, connection_token, side, event):
+		with self._lock:
+			sides = self._matches.get(connection_token)
+			if sides is None:
+				sides = self._matches[connection_token] = {}
+			else:
+				self._matches.move_to_end(connection_token)
+			if side not in sides:
+				sides[side] = deque(maxlen=self.size)
+			sides[side].append(event)
+			while len(self._matches) > self.max_matches:
+				self._matches.popitem(last=False)
+
+	def discard(self, connection_token):
+		with self._lock:
+			self._matches.pop(connection_token, None)
+
+	# The events `side` has been sent since `ply`, in order, or None if they
+	# aren't all in the buffer.
+	def since(self, connection_token, side, ply):
+		with self._lock:
+			events = self._matches.get(connection_token, {}).get(side)
+			if not events or ply > events[-1]['seq']:
+				return None
+			missed = [event for event in events if event['seq'] > ply]
+		if [event['seq'] for event in missed] != list(
+			range(ply + 1, ply + 1 + len(missed))
+		):
+			return None
+		return missed
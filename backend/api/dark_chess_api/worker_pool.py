@@ -0,0 +1,309 @@
+import sys
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from dark_chess_api.endpoint_handler.metrics import escape
+
+# A pool of workers for CPU bound work (replaying long match histories, for
+# one), which would otherwise run on the event loop under eventlet and stall
+# every other greenlet in the worker, websocket broadcasts included, until it
+# was done. Jobs are plain functions of plain data (lists of fens, say), as
+# they're pickled off to another process.
+#
+# Processes are used unless `OFFLOAD_MODE` is 'thread', or they can't be
+# started. Threads don't help much with pure python work (the GIL sees to
+# that), but under eventlet they at least keep it off the event loop. No more
+# than `OFFLOAD_WORKERS` jobs run at once, and no more than
+# `OFFLOAD_QUEUE_SIZE` wait for them. Jobs beyond that are turned away with
+# `WorkerPoolFull` (a 503 for requests), rather than queueing up behind each
+# other indefinitely. With no workers, jobs are run where they're asked for.
+
+# Whether eventlet's monkey patching is in effect, in which case threads are
+# green, and real ones have to come from its threadpool.
+def green():
+	if 'eventlet' not in sys.modules:
+		return False
+	from eventlet import patcher
+	return patcher.is_monkey_patched('thread')
+
+class WorkerPoolFull(Exception):
+	pass
+
+# Raised for a worker process that died (or was killed) before it answered,
+# as opposed to whatever the job itself raised.
+class WorkerProcessDied(Exception):
+	pass
+
+# Runs in the worker, so that time spent waiting for one can be told apart
+# from time spent working.
+def timed_call(f, *args):
+	start = time.perf_counter()
+	result = f(*args)
+	return result, time.perf_counter() - start
+
+# The loop run by worker processes, one job at a time until the pipe's closed.
+def serve(conn):
+	while True:
+		try:
+			f, args = conn.recv()
+		except (EOFError, OSError):
+			return
+		try:
+			reply = (True, timed_call(f, *args))
+		except Exception as e:
+			reply = (False, e)
+		try:
+			conn.send(reply)
+		except Exception as e:
+			# The result (or exception) couldn't be pickled.
+			conn.send((False, RuntimeError(f'{f.__name__}: {e!r}')))
+
+# A worker process and its end of the pipe to it. concurrent.futures'
+# ProcessPoolExecutor isn't used, as under eventlet its management thread is
+# green and the interpreter hangs at exit waiting on it. Here the pipe is only
+# ever waited on by a real thread (eventlet's threadpool) or a request's own,
+# and workers are daemons, which multiprocessing terminates at exit.
+class WorkerProcess:
+
+	def __init__(self, context):
+		self.conn, child = context.Pipe()
+		self.process = context.Process(target=serve, args=(child,),
+			name='worker-pool', daemon=True
+		)
+		self.process.start()
+		child.close()
+
+	def call(self, f, *args):
+		try:
+			self.conn.send((f, args))
+			ok, value = self.conn.recv()
+		except (EOFError, OSError) as e:
+			raise WorkerProcessDied(f'{f.__name__}: {e!r}') from e
+		if not ok:
+			raise value
+		return value
+
+	def close(self, wait=False):
+		self.conn.close()
+		if wait:
+			self.process.join()
+
+class JobStats:
+
+	def __init__(self):
+		self.outcomes = {}
+		self.wait_seconds = 0.0
+		self.run_seconds = 0.0
+
+	def as_dict(self):
+		return {
+			'outcomes': dict(self.outcomes),
+			'wait_seconds': self.wait_seconds,
+			'run_seconds': self.run_seconds
+		}
+
+class WorkerPool:
+
+	def __init__(self, app=None):
+		self.workers = 0
+		self.queue_size = 0
+		self.mode = 'thread'
+		self.logger = None
+		self._idle = queue.Queue()
+		self._threads = None
+		self._slots = None
+		self._running = None
+		self._in_flight = 0
+		self._jobs = {}
+		self._lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.shutdown()
+		self.workers = app.config['OFFLOAD_WORKERS']
+		self.queue_size = app.config['OFFLOAD_QUEUE_SIZE']
+		self.mode = app.config['OFFLOAD_MODE']
+		if self.mode not in ('process', 'thread'):
+			raise ValueError(f'Unknown OFFLOAD_MODE {self.mode}')
+		self.logger = app.logger
+		# Under eventlet these are green, as they should be.
+		self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+		# How many of eventlet's threads jobs can have (it has 20).
+		self._running = threading.BoundedSemaphore(max(self.workers, 1))
+		with self._lock:
+			self._idle = self.places()
+			self._in_flight = 0
+			self._jobs = {}
+
+	# Idle worker processes wait in a queue, which starts out with a free place
+	# (a None) for each worker instead, for one to be started in once it's
+	# needed. A worker that dies gives its place back, and so whoever's waiting
+	# for a worker always gets either one or a place for one.
+	def places(self):
+		idle = queue.Queue()
+		for i in range(self.workers):
+			idle.put(None)
+		return idle
+
+	# Workers busy with a job are closed once they're done with it.
+	def shutdown(self, wait=False):
+		with self._lock:
+			idle, self._idle = self._idle, self.places()
+			threads, self._threads = self._threads, None
+		while True:
+			try:
+				process = idle.get_nowait()
+			except queue.Empty:
+				break
+			if process is not None:
+				process.close(wait)
+		if threads is not None:
+			threads.shutdown(wait=wait)
+
+	# Calls `f(*args)` in a worker and returns what it returns, or raises
+	# what it raises.
+	def run(self, f, *args):
+		name = f.__name__
+		if self.workers <= 0:
+			result, seconds = timed_call(f, *args)
+			self.record(name, 'inline', 0.0, seconds)
+			return result
+		if not self._slots.acquire(blocking=False):
+			self.record(name, 'rejected')
+			raise WorkerPoolFull(f'{name}: {self.workers} running and '
+				f'{self.queue_size} queued already')
+		with self._lock:
+			self._in_flight += 1
+		start = time.perf_counter()
+		try:
+			result, seconds = self.submit(f, *args)
+		except Exception:
+			self.record(name, 'failed', time.perf_counter() - start)
+			raise
+		finally:
+			with self._lock:
+				self._in_flight -= 1
+			self._slots.release()
+		self.record(name, 'completed', time.perf_counter() - start - seconds,
+			seconds
+		)
+		return result
+
+	def submit(self, f, *args):
+		idle, process = self.checkout() if self.mode == 'process' else (None, None)
+		if process is not None:
+			try:
+				return self.blocking(process.call, f, *args)
+			except WorkerProcessDied:
+				# Its place is given back, for another to be started in by the
+				# next job, and this one makes do with a thread.
+				self.logger.warning('Worker process died, replacing it')
+				process.close()
+				process = None
+			finally:
+				self.checkin(idle, process)
+		if green():
+			with self._running:
+				return self.blocking(timed_call, f, *args)
+		return self.threads().submit(timed_call, f, *args).result()
+
+	# Waits on `f(*args)` from a real thread under eventlet, so that only the
+	# greenlet asking waits.
+	def blocking(self, f, *args):
+		if green():
+			from eventlet import tpool
+			return tpool.execute(f, *args)
+		return f(*args)
+
+	# An idle worker process (and the queue it goes back to), waiting for one
+	# if all of them are busy. Workers are spawned rather than forked, which
+	# isn't safe with eventlet's hub (or any other threads) running. Nones if
+	# they can't be started at all, in which case the place is passed on, so
+	# that everyone else waiting finds that out too.
+	def checkout(self):
+		with self._lock:
+			idle = self._idle
+		process = idle.get()
+		if process is None and self.mode == 'process':
+			try:
+				process = WorkerProcess(multiprocessing.get_context('spawn'))
+			except (OSError, ImportError, NotImplementedError) as e:
+				self.logger.warning(
+					f'Worker processes unavailable ({e}), using threads'
+				)
+				self.mode = 'thread'
+		if process is None:
+			idle.put(None)
+			return None, None
+		return idle, process
+
+	# Gives back a worker process, or its place if it's gone.
+	def checkin(self, idle, process):
+		with self._lock:
+			current = idle is self._idle
+		if current:
+			idle.put(process)
+		elif process is not None:
+			process.close()
+
+	def threads(self):
+		with self._lock:
+			if self._threads is None:
+				self._threads = ThreadPoolExecutor(self.workers,
+					thread_name_prefix='worker-pool'
+				)
+			return self._threads
+
+	def record(self, name, outcome, wait_seconds=0.0, run_seconds=0.0):
+		with self._lock:
+			stats = self._jobs.get(name)
+			if stats is None:
+				stats = self._jobs[name] = JobStats()
+			stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+			stats.wait_seconds += wait_seconds
+			stats.run_seconds += run_seconds
+
+	def stats(self):
+		with self._lock:
+			return {
+				'mode': self.mode,
+				'workers': self.workers,
+				'queue_size': self.queue_size,
+				'in_flight': self._in_flight,
+				'jobs': { name: stats.as_dict() for name, stats in self._jobs.items() }
+			}
+
+	# For `/metrics`, in Prometheus' text format.
+	def prometheus_text(self):
+		stats = self.stats()
+		lines = [
+			'# HELP worker_pool_jobs_total Jobs given to the worker pool, by job and outcome.',
+			'# TYPE worker_pool_jobs_total counter'
+		]
+		for name, job in sorted(stats['jobs'].items()):
+			for outcome, count in sorted(job['outcomes'].items()):
+				lines.append(f'worker_pool_jobs_total{{job="{escape(name)}",'
+					f'outcome="{outcome}"}} {count}')
+		for kind, description in [('wait', 'waiting for a worker'),
+			('run', 'running')]:
+			metric = f'worker_pool_job_{kind}_seconds_total'
+			lines += [
+				f'# HELP {metric} Time jobs spent {description}, by job.',
+				f'# TYPE {metric} counter'
+			]
+			for name, job in sorted(stats['jobs'].items()):
+				lines.append(f'{metric}{{job="{escape(name)}"}} '
+					f'{job[f"{kind}_seconds"]}')
+		for gauge, description in [('in_flight', 'Jobs running or queued.'),
+			('workers', 'Jobs that can run at once.'),
+			('queue_size', 'Jobs that can wait for a worker.')]:
+			lines += [
+				f'# HELP worker_pool_{gauge} {description}',
+				f'# TYPE worker_pool_{gauge} gauge',
+				f'worker_pool_{gauge} {stats[gauge]}'
+			]
+		return '\n'.join(lines) + '\n'
@@ -0,0 +1,74 @@
+"""match state ply and current state
+
+Revision ID: a7d4e0b1c9f2
+Revises: 3f1a9c2e7b4d
+Create Date: 2026-10-18 11:03:27.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e0b1c9f2'
+down_revision = '3f1a9c2e7b4d'
+branch_labels = None
+depends_on = None
+
+
+match_table = sa.table('match',
+    sa.column('id', sa.Integer),
+    sa.column('current_state_id', sa.Integer)
+)
+
+match_state_table = sa.table('match_state',
+    sa.column('id', sa.Integer),
+    sa.column('match_id', sa.Integer),
+    sa.column('ply', sa.Integer)
+)
+
+
+def upgrade():
+    op.add_column('match_state', sa.Column('ply', sa.Integer(), nullable=True))
+    with op.batch_alter_table('match') as batch_op:
+        batch_op.add_column(sa.Column('current_state_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_match_current_state_id_match_state',
+            'match_state', ['current_state_id'], ['id']
+        )
+
+    # Up until now states have only ever been appended, so their ids give the
+    # order they were played in.
+    conn = op.get_bind()
+    states = conn.execute(
+        sa.select([match_state_table.c.id, match_state_table.c.match_id])
+        .order_by(match_state_table.c.match_id, match_state_table.c.id)
+    ).fetchall()
+    plies = {}
+    current_states = {}
+    for state_id, match_id in states:
+        plies[match_id] = plies.get(match_id, -1) + 1
+        current_states[match_id] = state_id
+        conn.execute(
+            match_state_table.update()
+            .where(match_state_table.c.id == state_id)
+            .values(ply=plies[match_id])
+        )
+    for match_id, state_id in current_states.items():
+        conn.execute(
+            match_table.update()
+            .where(match_table.c.id == match_id)
+            .values(current_state_id=state_id)
+        )
+
+    with op.batch_alter_table('match_state') as batch_op:
+        batch_op.alter_column('ply', existing_type=sa.Integer(), nullable=False)
+    op.create_index('ix_match_state_match_id_ply', 'match_state', ['match_id', 'ply'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_match_state_match_id_ply', table_name='match_state')
+    with op.batch_alter_table('match') as batch_op:
+        batch_op.drop_constraint('fk_match_current_state_id_match_state', type_='foreignkey')
+        batch_op.drop_column('current_state_id')
+    with op.batch_alter_table('match_state') as batch_op:
+        batch_op.drop_column('ply')
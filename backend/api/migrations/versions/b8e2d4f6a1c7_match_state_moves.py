@@ -0,0 +1,62 @@
+"""match state moves
+
+Revision ID: b8e2d4f6a1c7
+Revises: f1d7c3a9b5e2
+Create Date: 2026-10-18 16:40:12.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import chess
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d4f6a1c7'
+down_revision = 'f1d7c3a9b5e2'
+branch_labels = None
+depends_on = None
+
+
+match_state_table = sa.table('match_state',
+    sa.column('id', sa.Integer),
+    sa.column('match_id', sa.Integer),
+    sa.column('ply', sa.Integer),
+    sa.column('fen', sa.String),
+    sa.column('move', sa.SmallInteger)
+)
+
+
+def upgrade():
+    op.add_column('match_state', sa.Column('move', sa.SmallInteger(), nullable=True))
+    with op.batch_alter_table('match_state') as batch_op:
+        batch_op.alter_column('fen', existing_type=sa.String(length=256), nullable=True)
+
+
+def downgrade():
+    # States stored compactly have no fen, so they're replayed from the last one
+    # that does before the column can be made non nullable again. Their dark
+    # fens are left for `flask matches backfill` to render.
+    conn = op.get_bind()
+    states = conn.execute(
+        sa.select([
+            match_state_table.c.id,
+            match_state_table.c.match_id,
+            match_state_table.c.fen,
+            match_state_table.c.move
+        ]).order_by(match_state_table.c.match_id, match_state_table.c.ply)
+    ).fetchall()
+    board = None
+    for state_id, match_id, fen, move in states:
+        if fen is not None:
+            board = chess.Board(fen=fen)
+            continue
+        board.push(chess.Move(move & 0x3f, move >> 6 & 0x3f, (move >> 12) or None))
+        conn.execute(
+            match_state_table.update()
+            .where(match_state_table.c.id == state_id)
+            .values(fen=board.fen())
+        )
+
+    with op.batch_alter_table('match_state') as batch_op:
+        batch_op.alter_column('fen', existing_type=sa.String(length=256), nullable=False)
+        batch_op.drop_column('move')
@@ -0,0 +1,93 @@
+"""match turn columns
+
+Revision ID: f1d7c3a9b5e2
+Revises: e4f6a2c8d1b3
+Create Date: 2026-10-18 15:21:37.902614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1d7c3a9b5e2'
+down_revision = 'e4f6a2c8d1b3'
+branch_labels = None
+depends_on = None
+
+
+match_table = sa.table('match',
+    sa.column('id', sa.Integer),
+    sa.column('player_white_id', sa.Integer),
+    sa.column('player_black_id', sa.Integer),
+    sa.column('is_finished', sa.Boolean),
+    sa.column('current_state_id', sa.Integer),
+    sa.column('ply_count', sa.Integer),
+    sa.column('side_to_move', sa.String),
+    sa.column('last_move_at', sa.DateTime),
+    sa.column('current_player_id', sa.Integer)
+)
+
+match_state_table = sa.table('match_state',
+    sa.column('id', sa.Integer),
+    sa.column('ply', sa.Integer),
+    sa.column('created_on', sa.DateTime)
+)
+
+
+def upgrade():
+    with op.batch_alter_table('match') as batch_op:
+        batch_op.add_column(sa.Column('ply_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('side_to_move', sa.String(length=5), nullable=True))
+        batch_op.add_column(sa.Column('last_move_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('current_player_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_match_current_player_id_user',
+            'user', ['current_player_id'], ['id']
+        )
+
+    # Every match starts from the standard position, so the side to move
+    # follows from the ply of its current state.
+    conn = op.get_bind()
+    matches = conn.execute(
+        sa.select([
+            match_table.c.id,
+            match_table.c.player_white_id,
+            match_table.c.player_black_id,
+            match_table.c.is_finished,
+            match_state_table.c.ply,
+            match_state_table.c.created_on
+        ]).select_from(match_table.outerjoin(match_state_table,
+            match_table.c.current_state_id == match_state_table.c.id
+        ))
+    ).fetchall()
+    for match_id, white_id, black_id, is_finished, ply, created_on in matches:
+        values = { 'ply_count': 0 }
+        if ply is not None:
+            side = 'white' if ply % 2 == 0 else 'black'
+            values.update({
+                'ply_count': ply,
+                'side_to_move': side,
+                'last_move_at': created_on,
+                'current_player_id': None if is_finished else (
+                    white_id if side == 'white' else black_id
+                )
+            })
+        conn.execute(
+            match_table.update()
+            .where(match_table.c.id == match_id)
+            .values(**values)
+        )
+
+    with op.batch_alter_table('match') as batch_op:
+        batch_op.alter_column('ply_count', existing_type=sa.Integer(), nullable=False)
+    op.create_index(op.f('ix_match_current_player_id'), 'match', ['current_player_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_match_current_player_id'), table_name='match')
+    with op.batch_alter_table('match') as batch_op:
+        batch_op.drop_constraint('fk_match_current_player_id_user', type_='foreignkey')
+        batch_op.drop_column('current_player_id')
+        batch_op.drop_column('last_move_at')
+        batch_op.drop_column('side_to_move')
+        batch_op.drop_column('ply_count')
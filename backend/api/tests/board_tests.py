@@ -0,0 +1,124 @@
+import random
+import unittest
+import chess
+from dark_chess_api.modules.matches.models import DarkBoard
+
+# The original, move-list based implementation of `DarkBoard.dark_fen`, kept
+# here as the reference the bitboard implementation must agree with.
+def reference_dark_fen(fen, side):
+	board = chess.Board(fen=fen)
+	player_side = chess.WHITE if side == 'white' else chess.BLACK
+	board.turn = player_side
+	attackable_squares = []
+	for move in board.pseudo_legal_moves:
+		attackable_squares.append(move.from_square)
+		attackable_squares.append(move.to_square)
+	dfen = ''
+	for rank in range(7, -1, -1):
+		for file in range(8):
+			square = chess.square(file, rank)
+			piece = board.piece_at(square)
+			if (square in attackable_squares or
+				(piece is not None and piece.color == player_side)):
+				dfen += piece.symbol() if piece is not None else '_'
+			else:
+				dfen += '?'
+		if rank > 0:
+			dfen += '/'
+	return dfen
+
+# Plays out random dark chess games (pseudo-legal moves, ending on king capture)
+# and collects every position along the way.
+def random_game_fens(games, seed=0, max_plies=120):
+	rng = random.Random(seed)
+	fens = []
+	for i in range(games):
+		board = DarkBoard()
+		fens.append(board.fen())
+		for ply in range(max_plies):
+			moves = list(board.pseudo_legal_moves)
+			if not moves:
+				break
+			board.push(rng.choice(moves))
+			fens.append(board.fen())
+			if board.king_captured():
+				break
+	return fens
+
+class DarkBoardTestCases(unittest.TestCase):
+
+	def test_dark_fen_matches_reference(self):
+		fens = random_game_fens(15)
+		fens += [
+			# castling through and out of attacked squares
+			'r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1',
+			'r3k2r/8/8/8/8/5q2/8/R3K2R w KQkq - 0 1',
+			'r3k2r/8/5Q2/8/8/8/8/R3K2R b KQkq - 0 1',
+			# en passant available to either side
+			'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3',
+			'rnbqkbnr/pppp1ppp/8/8/3Pp3/8/PPP1PPPP/RNBQKBNR b KQkq d3 0 3',
+			# promotions and a captured king
+			'8/1P4k1/8/8/8/8/6p1/4K2R w K - 0 1',
+			'rnb1kbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBq1BNR w kq - 0 4'
+		]
+		for fen in fens:
+			for side in ['white', 'black', None]:
+				self.assertEqual(
+					reference_dark_fen(fen, side),
+					DarkBoard(fen=fen).dark_fen(side),
+					f'{fen} ({side})'
+				)
+
+	def test_vision_mask(self):
+		board = DarkBoard()
+		mask = board.vision_mask('white')
+		self.assertEqual(chess.BB_RANK_1 | chess.BB_RANK_2 | chess.BB_RANK_3 |
+			chess.BB_RANK_4, mask)
+		self.assertEqual(chess.BB_RANK_8 | chess.BB_RANK_7 | chess.BB_RANK_6 |
+			chess.BB_RANK_5, board.vision_mask('black'))
+		# Computing vision doesn't disturb whose turn it is.
+		self.assertEqual(chess.WHITE, board.turn)
+
+	def test_render_mask(self):
+		board = DarkBoard()
+		self.assertEqual(
+			'rnbqkbnr/pppppppp/________/________/'
+			'________/________/PPPPPPPP/RNBQKBNR',
+			board.render_mask(chess.BB_ALL)
+		)
+		self.assertEqual(
+			'????????/????????/????????/????????/'
+			'????????/????????/????????/????????',
+			board.render_mask(chess.BB_EMPTY)
+		)
+
+	def test_encode_move(self):
+		for uci in ['e2e4', 'a7a8q', 'h2h1n', 'e1g1', 'h8a1']:
+			move = chess.Move.from_uci(uci)
+			value = DarkBoard.encode_move(move)
+			self.assertTrue(0 <= value < 2 ** 15)
+			self.assertEqual(move, DarkBoard.decode_move(value))
+
+	def test_push_encoded_matches_parsed(self):
+		# Replaying a game move by move must give the same position (as far as
+		# anything we store or compute is concerned) as parsing each fen.
+		rng = random.Random(1)
+		for i in range(10):
+			board = DarkBoard()
+			for ply in range(120):
+				moves = list(board.pseudo_legal_moves)
+				if not moves or board.king_captured():
+					break
+				move = rng.choice(moves)
+				parsed = DarkBoard(fen=board.fen())
+				parsed.push(move)
+				parsed = DarkBoard(fen=parsed.fen())
+				board.push_encoded(DarkBoard.encode_move(move))
+				self.assertEqual(parsed.fen(), board.fen())
+				self.assertEqual(parsed.ep_square, board.ep_square)
+				for side in ['white', 'black']:
+					self.assertEqual(parsed.dark_fen(side), board.dark_fen(side))
+				self.assertEqual(
+					list(parsed.pseudo_legal_moves),
+					list(board.pseudo_legal_moves)
+				)
@@ -0,0 +1,161 @@
+import threading
+from unittest import mock
+from tests.test_prototype import PrototypeModelTestCase, TestConfig
+from dark_chess_api import create_app, db, endpointer
+from dark_chess_api.endpoint_handler.cache import (
+	LocalCache, ResponseCache, cache_backend, serve_local_cache,
+	connect_local_cache
+)
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match
+
+class CacheConfig(TestConfig):
+	ENDPOINT_CACHE_URL = 'memory://'
+
+class CacheTestCases(PrototypeModelTestCase):
+
+	config = CacheConfig
+
+	def setUp(self):
+		super().setUp()
+		db.session.add_all([
+			User('user1', 'user1@example.com', 'password'),
+			User('user2', 'user2@example.com', 'password'),
+			User('user3', 'user3@example.com', 'password')
+		])
+		db.session.commit()
+
+	def headers(self, user):
+		return {'Authorization': f'Bearer {user.get_token()}'}
+
+	def test_local_cache(self):
+		cache = LocalCache(size=2)
+		cache.set('a', 1)
+		cache.set('b', 2)
+		self.assertEqual(1, cache.get('a'))
+		# 'b' is the least recently used
+		cache.set('c', 3)
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual([1, 3], cache.get_many(['a', 'c']))
+		with mock.patch('time.monotonic', return_value=0):
+			cache.set('d', 4, ttl=10)
+		with mock.patch('time.monotonic', return_value=5):
+			self.assertEqual(4, cache.get('d'))
+		with mock.patch('time.monotonic', return_value=11):
+			self.assertIsNone(cache.get('d'))
+
+	def test_cached_match(self):
+		m = Match()
+		db.session.add(m)
+		m.join(User.query.get(1))
+		m.join(User.query.get(2))
+		db.session.commit()
+		white, black = m.player_white, m.player_black
+		headers = self.headers(white)
+		first_res = self.client.get('/match/1', headers=headers)
+		with mock.patch.object(Match, 'as_dict') as as_dict:
+			cached_res = self.client.get('/match/1', headers=headers)
+		as_dict.assert_not_called()
+		self.assertEqual(first_res.get_json(), cached_res.get_json())
+		# Someone else is sent their own version
+		black_res = self.client.get('/match/1', headers=self.headers(black))
+		self.assertIn('black_vision_history', black_res.get_json())
+		self.assertEqual(
+			{ 'hits': 1, 'misses': 2 },
+			self.client.get('/docs/cache').get_json()['endpoints']['get_match']
+		)
+		# Moves drop the match's cached responses
+		self.client.post('/match/1/make-move', headers=headers,
+			json={ 'uci_string': 'e2e4' }
+		)
+		match_res = self.client.get('/match/1', headers=headers)
+		self.assertEqual(1, match_res.get_json()['ply'])
+		self.assertEqual(
+			{ 'hits': 1, 'misses': 3 },
+			self.client.get('/docs/cache').get_json()['endpoints']['get_match']
+		)
+
+	def test_cached_responses_are_authenticated(self):
+		u1 = User.query.get(1)
+		self.assertEqual(200,
+			self.client.get('/user/2', headers=self.headers(u1)).status_code
+		)
+		self.assertEqual(401, self.client.get('/user/2').status_code)
+		self.assertEqual(401, self.client.get('/user/2',
+			headers={'Authorization': 'Bearer nonsense'}
+		).status_code)
+
+	def test_friends_invalidate_users(self):
+		u1, u2 = User.query.get(1), User.query.get(2)
+		h1, h2 = self.headers(u1), self.headers(u2)
+		self.assertEqual([], self.client.get('/user/1', headers=h1).get_json()['friends'])
+		self.assertEqual([], self.client.get('/user/2', headers=h1).get_json()['friends'])
+		self.client.post('/user/2/friend-invite', headers=h1)
+		self.client.patch('/user/1/accept-friend-invite', headers=h2)
+		self.assertEqual([{ 'id': 2, 'username': 'user2' }],
+			self.client.get('/user/1', headers=h1).get_json()['friends']
+		)
+		self.assertEqual([{ 'id': 1, 'username': 'user1' }],
+			self.client.get('/user/2', headers=h1).get_json()['friends']
+		)
+
+	# Every change to a user drops their cached responses.
+	def test_user_changes_invalidate_users(self):
+		u1 = User.query.get(1)
+		h1 = self.headers(u1)
+		def misses():
+			self.client.get('/user/1', headers=h1)
+			self.client.get('/user/2', headers=h1)
+			return endpointer.cache.stats()['user_info']['misses']
+		self.assertEqual(2, misses())
+		self.assertEqual(2, misses())
+		self.client.patch('/user/1/auth/change-password', headers=h1,
+			json={ 'current_password': 'password', 'new_password': 'changed' }
+		)
+		self.assertEqual(3, misses())
+		self.client.post('/user/2/friend-invite', headers=h1)
+		self.assertEqual(5, misses())
+
+	# Two caches connected to the stand-in, as two workers would be.
+	def test_shared_cache(self):
+		server = serve_local_cache(('127.0.0.1', 0), authkey=b'testing')
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		url = 'local://{}:{}'.format(*server.address)
+		first, second = [
+			ResponseCache(cache_backend(url, authkey=b'testing'))
+			for i in range(2)
+		]
+		key = first.key('user_info', 1, ['user:1'])
+		self.assertEqual(key, second.key('user_info', 1, ['user:1']))
+		first.set('user_info', key, b'{}', 60)
+		self.assertEqual(b'{}', second.get('user_info', key))
+		# Invalidated by one, gone for both
+		second.invalidate('user:1')
+		new_key = first.key('user_info', 1, ['user:1'])
+		self.assertNotEqual(key, new_key)
+		self.assertIsNone(first.get('user_info', new_key))
+		self.assertEqual({ 'user_info': { 'hits': 0, 'misses': 1 } }, first.stats())
+
+	# Requests to the stand-in are unpickled, so it's never served or
+	# connected to without a key to authenticate them with.
+	def test_empty_authkey_rejected(self):
+		with self.assertRaises(ValueError):
+			serve_local_cache(('127.0.0.1', 0), authkey=b'')
+		with self.assertRaises(ValueError):
+			connect_local_cache(('127.0.0.1', 0), authkey=b'')
+		self.app.config.update(SECRET_KEY='',
+			ENDPOINT_CACHE_URL='local://127.0.0.1:0'
+		)
+		with self.assertRaises(ValueError):
+			endpointer.init_app(self.app)
+		result = self.app.test_cli_runner().invoke(
+			args=['endpoints', 'cache-server']
+		)
+		self.assertIsInstance(result.exception, ValueError)
+
+	# Workers sharing a message queue can't each have a cache of their own.
+	def test_memory_cache_with_message_queue(self):
+		class QueueConfig(CacheConfig):
+			SOCKETIO_MESSAGE_QUEUE = 'local://127.0.0.1:6380'
+		with self.assertRaises(ValueError):
+			create_app(QueueConfig)
@@ -1,7 +1,13 @@
+import random
+import chess
+from unittest import mock
 from tests.test_prototype import PrototypeModelTestCase, auth_encode
 from dark_chess_api import db
+from dark_chess_api.modules.matches import move_timings
 from dark_chess_api.modules.users.models import User
-from dark_chess_api.modules.matches.models import Match
+from dark_chess_api.modules.matches.models import (
+	Match, MatchInvite, DarkBoard, FinishedMatchView
+)
 
 class MatchTestCases(PrototypeModelTestCase):
 
@@ -154,7 +160,7 @@ class MatchTestCases(PrototypeModelTestCase):
 		)
 		self.assertEqual(403, move_res.status_code)
 		m = Match.query.get(1)
-		self.assertEqual(1, len(m.history))
+		self.assertEqual(1, m.history.count())
 
 		move_res = self.client.post('/match/1/make-move',
 			headers={'Authorization': f'Bearer {not_playing_token}'},
@@ -164,7 +170,7 @@ class MatchTestCases(PrototypeModelTestCase):
 		)
 		self.assertEqual(400, move_res.status_code)
 		m = Match.query.get(1)
-		self.assertEqual(1, len(m.history))
+		self.assertEqual(1, m.history.count())
 
 		move_res = self.client.post('/match/1/make-move',
 			headers={'Authorization': f'Bearer {not_playing_token}'},
@@ -174,7 +180,7 @@ class MatchTestCases(PrototypeModelTestCase):
 		)
 		self.assertEqual(409, move_res.status_code)
 		m = Match.query.get(1)
-		self.assertEqual(1, len(m.history))
+		self.assertEqual(1, m.history.count())
 
 		move_res = self.client.post('/match/1/make-move',
 			headers={'Authorization': f'Bearer {playing_token}'},
@@ -184,7 +190,7 @@ class MatchTestCases(PrototypeModelTestCase):
 		)
 		self.assertEqual(422, move_res.status_code)
 		m = Match.query.get(1)
-		self.assertEqual(1, len(m.history))
+		self.assertEqual(1, m.history.count())
 
 		move_res = self.client.post('/match/1/make-move',
 			headers={'Authorization': f'Bearer {playing_token}'},
@@ -194,7 +200,7 @@ class MatchTestCases(PrototypeModelTestCase):
 		)
 		self.assertEqual(200, move_res.status_code)
 		m = Match.query.get(1)
-		self.assertEqual(2, len(m.history))
+		self.assertEqual(2, m.history.count())
 
 	def test_finish_match(self):
 		db.session.add(Match())
@@ -231,4 +237,509 @@ class MatchTestCases(PrototypeModelTestCase):
 		self.assertTrue(m.is_finished)
 		self.assertFalse(m.in_progress)
 		self.assertFalse(m.playing(u1))
-		self.assertFalse(m.playing(u2))
\ No newline at end of file
+		self.assertFalse(m.playing(u2))
+
+	def test_rendered_match_states(self):
+		m = Match()
+		db.session.add(m)
+		u1, u2 = User.query.get(1), User.query.get(2)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		player_white = m.player_white
+		self.assertTrue(m.attempt_move(player_white, 'e2e4'))
+		db.session.commit()
+		for state in m.history:
+			board = DarkBoard(fen=state.fen)
+			self.assertEqual(board.dark_fen('white'), state.white_dark_fen)
+			self.assertEqual(board.dark_fen('black'), state.black_dark_fen)
+			self.assertEqual(board.render_mask(chess.BB_ALL), state.expanded_fen)
+		token = player_white.get_token()
+		match_res = self.client.get(f'/match/{m.id}',
+			headers={'Authorization': f'Bearer {token}'}
+		)
+		self.assertEqual(200, match_res.status_code)
+		self.assertEqual(
+			[state.white_dark_fen for state in m.history],
+			match_res.get_json()['white_vision_history']
+		)
+
+	# Every request should parse the current position at most once, plus the
+	# one board a move creates.
+	def test_board_constructions_per_request(self):
+		m = Match()
+		db.session.add(m)
+		u1, u2 = User.query.get(1), User.query.get(2)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		white_token = m.player_white.get_token()
+		black_token = m.player_black.get_token()
+		db.session.remove()
+		with mock.patch.object(chess.Board, '__init__', autospec=True,
+			side_effect=chess.Board.__init__
+		) as board_init:
+			match_res = self.client.get('/match/1',
+				headers={'Authorization': f'Bearer {white_token}'}
+			)
+			self.assertEqual(200, match_res.status_code)
+			self.assertLessEqual(board_init.call_count, 1)
+			board_init.reset_mock()
+			move_res = self.client.post('/match/1/make-move',
+				headers={'Authorization': f'Bearer {white_token}'},
+				json={ 'uci_string': 'e2e4' }
+			)
+			self.assertEqual(200, move_res.status_code)
+			self.assertLessEqual(board_init.call_count, 3)
+			board_init.reset_mock()
+			match_res = self.client.get('/match/1',
+				headers={'Authorization': f'Bearer {black_token}'}
+			)
+			self.assertEqual(200, match_res.status_code)
+			self.assertLessEqual(board_init.call_count, 1)
+
+	def test_move_loads_only_current_state(self):
+		m = Match()
+		db.session.add(m)
+		u1, u2 = User.query.get(1), User.query.get(2)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		knight_shuffle = ['g1f3', 'g8f6', 'f3g1', 'f6g8'] * 5
+		for i, uci_string in enumerate(knight_shuffle):
+			player = m.player_white if i % 2 == 0 else m.player_black
+			self.assertTrue(m.attempt_move(player, uci_string))
+		db.session.commit()
+		self.assertEqual(list(range(21)), [state.ply for state in m.history])
+		self.assertEqual(20, m.current_state.ply)
+		token = m.player_white.get_token()
+		db.session.remove()
+		with self.recorded_statements() as statements:
+			move_res = self.client.post('/match/1/make-move',
+				headers={'Authorization': f'Bearer {token}'},
+				json={ 'uci_string': 'e2e4' }
+			)
+		self.assertEqual(200, move_res.status_code)
+		# States should only ever be looked up one at a time by id (the
+		# current state, before and after the move is committed), never as
+		# the whole history.
+		state_selects = [
+			s for s in statements
+			if s.startswith('SELECT') and 'FROM match_state' in s
+		]
+		self.assertGreater(len(state_selects), 0)
+		for statement in state_selects:
+			self.assertTrue(statement.endswith('WHERE match_state.id = ?'))
+		m = Match.query.get(1)
+		self.assertEqual(21, m.current_state.ply)
+		self.assertEqual(22, m.history.count())
+
+	def test_query_match_summaries(self):
+		u1, u2, u3 = User.query.get(1), User.query.get(2), User.query.get(3)
+		for opponent in [u2, u3, u2]:
+			m = Match()
+			db.session.add(m)
+			m.join(u1)
+			m.join(opponent)
+		open_match = Match()
+		db.session.add(open_match)
+		open_match.join(u2)
+		db.session.commit()
+		m = Match.query.get(1)
+		self.assertTrue(m.attempt_move(m.player_white, 'e2e4'))
+		db.session.commit()
+		token = u1.get_token()
+		db.session.remove()
+		with self.recorded_statements() as statements:
+			query_res = self.client.post('/match/query',
+				headers={'Authorization': f'Bearer {token}'},
+				json={ 'user_id': 1, 'in_progress': True }
+			)
+		self.assertEqual(200, query_res.status_code)
+		# One statement to authenticate, and one for the matches themselves.
+		self.assertEqual(2, len(statements))
+		summaries = query_res.get_json()['matches']
+		self.assertEqual([1, 2, 3], [summary['id'] for summary in summaries])
+		m = Match.query.get(1)
+		self.assertEqual(1, summaries[0]['ply_count'])
+		self.assertEqual('black', summaries[0]['current_side'])
+		self.assertEqual(m.player_black_id, summaries[0]['current_player_id'])
+		self.assertEqual(
+			{ 'id': m.player_white.id, 'username': m.player_white.username },
+			summaries[0]['player_white']
+		)
+		self.assertIsNotNone(summaries[0]['last_move_on'])
+		self.assertEqual(0, summaries[1]['ply_count'])
+		self.assertEqual('white', summaries[1]['current_side'])
+
+	def test_query_match_filters(self):
+		u1, u2 = User.query.get(1), User.query.get(2)
+		open_match, active_match, finished_match = Match(), Match(), Match()
+		db.session.add_all([open_match, active_match, finished_match])
+		open_match.join(u1)
+		for m in [active_match, finished_match]:
+			m.join(u1)
+			m.join(u2)
+		finished_match.is_finished = True
+		db.session.add_all([MatchInvite(u1), MatchInvite(u1, u2)])
+		db.session.commit()
+		db.session.add(MatchInvite(u2, u1))
+		db.session.commit()
+		accepted = MatchInvite.query.get(3)
+		accepted.match = active_match
+		db.session.commit()
+		headers = {'Authorization': f'Bearer {u1.get_token()}'}
+		def match_ids(query):
+			res = self.client.post('/match/query', headers=headers, json=query)
+			return [m['id'] for m in res.get_json()['matches']]
+		self.assertEqual([2], match_ids({ 'user_id': 1, 'in_progress': True }))
+		self.assertEqual([1, 3], match_ids({ 'user_id': 1, 'in_progress': False }))
+		self.assertEqual([1], match_ids({ 'is_open': True }))
+		self.assertEqual([2, 3], match_ids({ 'user_id': 1, 'is_open': False }))
+		def invite_ids(query):
+			res = self.client.post('/match/invite/query',
+				headers=headers, json=query
+			)
+			return [i['id'] for i in res.get_json()['match_invites']]
+		self.assertEqual([1, 2], invite_ids({ 'involved_id': 1, 'accepted': False }))
+		self.assertEqual([3], invite_ids({ 'involved_id': 1, 'accepted': True }))
+		self.assertEqual([1], invite_ids({ 'is_open': True }))
+		self.assertEqual([2, 3], invite_ids({ 'is_open': False }))
+
+	def test_turn_columns(self):
+		m = Match()
+		db.session.add(m)
+		u1, u2 = User.query.get(1), User.query.get(2)
+		m.join(u1)
+		self.assertIsNone(m.current_player_id)
+		m.join(u2)
+		db.session.commit()
+		self.assertEqual(0, m.ply_count)
+		self.assertEqual('white', m.side_to_move)
+		self.assertEqual(m.player_white_id, m.current_player_id)
+		self.assertEqual(m.current_state.created_on, m.last_move_at)
+		for i, uci_string in enumerate(['f2f3', 'e7e5', 'g2g4']):
+			player = m.player_white if i % 2 == 0 else m.player_black
+			self.assertTrue(m.attempt_move(player, uci_string))
+			db.session.commit()
+			self.assertEqual(i + 1, m.ply_count)
+			self.assertEqual(m.snapshot.side, m.side_to_move)
+			self.assertEqual(m.current_player.id, m.current_player_id)
+			self.assertEqual(m.current_state.created_on, m.last_move_at)
+		self.assertTrue(m.attempt_move(m.player_black, 'd8h4'))
+		db.session.commit()
+		self.assertTrue(m.is_finished)
+		self.assertEqual(4, m.ply_count)
+		self.assertIsNone(m.current_player_id)
+
+	def test_query_my_turn(self):
+		u1, u2, u3 = User.query.get(1), User.query.get(2), User.query.get(3)
+		for opponent in [u2, u3, u2]:
+			m = Match()
+			db.session.add(m)
+			m.join(u1)
+			m.join(opponent)
+		db.session.commit()
+		# Make a move in the second match, whoever's turn it is.
+		m = Match.query.get(2)
+		self.assertTrue(m.attempt_move(m.current_player,
+			'e2e4' if m.side_to_move == 'white' else 'e7e5'
+		))
+		db.session.commit()
+		token = u1.get_token()
+		matches = Match.query.order_by(Match.id).all()
+		u1_turn = [m.id for m in matches if m.current_player_id == 1]
+		others_turn = [m.id for m in matches if m.current_player_id != 1]
+		db.session.remove()
+		with self.recorded_statements() as statements:
+			query_res = self.client.post('/match/query',
+				headers={'Authorization': f'Bearer {token}'},
+				json={ 'user_id': 1, 'my_turn': True }
+			)
+		self.assertEqual(200, query_res.status_code)
+		self.assertEqual(2, len(statements))
+		summaries = query_res.get_json()['matches']
+		self.assertEqual(u1_turn, [summary['id'] for summary in summaries])
+		for summary in summaries:
+			self.assertEqual(1, summary['current_player_id'])
+		query_res = self.client.post('/match/query',
+			headers={'Authorization': f'Bearer {token}'},
+			json={ 'user_id': 1, 'my_turn': False }
+		)
+		self.assertEqual(
+			others_turn,
+			[summary['id'] for summary in query_res.get_json()['matches']]
+		)
+
+	# Plays the same random moves in a match stored in each history format.
+	def play_both_formats(self, plies, seed=0):
+		rng = random.Random(seed)
+		u1, u2 = User.query.get(1), User.query.get(2)
+		matches = {}
+		for history_format in ['full', 'compact']:
+			self.app.config['MATCH_HISTORY_FORMAT'] = history_format
+			m = Match()
+			db.session.add(m)
+			m.join(u1)
+			m.join(u2)
+			matches[history_format] = m
+		db.session.commit()
+		for i in range(plies):
+			if not matches['full'].in_progress:
+				break
+			move = rng.choice(list(matches['full'].snapshot.board.pseudo_legal_moves))
+			for history_format, m in matches.items():
+				self.app.config['MATCH_HISTORY_FORMAT'] = history_format
+				self.assertTrue(m.attempt_move(m.current_player, move.uci()))
+				db.session.commit()
+		self.app.config['MATCH_HISTORY_FORMAT'] = 'full'
+		return matches['full'].id, matches['compact'].id
+
+	def test_compact_history(self):
+		self.app.config['MATCH_CHECKPOINT_INTERVAL'] = 4
+		for seed in range(3):
+			full_id, compact_id = self.play_both_formats(30, seed=seed)
+			compact_states = Match.query.get(compact_id).history.all()
+			self.assertEqual(
+				[s.ply for s in compact_states if s.ply % 4 == 0],
+				[s.ply for s in compact_states if s.fen is not None]
+			)
+			self.assertTrue(all(s.white_dark_fen is None for s in compact_states))
+			db.session.remove()
+			self.assertEqual(Match.query.get(full_id).current_fen,
+				Match.query.get(compact_id).current_fen
+			)
+			for side in ['white', 'black', 'spectating']:
+				# Fresh sessions, so that the current positions are reconstructed
+				db.session.remove()
+				full = Match.query.get(full_id).as_dict(side)
+				db.session.remove()
+				compact = Match.query.get(compact_id).as_dict(side)
+				# Colours are picked at random, so the players may differ
+				for d in [full, compact]:
+					for key in ['id', 'connection_token', 'player_white',
+						'player_black', 'current_player_id', 'winner']:
+						d.pop(key, None)
+				self.assertEqual(full, compact)
+
+	def test_compact_existing_history(self):
+		full_id, compact_id = self.play_both_formats(25, seed=4)
+		m = Match.query.get(full_id)
+		before = { side: m.as_dict(side) for side in ['white', 'black'] }
+		m.compact(10)
+		db.session.commit()
+		db.session.remove()
+		m = Match.query.get(full_id)
+		self.assertEqual(
+			[s.ply for s in m.history if s.ply % 10 == 0],
+			[s.ply for s in m.history if s.fen is not None]
+		)
+		for side in ['white', 'black']:
+			self.assertEqual(before[side], m.as_dict(side))
+		# It's still possible to carry on playing after being compacted
+		if m.in_progress:
+			move = next(iter(m.snapshot.board.pseudo_legal_moves))
+			self.assertTrue(m.attempt_move(m.current_player, move.uci()))
+			db.session.commit()
+
+	def test_query_match_invites_statements(self):
+		token = User.query.get(1).get_token()
+		statement_counts = []
+		for i in range(2):
+			u1, u2, u3 = User.query.get(1), User.query.get(2), User.query.get(3)
+			db.session.add_all([MatchInvite(u1, invited) for invited in [u2, u3, None]])
+			db.session.commit()
+			db.session.remove()
+			with self.recorded_statements() as statements:
+				invites_res = self.client.post('/match/invite/query',
+					headers={'Authorization': f'Bearer {token}'},
+					json={ 'inviter_id': 1 }
+				)
+			self.assertEqual(200, invites_res.status_code)
+			self.assertEqual(3 * (i + 1), len(invites_res.get_json()['match_invites']))
+			statement_counts.append(len(statements))
+		# Authentication, and the invites joined with their users.
+		self.assertEqual([2, 2], statement_counts)
+
+	def test_get_finished_match_statements(self):
+		m = Match()
+		db.session.add(m)
+		u1, u2 = User.query.get(1), User.query.get(2)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		for i, uci_string in enumerate(['f2f3', 'e7e5', 'g2g4', 'd8h4']):
+			player = m.player_white if i % 2 == 0 else m.player_black
+			self.assertTrue(m.attempt_move(player, uci_string))
+		db.session.commit()
+		self.assertTrue(m.is_finished)
+		side = 'white' if m.player_white_id == u1.id else 'black'
+		token = u1.get_token()
+		winner = { 'id': m.winning_player.id, 'username': m.winning_player.username }
+		db.session.remove()
+		# The match was finished without going through the api, so its views
+		# are rendered the first time it's asked for.
+		first_res = self.client.get('/match/1',
+			headers={'Authorization': f'Bearer {token}'}
+		)
+		self.assertEqual(200, first_res.status_code)
+		db.session.remove()
+		with self.recorded_statements() as statements:
+			match_res = self.client.get('/match/1',
+				headers={'Authorization': f'Bearer {token}'}
+			)
+		self.assertEqual(200, match_res.status_code)
+		self.assertEqual(first_res.get_json(), match_res.get_json())
+		self.assertEqual(5, len(match_res.get_json()[f'{side}_vision_history']))
+		# Authentication, the match joined with its players and current state,
+		# and the rendered view. The winner is embedded as a reference, which
+		# needs nothing more.
+		self.assertLessEqual(len(statements), 3)
+		self.assertEqual(winner, match_res.get_json()['winner'])
+
+	def test_finished_match_views(self):
+		m = Match()
+		db.session.add(m)
+		u1, u2, u3 = User.query.get(1), User.query.get(2), User.query.get(3)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		tokens = {
+			'white': m.player_white.get_token(),
+			'black': m.player_black.get_token(),
+			'spectating': u3.get_token()
+		}
+		for i, uci_string in enumerate(['f2f3', 'e7e5', 'g2g4', 'd8h4']):
+			side = 'white' if i % 2 == 0 else 'black'
+			self.client.post('/match/1/make-move',
+				headers={'Authorization': f'Bearer {tokens[side]}'},
+				json={ 'uci_string': uci_string }
+			)
+		# Rendered when the match finished
+		self.assertEqual(3, FinishedMatchView.query.filter_by(match_id=1).count())
+		etags = set()
+		for side, token in tokens.items():
+			headers = {'Authorization': f'Bearer {token}'}
+			res = self.client.get('/match/1', headers=headers)
+			self.assertEqual(200, res.status_code)
+			self.assertEqual(Match.query.get(1).as_dict(side=side), res.get_json())
+			self.assertNotIn('side_token', res.get_json())
+			etag, weak = res.get_etag()
+			self.assertFalse(weak)
+			etags.add(etag)
+			self.assertIn('immutable', res.headers['Cache-Control'])
+			self.assertIn('private', res.headers['Cache-Control'])
+			cached_res = self.client.get('/match/1',
+				headers={ **headers, 'If-None-Match': f'"{etag}"' }
+			)
+			self.assertEqual(304, cached_res.status_code)
+			self.assertEqual(b'', cached_res.data)
+		# Every viewer sees something different
+		self.assertEqual(3, len(etags))
+
+	def test_match_revisions(self):
+		m = Match()
+		db.session.add(m)
+		u3 = User.query.get(3)
+		m.join(User.query.get(1))
+		m.join(User.query.get(2))
+		db.session.commit()
+		tokens = {
+			'white': m.player_white.get_token(),
+			'black': m.player_black.get_token(),
+			'spectating': u3.get_token()
+		}
+		def get_match(side, etag=None):
+			headers = {'Authorization': f'Bearer {tokens[side]}'}
+			if etag is not None:
+				headers['If-None-Match'] = f'W/"{etag}"'
+			return self.client.get('/match/1', headers=headers)
+		etags = {}
+		for side in tokens:
+			res = get_match(side)
+			self.assertEqual(200, res.status_code)
+			etag, weak = res.get_etag()
+			self.assertTrue(weak)
+			etags[side] = etag
+			# Answered without building the match
+			with mock.patch.object(Match, 'as_dict') as as_dict:
+				cached_res = get_match(side, etag)
+			self.assertEqual(304, cached_res.status_code)
+			self.assertEqual(b'', cached_res.data)
+			self.assertEqual((etag, True), cached_res.get_etag())
+			as_dict.assert_not_called()
+		self.assertEqual(3, len(set(etags.values())))
+		# Someone else's ETag isn't good enough
+		self.assertEqual(200, get_match('black', etags['white']).status_code)
+		# Nor is anything without authentication
+		res = self.client.get('/match/1',
+			headers={ 'If-None-Match': f'W/"{etags["white"]}"' }
+		)
+		self.assertEqual(401, res.status_code)
+		self.client.post('/match/1/make-move',
+			headers={'Authorization': f'Bearer {tokens["white"]}'},
+			json={ 'uci_string': 'e2e4' }
+		)
+		for side, etag in etags.items():
+			res = get_match(side, etag)
+			self.assertEqual(200, res.status_code)
+			self.assertNotEqual(etag, res.get_etag()[0])
+			self.assertEqual(1, res.get_json()['ply'])
+
+	def test_move_timings(self):
+		m = Match()
+		db.session.add(m)
+		m.join(User.query.get(1))
+		m.join(User.query.get(2))
+		db.session.commit()
+		tokens = {
+			'white': m.player_white.get_token(),
+			'black': m.player_black.get_token()
+		}
+		admin_headers = {'Authorization': f'Bearer {User.query.get(3).get_token()}'}
+		db.session.commit()
+		self.app.config['ADMIN_USERNAMES'] = ['user3']
+		with self.assertLogs(self.app.logger, 'WARNING') as logs:
+			move_timings.slow_move_ms = 0
+			for i, uci_string in enumerate(['f2f3', 'e7e5', 'g2g4', 'd8h4']):
+				side = 'white' if i % 2 == 0 else 'black'
+				res = self.client.post('/match/1/make-move',
+					headers={'Authorization': f'Bearer {tokens[side]}'},
+					json={ 'uci_string': uci_string }
+				)
+				self.assertEqual(200, res.status_code)
+			# Refused moves are timed too
+			self.client.post('/match/1/make-move',
+				headers={'Authorization': f'Bearer {tokens["white"]}'},
+				json={ 'uci_string': 'e2e4' }
+			)
+		self.assertEqual(5, len(logs.output))
+		self.assertIn('Slow move: d8h4 in match 1 (api)', logs.output[3])
+		# Admins only
+		self.assertEqual(403, self.client.get('/match/move-timings',
+			headers={'Authorization': f'Bearer {tokens["white"]}'}
+		).status_code)
+		self.assertEqual(401, self.client.get('/match/move-timings').status_code)
+		res = self.client.get('/match/move-timings', headers=admin_headers)
+		self.assertEqual(200, res.status_code)
+		timings = res.get_json()
+		self.assertEqual(['e2e4', 'd8h4', 'g2g4', 'e7e5', 'f2f3'],
+			[move['uci_string'] for move in timings['moves']]
+		)
+		refused, finishing, ordinary = timings['moves'][:3]
+		self.assertEqual(403, refused['status'])
+		phases = lambda move: [phase['name'] for phase in move['phases']]
+		self.assertEqual(['auth', 'load', 'playing', 'players_turn',
+			'attempt_move', 'commit', 'broadcast_move_made', 'serialize'],
+			phases(ordinary)
+		)
+		self.assertEqual(['auth', 'load', 'playing', 'players_turn',
+			'attempt_move', 'commit', 'broadcast_move_made', 'stats',
+			'render_finished_views', 'commit_finish', 'broadcast_match_finish',
+			'serialize'], phases(finishing)
+		)
+		self.assertAlmostEqual(finishing['total_ms'],
+			sum(finishing['by_kind_ms'].values())
+		)
+		self.assertEqual(4, timings['phases']['attempt_move']['count'])
+		self.assertEqual('emit', timings['phases']['broadcast_move_made']['kind'])
@@ -0,0 +1,150 @@
+import time
+import queue
+import threading
+import multiprocessing
+
+import socketio as python_socketio
+
+from tests.test_prototype import PrototypeModelTestCase, TestConfig
+from dark_chess_api import db
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match
+from dark_chess_api.modules.websockets.connection_handler import side_room
+from dark_chess_api.modules.websockets.message_queue import (
+	LocalBroker, LocalQueueManager, client_manager
+)
+
+NAMESPACE = '/match-moves'
+
+# A socket worker in a process of its own, with a client in each of the rooms
+# of a match. Rather than having real clients, the packets they'd be sent are
+# put on `events`. Before saying it's ready, it waits until it's been sent one
+# of its own events through the queue, which means it's subscribed.
+def socket_worker(worker, url, channel, connection_token, events, ready):
+	manager = LocalQueueManager(url, channel=channel, authkey=b'testing')
+	server = python_socketio.Server(client_manager=manager,
+		async_mode='threading'
+	)
+	subscribed = threading.Event()
+	def send_packet(eio_sid, pkt):
+		if eio_sid == 'probe':
+			subscribed.set()
+		else:
+			events.put((worker, eio_sid, pkt.data[0], pkt.data[1]))
+	server._send_packet = send_packet
+	manager.initialize()
+	for side in ['probe', 'white', 'black', 'spectating']:
+		sid = manager.connect(side, NAMESPACE)
+		room = 'probe' if side == 'probe' else side_room(connection_token, side)
+		manager.enter_room(sid, NAMESPACE, room)
+	while not subscribed.wait(0.1):
+		server.emit('probe', room='probe', namespace=NAMESPACE)
+	ready.set()
+	while True:
+		time.sleep(1)
+
+class MessageQueueTestCases(PrototypeModelTestCase):
+
+	WORKERS = 2
+
+	def setUp(self):
+		self.broker = LocalBroker(authkey=b'testing').start()
+		class QueueConfig(TestConfig):
+			SOCKETIO_MESSAGE_QUEUE = self.broker.url
+		self.config = QueueConfig
+		super().setUp()
+		self.workers = []
+
+	def tearDown(self):
+		for worker in self.workers:
+			worker.terminate()
+			worker.join()
+		self.broker.close()
+		super().tearDown()
+
+	def start_workers(self, connection_token, channel='flask-socketio'):
+		context = multiprocessing.get_context('spawn')
+		events = context.Queue()
+		for i in range(self.WORKERS):
+			ready = context.Event()
+			worker = context.Process(target=socket_worker,
+				args=(i, self.broker.url, channel, connection_token, events, ready),
+				daemon=True
+			)
+			worker.start()
+			self.workers.append(worker)
+			self.assertTrue(ready.wait(30))
+		return events
+
+	def received(self, events, count, timeout=10):
+		received = []
+		try:
+			while len(received) < count:
+				received.append(events.get(timeout=timeout))
+		except queue.Empty:
+			pass
+		return received
+
+	def test_moves_reach_every_worker(self):
+		u1 = User('user1', 'user1@example.com', 'password')
+		u2 = User('user2', 'user2@example.com', 'password')
+		db.session.add_all([u1, u2])
+		db.session.commit()
+		m = Match()
+		db.session.add(m)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		events = self.start_workers(m.connection_token)
+		# The move is made through the api, by this process, which has no
+		# socket clients of its own.
+		res = self.client.post(f'/match/{m.id}/make-move',
+			headers={'Authorization': f'Bearer {m.player_white.get_token()}'},
+			json={ 'uci_string': 'e2e4' }
+		)
+		self.assertEqual(200, res.status_code)
+		received = self.received(events, self.WORKERS * 3)
+		self.assertEqual(sorted(
+			(worker, side) for worker in range(self.WORKERS)
+			for side in ['white', 'black', 'spectating']
+		), sorted((worker, side) for worker, side, _, _ in received))
+		for worker, side, name, event in received:
+			self.assertEqual('move-delta', name)
+			self.assertEqual(1, event['seq'])
+			self.assertEqual('e2e4' if side == 'white' else None,
+				event.get('uci_string')
+			)
+		# Nothing else was sent
+		self.assertEqual([], self.received(events, 1, timeout=0.5))
+
+	def test_channels(self):
+		self.WORKERS = 1
+		events = self.start_workers('token', channel='another-cluster')
+		manager = LocalQueueManager(self.broker.url,
+			channel='flask-socketio',
+			authkey=b'testing'
+		)
+		manager.emit('move-delta', {}, namespace=NAMESPACE,
+			room=side_room('token', 'white')
+		)
+		self.assertEqual([], self.received(events, 1, timeout=0.5))
+		manager.channel = 'another-cluster'
+		manager.emit('move-delta', {}, namespace=NAMESPACE,
+			room=side_room('token', 'white')
+		)
+		self.assertEqual([(0, 'white', 'move-delta', {})],
+			self.received(events, 1)
+		)
+
+	# Connections are unpickled, so there's no running the broker, or
+	# connecting to it, without a key to authenticate them with.
+	def test_empty_authkey_rejected(self):
+		with self.assertRaises(ValueError):
+			LocalBroker(authkey=b'')
+		with self.assertRaises(ValueError):
+			LocalQueueManager(self.broker.url, authkey=b'')
+		self.app.config['SECRET_KEY'] = ''
+		with self.assertRaises(ValueError):
+			client_manager(self.app)
+		result = self.app.test_cli_runner().invoke(args=['websockets', 'broker'])
+		self.assertIsInstance(result.exception, ValueError)
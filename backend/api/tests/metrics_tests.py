@@ -0,0 +1,76 @@
+from tests.test_prototype import PrototypeModelTestCase, TestConfig
+from dark_chess_api import db, endpointer
+from dark_chess_api.endpoint_handler.metrics import EndpointMetrics
+from dark_chess_api.modules.users.models import User
+
+# With caching, so that its hits and misses show up.
+class MetricsConfig(TestConfig):
+	ENDPOINT_CACHE_URL = 'memory://'
+
+class MetricsTestCases(PrototypeModelTestCase):
+
+	config = MetricsConfig
+
+	def setUp(self):
+		super().setUp()
+		db.session.add(User('user1', 'user1@example.com', 'password'))
+		db.session.commit()
+		u = User.query.get(1)
+		self.headers = {'Authorization': f'Bearer {u.get_token()}'}
+		db.session.commit()
+
+	def test_quantiles(self):
+		metrics = EndpointMetrics(window=100)
+		self.assertEqual({ 0.5: None, 0.95: None, 0.99: None }, metrics.quantiles())
+		# Only the most recent are kept
+		for duration in range(-50, 101):
+			metrics.record(200, duration, 0, 0, 0, 0)
+		self.assertEqual({ 0.5: 51, 0.95: 96, 0.99: 100 }, metrics.quantiles())
+		self.assertEqual(151, metrics.count)
+
+	def test_endpoint_metrics(self):
+		metrics = endpointer.endpoints['users.user_info'].metrics
+		with self.recorded_statements() as statements:
+			self.client.get('/user/1', headers=self.headers)
+		self.client.get('/user/1', headers=self.headers)
+		self.client.get('/user/2', headers=self.headers)
+		self.assertEqual(3, metrics.count)
+		self.assertEqual({ 200: 2, 404: 1 }, metrics.statuses)
+		self.assertGreaterEqual(metrics.sql_statements, len(statements))
+		self.assertGreater(metrics.sql_seconds, 0)
+		self.assertGreater(metrics.response_bytes, 0)
+		self.assertEqual(0, metrics.request_bytes)
+		search = endpointer.endpoints['users.user_search'].metrics
+		res = self.client.post('/user/search', headers=self.headers,
+			json={ 'username': 'user' }
+		)
+		self.assertEqual(len(res.data), search.response_bytes)
+		self.assertEqual(len(b'{"username": "user"}'), search.request_bytes)
+		# Statements outside of requests don't count
+		sql_statements = metrics.sql_statements
+		User.query.all()
+		self.assertEqual(sql_statements, metrics.sql_statements)
+
+	def test_prometheus(self):
+		self.client.get('/user/1', headers=self.headers)
+		res = self.client.get('/metrics')
+		self.assertEqual(200, res.status_code)
+		self.assertTrue(res.content_type.startswith('text/plain'))
+		lines = res.get_data(as_text=True).splitlines()
+		self.assertIn('endpointer_requests_total'
+			'{resource="users",endpoint="user_info",status="200"} 1', lines)
+		self.assertIn('endpointer_request_duration_seconds_count'
+			'{resource="users",endpoint="user_info"} 1', lines)
+		self.assertIn('endpointer_cache_misses_total{endpoint="user_info"} 1', lines)
+		self.assertIn('# TYPE endpointer_request_duration_seconds summary', lines)
+		self.assertEqual(1, len([
+			line for line in lines
+			if line.startswith('endpointer_request_duration_seconds{')
+			and 'endpoint="user_info"' in line and 'quantile="0.99"' in line
+		]))
+
+	def test_docs_table(self):
+		self.client.get('/user/1', headers=self.headers)
+		res = self.client.get('/docs/users')
+		self.assertEqual(200, res.status_code)
+		self.assertIn(b'<td><a href="#user_info">GET /&lt;int:id&gt;</a></td>', res.data)
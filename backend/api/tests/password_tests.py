@@ -0,0 +1,66 @@
+import threading
+from werkzeug.security import generate_password_hash
+from tests.test_prototype import PrototypeModelTestCase, TestConfig, auth_encode
+from dark_chess_api import create_app, db
+from dark_chess_api.modules.users import password_hasher
+from dark_chess_api.modules.users.models import User
+
+class PasswordTestCases(PrototypeModelTestCase):
+
+	def login(self, password='password'):
+		return self.client.get('/user/auth/token',
+			headers={'Authorization': f'Basic {auth_encode(f"user:{password}")}'}
+		)
+
+	def test_configured_hash(self):
+		self.app.config.update(PASSWORD_HASH_ALGORITHM='sha512',
+			PASSWORD_HASH_ITERATIONS=1000, PASSWORD_SALT_LENGTH=12
+		)
+		password_hasher.init_app(self.app)
+		u = User('user', 'user@example.com', 'password')
+		method, salt, hashval = u.password_hash.split('$')
+		self.assertEqual('pbkdf2:sha512:1000', method)
+		self.assertEqual(12, len(salt))
+		self.assertTrue(u.check_password('password'))
+		self.assertFalse(u.check_password('wordpass'))
+		self.assertFalse(u.password_needs_rehash())
+
+	# Hashes made before hashing was configurable, with werkzeug's defaults,
+	# are left as they are.
+	def test_default_hash_kept(self):
+		password_hash = generate_password_hash('password')
+		self.assertFalse(password_hasher.needs_rehash(password_hash))
+
+	def test_unknown_algorithm(self):
+		class BadConfig(TestConfig):
+			PASSWORD_HASH_ALGORITHM = 'rot13'
+		with self.assertRaises(ValueError):
+			create_app(BadConfig)
+
+	def test_rehash_on_login(self):
+		self.app.config['PASSWORD_HASH_ITERATIONS'] = 1000
+		password_hasher.init_app(self.app)
+		db.session.add(User('user', 'user@example.com', 'password'))
+		db.session.commit()
+		old_hash = User.query.get(1).password_hash
+		self.app.config['PASSWORD_HASH_ITERATIONS'] = 2000
+		password_hasher.init_app(self.app)
+		# Failed logins leave it be
+		self.assertEqual(401, self.login('wordpass').status_code)
+		self.assertEqual(old_hash, User.query.get(1).password_hash)
+		self.assertEqual(200, self.login().status_code)
+		db.session.remove()
+		u = User.query.get(1)
+		self.assertNotEqual(old_hash, u.password_hash)
+		self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:2000$'))
+		self.assertEqual(200, self.login().status_code)
+		# And only once
+		self.assertEqual(u.password_hash, User.query.get(1).password_hash)
+
+	def test_offloaded(self):
+		name = password_hasher.run(lambda: threading.current_thread().name)
+		self.assertTrue(name.startswith('password-hash'))
+		self.app.config['PASSWORD_HASH_OFFLOAD'] = False
+		password_hasher.init_app(self.app)
+		name = password_hasher.run(lambda: threading.current_thread().name)
+		self.assertEqual(threading.current_thread().name, name)
@@ -1,5 +1,7 @@
 from dark_chess_api import create_app, db
 from config import Config
+from contextlib import contextmanager
+from sqlalchemy import event
 import unittest
 import base64
 
@@ -10,12 +12,15 @@ def auth_encode(s):
 
 class TestConfig(Config):
 	TESTING = True
+	SECRET_KEY = 'testing'
 	SQLALCHEMY_DATABASE_URI = 'sqlite://'
 
 class PrototypeModelTestCase(unittest.TestCase):
 
+	config = TestConfig
+
 	def setUp(self):
-		self.app = create_app(TestConfig)
+		self.app = create_app(self.config)
 		self.client = self.app.test_client()
 		self.app_context = self.app.app_context()
 		self.app_context.push()
@@ -24,4 +29,17 @@ class PrototypeModelTestCase(unittest.TestCase):
 	def tearDown(self):
 		db.session.remove()
 		db.drop_all()
-		self.app_context.pop()
\ No newline at end of file
+		self.app_context.pop()
+
+	# Records every SQL statement executed within the block, which is useful
+	# for keeping an eye on how many queries an endpoint makes.
+	@contextmanager
+	def recorded_statements(self):
+		statements = []
+		def record_statement(conn, cursor, statement, *args):
+			statements.append(statement)
+		event.listen(db.engine, 'before_cursor_execute', record_statement)
+		try:
+			yield statements
+		finally:
+			event.remove(db.engine, 'before_cursor_execute', record_statement)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from tests.test_prototype import PrototypeModelTestCase, TestConfig, auth_encode
+from dark_chess_api import db
+from dark_chess_api.modules.users import token_generations
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.users.tokens import sign_token
+
+class SignedTokenConfig(TestConfig):
+	TOKEN_MODE = 'signed'
+
+class TokenTestCases(PrototypeModelTestCase):
+
+	config = SignedTokenConfig
+
+	def setUp(self):
+		super().setUp()
+		self.user = User('user', 'user@example.com', 'password')
+		db.session.add(self.user)
+		db.session.commit()
+
+	def get(self, token, rule='/user/all'):
+		return self.client.get(rule, headers={'Authorization': f'Bearer {token}'})
+
+	def test_aquire_signed_token(self):
+		token_res = self.client.get('/user/auth/token',
+			headers={'Authorization': f'Basic {auth_encode("user:password")}'}
+		)
+		self.assertEqual(200, token_res.status_code)
+		token = token_res.get_json()['token']
+		self.assertIn('.', token)
+		# Signed tokens aren't stored, only when they expire.
+		self.assertIsNone(self.user.token)
+		self.assertIsNotNone(self.user.token_expiration)
+		self.assertEqual(token, self.user.get_token())
+		self.assertEqual(200, self.get(token).status_code)
+
+	def test_no_user_lookup(self):
+		token = self.user.get_token()
+		statement_counts = []
+		for i in range(3):
+			db.session.remove()
+			with self.recorded_statements() as statements:
+				self.assertEqual(200, self.get(token).status_code)
+			statement_counts.append(len(statements))
+		# The token generation, then only the users and their friends.
+		self.assertEqual([3, 2, 2], statement_counts)
+
+	def test_revoke_signed_token(self):
+		token = self.user.get_token()
+		self.assertEqual(200, self.get(token).status_code)
+		self.user.revoke_token()
+		db.session.commit()
+		self.assertEqual(401, self.get(token).status_code)
+		new_token = self.user.get_token()
+		self.assertNotEqual(token, new_token)
+		self.assertEqual(200, self.get(new_token).status_code)
+
+	# Revoked by another process, which only this process' cached generation
+	# expiring will notice.
+	def test_generation_cache(self):
+		token = self.user.get_token()
+		self.assertEqual(200, self.get(token).status_code)
+		User.query.filter_by(id=self.user.id).update({
+			'token_generation': User.token_generation + 1
+		})
+		db.session.commit()
+		self.assertEqual(200, self.get(token).status_code)
+		token_generations.clear()
+		self.assertEqual(401, self.get(token).status_code)
+
+	def test_invalid_signed_tokens(self):
+		token = self.user.get_token()
+		payload, signature = token.split('.')
+		tampered = sign_token(2, self.user.token_expiration, 0).split('.')[0]
+		expired = sign_token(self.user.id, datetime.utcnow() - timedelta(seconds=1),
+			self.user.token_generation
+		)
+		for bad_token in [f'{tampered}.{signature}', f'{payload}.{signature}x',
+			expired, f'{payload}.', '.']:
+			self.assertEqual(401, self.get(bad_token).status_code, bad_token)
+		# Nor for users that don't exist
+		nobody = sign_token(2, self.user.token_expiration, 0)
+		self.assertEqual(401, self.get(nobody).status_code)
+
+	# Switching modes doesn't log anyone out.
+	def test_database_tokens_accepted(self):
+		self.app.config['TOKEN_MODE'] = 'database'
+		token = self.user.get_token()
+		self.app.config['TOKEN_MODE'] = 'signed'
+		self.assertNotIn('.', token)
+		self.assertEqual(200, self.get(token).status_code)
+		self.user.revoke_token()
+		self.assertEqual(401, self.get(token).status_code)
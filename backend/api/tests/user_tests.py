@@ -188,4 +188,77 @@ class UserTestCases(PrototypeModelTestCase):
 		self.assertIn(u2, u1.friends)
 		self.assertIn(u1, u2.friends)
 		self.assertNotIn(u2, u1.friends_invited)
-		self.assertNotIn(u1, u2.friend_invites)
\ No newline at end of file
+		self.assertNotIn(u1, u2.friend_invites)
+
+	def test_user_list_statements(self):
+		users = [
+			User(f'user{i}', f'user{i}@example.com', 'password')
+			for i in range(6)
+		]
+		db.session.add_all(users)
+		db.session.commit()
+		token = users[0].get_token()
+		statement_counts = []
+		for i in range(1, 3):
+			users = User.query.order_by(User.id).all()
+			users[0].friends.append(users[i])
+			users[i].friends.append(users[0])
+			db.session.commit()
+			db.session.remove()
+			with self.recorded_statements() as statements:
+				list_res = self.client.get('/user/all',
+					headers={'Authorization': f'Bearer {token}'}
+				)
+			self.assertEqual(200, list_res.status_code)
+			self.assertEqual(6, len(list_res.get_json()['users']))
+			statement_counts.append(len(statements))
+			with self.recorded_statements() as statements:
+				search_res = self.client.post('/user/search',
+					headers={'Authorization': f'Bearer {token}'},
+					json={ 'username': 'user' }
+				)
+			self.assertEqual(200, search_res.status_code)
+			self.assertEqual(6, len(search_res.get_json()['users']))
+			statement_counts.append(len(statements))
+		# Authentication, the users joined with their stats, and their friends.
+		self.assertEqual([3, 3, 3, 3], statement_counts)
+
+	def test_user_list_pagination(self):
+		users = [
+			User(f'user{i}', f'user{i}@example.com', 'password')
+			for i in range(5)
+		]
+		db.session.add_all(users)
+		db.session.commit()
+		headers = {'Authorization': f'Bearer {users[0].get_token()}'}
+		seen = []
+		cursor = None
+		for expected in [2, 2, 1]:
+			params = { 'limit': 2 }
+			if cursor is not None:
+				params['after'] = cursor
+			page_res = self.client.get('/user/all',
+				headers=headers, query_string=params
+			)
+			self.assertEqual(200, page_res.status_code)
+			page = page_res.get_json()
+			self.assertEqual(expected, len(page['users']))
+			seen += [u['id'] for u in page['users']]
+			cursor = page['next_cursor']
+		self.assertIsNone(cursor)
+		self.assertEqual([u.id for u in users], seen)
+		# Search pages the same way
+		search_res = self.client.post('/user/search',
+			headers=headers,
+			query_string={ 'limit': 3 },
+			json={ 'username': 'user' }
+		)
+		self.assertEqual(3, len(search_res.get_json()['users']))
+		self.assertIsNotNone(search_res.get_json()['next_cursor'])
+		# Cursors that aren't base64, or aren't of an integer key
+		for params in [{ 'limit': 0 }, { 'limit': 'ten' }, { 'after': '!!' },
+			{ 'after': 'e30=' }, { 'after': 'WzFd' }, { 'after': 'dHJ1ZQ==' }]:
+			bad_res = self.client.get('/user/all',
+				headers=headers, query_string=params
+			)
+			self.assertEqual(400, bad_res.status_code)
@@ -0,0 +1,74 @@
+import itertools
+from jsonschema import validate, ValidationError
+from tests.test_prototype import PrototypeModelTestCase
+from dark_chess_api import endpointer
+from dark_chess_api.endpoint_handler.validation import PayloadValidator
+
+# Values of every json type, and some that nearly fit the schemas used.
+VALUES = [None, True, False, 0, 1, -5, 2.5, '', 'e2e4', 'e7e8q', 'E2E4', 'e2e4 ',
+	'user@example.com', [], ['e2e4'], {}, { 'a': 1 }]
+
+def message(f, payload):
+	try:
+		f(payload)
+	except ValidationError as e:
+		return e.message
+	return None
+
+class ValidationTestCases(PrototypeModelTestCase):
+
+	def endpoints(self):
+		return [
+			endpoint for resource in endpointer.resources.values()
+			for endpoint in resource.endpoints.values() if endpoint.accepts
+		]
+
+	def payloads(self, endpoint):
+		keys = list(endpoint.schema_base)
+		yield from [None, [], 'payload', 1]
+		for count in range(len(keys) + 1):
+			for chosen in itertools.combinations(keys, count):
+				for value in VALUES:
+					yield { key: value for key in chosen }
+				# Valid ones, as best we can
+				yield { key: self.valid_value(endpoint.schema_base[key])
+					for key in chosen }
+		yield { 'unexpected': 1 }
+
+	def valid_value(self, schema):
+		return {
+			'string': 'e2e4',
+			'integer': 1,
+			'boolean': True
+		}[schema['type']]
+
+	def test_every_schema_is_generated(self):
+		for endpoint in self.endpoints():
+			self.assertIsNotNone(endpoint.validator.source, endpoint.name)
+
+	def test_identical_messages(self):
+		for endpoint in self.endpoints():
+			schema = endpoint.validation_schema
+			compiled = PayloadValidator(schema, generate=False)
+			checked = 0
+			for payload in self.payloads(endpoint):
+				expected = message(lambda p: validate(p, schema), payload)
+				self.assertEqual(expected,
+					message(endpoint.validator.validate, payload),
+					f'{endpoint.name}: {payload!r}'
+				)
+				self.assertEqual(expected, message(compiled.validate, payload))
+				checked += expected is None
+			# Some of them should have been valid
+			self.assertGreater(checked, 0, endpoint.name)
+
+	def test_unsupported_schemas(self):
+		schema = {
+			'type': 'object',
+			'properties': { 'moves': { 'type': 'array', 'minItems': 1 } }
+		}
+		validator = PayloadValidator(schema)
+		self.assertIsNone(validator.source)
+		self.assertEqual('[] is too short',
+			message(validator.validate, { 'moves': [] })
+		)
@@ -0,0 +1,335 @@
+import time
+from unittest import mock
+import chess
+from itsdangerous import TimestampSigner
+from tests.test_prototype import PrototypeModelTestCase, TestConfig
+from dark_chess_api import create_app, db, socketio
+from dark_chess_api.modules.websockets import move_buffer
+from dark_chess_api.modules.websockets.move_buffer import MoveEventBuffer
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match
+
+class WebsocketTestCases(PrototypeModelTestCase):
+
+	def setUp(self):
+		super().setUp()
+		u1 = User('user1', 'user1@example.com', 'password')
+		u2 = User('user2', 'user2@example.com', 'password')
+		u3 = User('user3', 'user3@example.com', 'password')
+		db.session.add_all([u1, u2, u3])
+		db.session.commit()
+		m = Match()
+		db.session.add(m)
+		m.join(u1)
+		m.join(u2)
+		db.session.commit()
+		self.connection_token = m.connection_token
+		self.tokens = {
+			'white': m.player_white.get_token(),
+			'black': m.player_black.get_token(),
+			'spectating': u3.get_token()
+		}
+
+	def get_match(self, side):
+		return self.client.get('/match/1',
+			headers={'Authorization': f'Bearer {self.tokens[side]}'}
+		).get_json()
+
+	def connect(self, side_token=None, last_seen_ply=None):
+		client = socketio.test_client(self.app,
+			namespace='/match-moves',
+			flask_test_client=self.client
+		)
+		client.emit('authenticate', {
+				'connectionToken': self.connection_token,
+				'sideToken': side_token,
+				'lastSeenPly': last_seen_ply
+			},
+			namespace='/match-moves'
+		)
+		return client
+
+	def received(self, client, name):
+		return [
+			event['args'][0] for event in client.get_received('/match-moves')
+			if event['name'] == name
+		]
+
+	def make_move(self, side, uci_string):
+		res = self.client.post('/match/1/make-move',
+			headers={'Authorization': f'Bearer {self.tokens[side]}'},
+			json={ 'uci_string': uci_string }
+		)
+		self.assertEqual(200, res.status_code)
+
+	# Applies a delta's squares to a rendered board.
+	def apply_delta(self, fen, squares):
+		rows = [list(row) for row in fen.split('/')]
+		for name, symbol in squares.items():
+			square = chess.SQUARE_NAMES.index(name)
+			rows[7 - chess.square_rank(square)][chess.square_file(square)] = symbol
+		return '/'.join(''.join(row) for row in rows)
+
+	# Everything sent to a client after it authenticated.
+	def caught_up(self, client):
+		events = client.get_received('/match-moves')
+		self.assertEqual('authenticated', events[0]['name'])
+		return events[1:]
+
+	def test_side_rooms(self):
+		clients = {
+			side: self.connect(self.get_match(side).get('side_token'))
+			for side in ['white', 'black', 'spectating']
+		}
+		for side, client in clients.items():
+			self.assertEqual([{ 'side': side }], self.received(client, 'authenticated'))
+		before = {
+			side: self.get_match(side) for side in ['white', 'black', 'spectating']
+		}
+		self.make_move('white', 'e2e4')
+		white_event, = self.received(clients['white'], 'move-delta')
+		black_event, = self.received(clients['black'], 'move-delta')
+		spectator_event, = self.received(clients['spectating'], 'move-delta')
+		# Applied to what each side had, the deltas give exactly what it would
+		# get from the api.
+		for side, event in [('white', white_event), ('black', black_event)]:
+			match = self.get_match(side)
+			self.assertEqual(1, event['seq'])
+			self.assertEqual(match['ply'], event['seq'])
+			self.assertEqual('black', event['current_side'])
+			self.assertEqual(match['current_player_id'], event['current_player_id'])
+			self.assertEqual(match['current_dark_fen'], self.apply_delta(
+				before[side]['current_dark_fen'], event['squares']
+			))
+			self.assertEqual(match['possible_moves'], event['possible_moves'])
+		self.assertEqual({ 'e2': '_', 'e4': 'P' }, {
+			name: white_event['squares'][name] for name in ['e2', 'e4']
+		})
+		self.assertEqual('e2e4', white_event['uci_string'])
+		self.assertIsNone(black_event['uci_string'])
+		self.assertEqual(before['white']['player_white'], white_event['player'])
+		self.assertEqual(['id', 'username'], sorted(white_event['player']))
+		self.assertEqual({}, white_event['possible_moves'])
+		for key in ['uci_string', 'possible_moves']:
+			self.assertNotIn(key, spectator_event)
+		self.assertEqual({ 'e2': '_', 'e4': 'P' }, spectator_event['squares'])
+		self.assertEqual(self.get_match('spectating')['current_fen'],
+			self.apply_delta(before['spectating']['current_fen'],
+				spectator_event['squares']
+			)
+		)
+
+	def test_snapshot(self):
+		side_tokens = {
+			side: self.get_match(side).get('side_token')
+			for side in ['white', 'black', 'spectating']
+		}
+		self.make_move('white', 'e2e4')
+		self.make_move('black', 'e7e5')
+		for side, side_token in side_tokens.items():
+			client = self.connect(side_token)
+			client.emit('request-snapshot', {
+					'connectionToken': self.connection_token,
+					'sideToken': side_token
+				},
+				namespace='/match-moves'
+			)
+			snapshot, = self.received(client, 'snapshot')
+			match = self.get_match(side)
+			self.assertEqual(2, snapshot['seq'])
+			self.assertFalse(snapshot['is_finished'])
+			for key in ['current_side', 'current_player_id', 'current_dark_fen',
+				'current_fen', 'possible_moves']:
+				self.assertEqual(match.get(key), snapshot.get(key))
+
+	def test_resume_from_ply(self):
+		side_token = self.get_match('black').get('side_token')
+		live = self.connect(side_token, last_seen_ply=0)
+		self.assertEqual([], self.received(live, 'snapshot'))
+		for side, uci_string in [('white', 'e2e4'), ('black', 'e7e5'),
+			('white', 'g1f3')]:
+			self.make_move(side, uci_string)
+		sent = self.received(live, 'move-delta')
+		for last_seen_ply in range(4):
+			client = self.connect(side_token, last_seen_ply=last_seen_ply)
+			self.assertEqual(sent[last_seen_ply:],
+				self.received(client, 'move-delta')
+			)
+			self.assertEqual([], self.received(client, 'snapshot'))
+
+	def test_resume_falls_back_to_snapshot(self):
+		self.app.config['MOVE_EVENT_BUFFER_SIZE'] = 2
+		move_buffer.init_app(self.app)
+		side_token = self.get_match('white').get('side_token')
+		for side, uci_string in [('white', 'e2e4'), ('black', 'e7e5'),
+			('white', 'g1f3')]:
+			self.make_move(side, uci_string)
+		# Moves older than the buffer can't be caught up on
+		client = self.connect(side_token, last_seen_ply=0)
+		snapshot, = self.caught_up(client)
+		self.assertEqual('snapshot', snapshot['name'])
+		self.assertEqual(3, snapshot['args'][0]['seq'])
+		self.assertEqual(
+			self.get_match('white')['current_dark_fen'],
+			snapshot['args'][0]['current_dark_fen']
+		)
+		client = self.connect(side_token, last_seen_ply=1)
+		self.assertEqual([2, 3], [
+			event['seq'] for event in self.received(client, 'move-delta')
+		])
+		# Nor are moves the buffer has lost, say to a restart
+		move_buffer.clear()
+		client = self.connect(side_token, last_seen_ply=1)
+		self.assertEqual(['snapshot'], [
+			event['name'] for event in self.caught_up(client)
+		])
+		client = self.connect(side_token, last_seen_ply=3)
+		self.assertEqual([], self.caught_up(client))
+
+	# Moves made through another process (sharing a message queue) aren't in
+	# this one's buffer, which has nothing newer than what the client saw.
+	def test_resume_behind_other_processes(self):
+		side_token = self.get_match('white').get('side_token')
+		for side, uci_string in [('white', 'e2e4'), ('black', 'e7e5'),
+			('white', 'g1f3')]:
+			self.make_move(side, uci_string)
+		for side in ['white', 'black', 'spectating']:
+			for i in range(2):
+				move_buffer._matches[self.connection_token][side].pop()
+		for last_seen_ply in [0, 1]:
+			client = self.connect(side_token, last_seen_ply=last_seen_ply)
+			snapshot, = self.caught_up(client)
+			self.assertEqual('snapshot', snapshot['name'])
+			self.assertEqual(3, snapshot['args'][0]['seq'])
+
+	def test_move_buffer_bounds(self):
+		buffer = MoveEventBuffer(size=2, max_matches=2)
+		for ply in range(1, 4):
+			buffer.record('a', 'white', { 'seq': ply })
+		self.assertEqual([{ 'seq': 2 }, { 'seq': 3 }], buffer.since('a', 'white', 1))
+		self.assertIsNone(buffer.since('a', 'white', 0))
+		self.assertIsNone(buffer.since('a', 'black', 1))
+		buffer.record('b', 'white', { 'seq': 1 })
+		buffer.record('a', 'white', { 'seq': 4 })
+		buffer.record('c', 'white', { 'seq': 1 })
+		self.assertIsNone(buffer.since('b', 'white', 0))
+		self.assertEqual([{ 'seq': 4 }], buffer.since('a', 'white', 3))
+		# Gaps in what was recorded can't be caught up from
+		buffer.record('c', 'white', { 'seq': 3 })
+		self.assertIsNone(buffer.since('c', 'white', 0))
+		self.assertEqual([{ 'seq': 3 }], buffer.since('c', 'white', 2))
+		buffer.discard('c')
+		self.assertIsNone(buffer.since('c', 'white', 2))
+
+	def test_make_move(self):
+		clients = {
+			side: self.connect(self.get_match(side).get('side_token'))
+			for side in ['white', 'black', 'spectating']
+		}
+		for client in clients.values():
+			client.get_received('/match-moves')
+		def move(side, uci_string):
+			return clients[side].emit('make-move', { 'uci_string': uci_string },
+				namespace='/match-moves',
+				callback=True
+			)
+		self.assertEqual(
+			{ 'status': 403, 'message': 'Player not playing this match' },
+			move('spectating', 'e2e4')
+		)
+		self.assertEqual({ 'status': 409, 'message': 'Not your turn' },
+			move('black', 'e7e5')
+		)
+		self.assertEqual({ 'status': 422, 'message': 'Move not possible' },
+			move('white', 'e2e5')
+		)
+		self.assertEqual({ 'status': 400, 'message': 'Invalid uci string' },
+			move('white', 'nonsense')
+		)
+		for client in clients.values():
+			self.assertEqual([], client.get_received('/match-moves'))
+		ack = move('white', 'e2e4')
+		self.assertEqual(200, ack['status'])
+		self.assertEqual('Move successfully made', ack['message'])
+		match = self.get_match('white')
+		self.assertEqual(1, ack['state']['seq'])
+		self.assertEqual(match['current_dark_fen'], ack['state']['current_dark_fen'])
+		self.assertEqual({}, ack['state']['possible_moves'])
+		# Everyone's sent the move, just as if it had been made over the api
+		for side, client in clients.items():
+			event, = self.received(client, 'move-delta')
+			self.assertEqual(1, event['seq'])
+		self.assertEqual(200, move('black', 'e7e5')['status'])
+		self.assertEqual(2, self.get_match('black')['ply'])
+
+	def test_invalid_side_token(self):
+		white_token = self.get_match('white')['side_token']
+		for side_token in [None, 'nonsense', white_token[:-1]]:
+			client = self.connect(side_token)
+			self.assertEqual(
+				[{ 'side': 'spectating' }],
+				self.received(client, 'authenticated')
+			)
+		# Tokens are only good for the match they were given for
+		m = Match()
+		db.session.add(m)
+		m.join(User.query.get(1))
+		m.join(User.query.get(3))
+		db.session.commit()
+		self.connection_token = m.connection_token
+		client = self.connect(white_token)
+		self.assertEqual(
+			[{ 'side': 'spectating' }],
+			self.received(client, 'authenticated')
+		)
+
+	# Side tokens expire with the api token's lifespan, and go when the
+	# player's api token is revoked, for connections that already presented
+	# them as well.
+	def test_side_token_lifetime(self):
+		lifespan = self.app.config['TOKEN_LIFESPAN_MINUTES'] * 60
+		with mock.patch.object(TimestampSigner, 'get_timestamp',
+			return_value=int(time.time()) - lifespan - 1):
+			expired_token = self.get_match('white')['side_token']
+		self.assertEqual([{ 'side': 'spectating' }],
+			self.received(self.connect(expired_token), 'authenticated')
+		)
+		side_token = self.get_match('white')['side_token']
+		client = self.connect(side_token)
+		self.assertEqual([{ 'side': 'white' }],
+			self.received(client, 'authenticated')
+		)
+		Match.query.get(1).player_white.revoke_token()
+		db.session.commit()
+		self.assertEqual(
+			{ 'status': 401, 'message': 'Side token expired or revoked' },
+			client.emit('make-move', { 'uci_string': 'e2e4' },
+				namespace='/match-moves',
+				callback=True
+			)
+		)
+		self.assertEqual([{ 'side': 'spectating' }],
+			self.received(self.connect(side_token), 'authenticated')
+		)
+
+	# Payloads without a connection token are turned away, rather than
+	# failing in the handler.
+	def test_malformed_payloads(self):
+		for payload in [{}, { 'connectionToken': 1 }, 'nonsense']:
+			client = socketio.test_client(self.app,
+				namespace='/match-moves',
+				flask_test_client=self.client
+			)
+			client.emit('request-snapshot', payload, namespace='/match-moves')
+			self.assertEqual([], self.received(client, 'snapshot'))
+			client.emit('authenticate', payload, namespace='/match-moves')
+			self.assertFalse(client.is_connected('/match-moves'))
+
+	# Side tokens can't be signed without a secret key, so the app won't start
+	# without one, rather than failing every player's match requests.
+	def test_secret_key_required(self):
+		for secret_key in [None, '']:
+			class NoSecretKeyConfig(TestConfig):
+				SECRET_KEY = secret_key
+			with self.assertRaises(ValueError):
+				create_app(NoSecretKeyConfig)
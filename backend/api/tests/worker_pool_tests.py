@@ -0,0 +1,175 @@
+import os
+import time
+import random
+import threading
+from tests.test_prototype import PrototypeModelTestCase, TestConfig
+from dark_chess_api import db, worker_pool
+from dark_chess_api.worker_pool import WorkerPoolFull
+from dark_chess_api.modules.users.models import User
+from dark_chess_api.modules.matches.models import Match
+
+class WorkerPoolConfig(TestConfig):
+	OFFLOAD_WORKERS = 1
+	OFFLOAD_MODE = 'thread'
+	OFFLOAD_QUEUE_SIZE = 0
+	MATCH_OFFLOAD_MIN_PLIES = 1
+
+def thread_name():
+	return threading.current_thread().name
+
+def fail():
+	raise ValueError('Job failed')
+
+class WorkerPoolTestCases(PrototypeModelTestCase):
+
+	config = WorkerPoolConfig
+
+	def setUp(self):
+		super().setUp()
+		self.users = [
+			User(f'user{i}', f'user{i}@example.com', 'password')
+			for i in range(2)
+		]
+		db.session.add_all(self.users)
+		db.session.commit()
+
+	def tearDown(self):
+		worker_pool.shutdown()
+		super().tearDown()
+
+	# A match with its history stored compactly, so that it needs replaying.
+	def compact_match(self, plies, seed=0):
+		self.app.config['MATCH_HISTORY_FORMAT'] = 'compact'
+		self.app.config['MATCH_CHECKPOINT_INTERVAL'] = 8
+		rng = random.Random(seed)
+		m = Match()
+		db.session.add(m)
+		m.join(self.users[0])
+		m.join(self.users[1])
+		db.session.commit()
+		for i in range(plies):
+			if not m.in_progress:
+				break
+			move = rng.choice(list(m.snapshot.board.pseudo_legal_moves))
+			self.assertTrue(m.attempt_move(m.current_player, move.uci()))
+			db.session.commit()
+		return m.id
+
+	def histories(self, match_id):
+		db.session.remove()
+		m = Match.query.get(match_id)
+		return [m.as_dict(side) for side in Match.VIEWERS]
+
+	def completed(self, job):
+		return worker_pool.stats()['jobs'][job]['outcomes'].get('completed', 0)
+
+	def test_thread_mode(self):
+		self.assertTrue(worker_pool.run(thread_name).startswith('worker-pool'))
+		with self.assertRaises(ValueError):
+			worker_pool.run(fail)
+		jobs = worker_pool.stats()['jobs']
+		self.assertEqual({ 'completed': 1 }, jobs['thread_name']['outcomes'])
+		self.assertEqual({ 'failed': 1 }, jobs['fail']['outcomes'])
+
+	def test_offloaded_histories(self):
+		match_id = self.compact_match(20)
+		offloaded = self.histories(match_id)
+		self.assertEqual(3, self.completed('replay_histories'))
+		self.app.config['MATCH_OFFLOAD_MIN_PLIES'] = 1000
+		self.assertEqual(self.histories(match_id), offloaded)
+		# In processes as well
+		self.app.config.update(OFFLOAD_MODE='process', MATCH_OFFLOAD_MIN_PLIES=1)
+		worker_pool.init_app(self.app)
+		self.assertEqual(self.histories(match_id), offloaded)
+		self.assertEqual('process', worker_pool.stats()['mode'])
+		self.assertEqual(3, self.completed('replay_histories'))
+
+	def test_bounded_queue(self):
+		match_id = self.compact_match(10)
+		token = self.users[0].get_token()
+		started, release = threading.Event(), threading.Event()
+		def block():
+			started.set()
+			release.wait()
+		blocking = threading.Thread(target=worker_pool.run, args=(block,))
+		blocking.start()
+		try:
+			started.wait()
+			self.assertEqual(1, worker_pool.stats()['in_flight'])
+			with self.assertRaises(WorkerPoolFull):
+				worker_pool.run(thread_name)
+			res = self.client.get(f'/match/{match_id}',
+				headers={'Authorization': f'Bearer {token}'}
+			)
+			self.assertEqual(503, res.status_code)
+			self.assertEqual('1', res.headers['Retry-After'])
+		finally:
+			release.set()
+			blocking.join()
+		res = self.client.get(f'/match/{match_id}',
+			headers={'Authorization': f'Bearer {token}'}
+		)
+		self.assertEqual(200, res.status_code)
+		jobs = worker_pool.stats()['jobs']
+		self.assertEqual(1, jobs['thread_name']['outcomes']['rejected'])
+		self.assertEqual(1, jobs['replay_histories']['outcomes']['rejected'])
+		metrics = self.client.get('/metrics').get_data(as_text=True)
+		self.assertIn('worker_pool_jobs_total{job="replay_histories",'
+			'outcome="rejected"} 1', metrics)
+		self.assertIn('worker_pool_in_flight 0', metrics)
+
+	def test_worker_died(self):
+		self.app.config['OFFLOAD_MODE'] = 'process'
+		worker_pool.init_app(self.app)
+		pid = worker_pool.run(os.getpid)
+		self.assertNotEqual(os.getpid(), pid)
+		os.kill(pid, 9)
+		with self.assertLogs(self.app.logger, 'WARNING'):
+			# Made do with a thread
+			self.assertEqual(os.getpid(), worker_pool.run(os.getpid))
+		self.assertNotIn(worker_pool.run(os.getpid), [pid, os.getpid()])
+		# What jobs raise themselves isn't taken for the worker dying
+		with self.assertRaises(FileNotFoundError):
+			worker_pool.run(os.stat, '/nonexistent')
+		self.assertEqual({ 'failed': 1 },
+			worker_pool.stats()['jobs']['stat']['outcomes']
+		)
+		self.assertEqual(3, self.completed('getpid'))
+
+	# Jobs waiting for a worker when every worker dies at once (say, killed
+	# for running out of memory) start new ones, rather than waiting forever.
+	def test_waiting_for_dead_workers(self):
+		self.app.config.update(OFFLOAD_MODE='process', OFFLOAD_QUEUE_SIZE=1)
+		worker_pool.init_app(self.app)
+		pid = worker_pool.run(os.getpid)
+		results = {}
+		def run(name, f, *args):
+			results[name] = worker_pool.run(f, *args)
+		running = threading.Thread(target=run, args=('running', time.sleep, 1),
+			daemon=True
+		)
+		waiting = threading.Thread(target=run, args=('waiting', os.getpid),
+			daemon=True
+		)
+		running.start()
+		while worker_pool.stats()['in_flight'] < 1:
+			time.sleep(0.01)
+		waiting.start()
+		while worker_pool.stats()['in_flight'] < 2:
+			time.sleep(0.01)
+		with self.assertLogs(self.app.logger, 'WARNING'):
+			os.kill(pid, 9)
+			waiting.join(10)
+			running.join(10)
+		self.assertFalse(waiting.is_alive())
+		self.assertNotIn(results['waiting'], [pid, os.getpid()])
+
+	def test_no_workers(self):
+		self.app.config['OFFLOAD_WORKERS'] = 0
+		worker_pool.init_app(self.app)
+		self.assertEqual(threading.current_thread().name,
+			worker_pool.run(thread_name)
+		)
+		self.assertEqual({ 'inline': 1 },
+			worker_pool.stats()['jobs']['thread_name']['outcomes']
+		)
@@ -36,6 +36,11 @@ class Config:
 	else:
 		API_DOMAIN_AND_PORT = API_DOMAIN
 		API_ROOT = f'{API_SCHEMA}://{API_DOMAIN}'
+	# The number of API responses kept to be revalidated with their ETags
+	# (see `authorized_api_request`).
+	API_VALIDATOR_CACHE_SIZE = int(
+		os.environ.get('API_VALIDATOR_CACHE_SIZE') or 512
+	)
 
 	MAIL_SERVER = os.environ.get('MAIL_SERVER')
 	MAIL_PORT = env_to_int(os.environ.get('MAIL_PORT'), 25)
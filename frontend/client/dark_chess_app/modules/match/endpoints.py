@@ -3,7 +3,9 @@ from flask import request
 from flask_login import login_required
 from dark_chess_app.modules.match import match
 from dark_chess_app.modules.auth.utils import proxy_login_required
-from dark_chess_app.utilities.api_utilities import authorized_api_request
+from dark_chess_app.utilities.api_utilities import (
+	authorized_api_request, relayed_validators
+)
 from dark_chess_app.modules.errors.handlers import api_error_response
 
 ######################
@@ -13,11 +15,13 @@ from dark_chess_app.modules.errors.handlers import api_error_response
 @match.route('/api/<int:id>')
 @proxy_login_required
 def api_get_match(id):
-	match_res = authorized_api_request(f'/match/{id}')
+	match_res = authorized_api_request(f'/match/{id}', forward_validators=True)
+	if match_res.status_code == 304:
+		return '', 304, relayed_validators(match_res)
 	if match_res.status_code != 200:
 		return api_error_response(match_res.status_code)
 	match_json = match_res.json()
-	return match_json
+	return match_json, 200, relayed_validators(match_res)
 
 @match.route('/api/<int:id>/make-move', methods=['POST'])
 @proxy_login_required
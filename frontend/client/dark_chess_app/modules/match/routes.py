@@ -51,18 +51,21 @@ def accept_match_invite(id):
 @login_required
 def open_matches():
 	open_matches_res = authorized_api_request(f'/match/invite/query', requests.post,
+		params={ 'after': request.args.get('after') },
 		json={
 			'is_open': True,
 			'accepted': False
 		}
 	)
+	open_matches_json = open_matches_res.json()
 	open_matches = [
-		m for m in open_matches_res.json()
+		m for m in open_matches_json['match_invites']
 		if m['inviter']['id'] != current_user.id
 	]
 	return render_template('match/open_match_invite_list.html',
 		title='Match List',
-		open_matches=open_matches
+		open_matches=open_matches,
+		next_cursor=open_matches_json['next_cursor']
 	)
 
 # @match.route('/my-unnaccepted-invites')
@@ -84,15 +87,17 @@ def open_matches():
 @login_required
 def users_match_invites():
 	invites_res = authorized_api_request('/match/invite/query', requests.post,
+		params={ 'after': request.args.get('after') },
 		json={
 			'involved_id': current_user.id,
 			'accepted': False
 		}
 	)
 	# TODO: Handle errors
+	invites_json = invites_res.json()
 	users_invites = []
 	user_invited = []
-	for invite in invites_res.json():
+	for invite in invites_json['match_invites']:
 		if invite['inviter']['id'] == current_user.id:
 			users_invites.append(invite)
 		else:
@@ -100,22 +105,26 @@ def users_match_invites():
 	return render_template('match/users_match_invites.html',
 		title='My Match Invites',
 		users_invites=users_invites,
-		user_invited=user_invited
+		user_invited=user_invited,
+		next_cursor=invites_json['next_cursor']
 	)
 
 @match.route('/my-active-matches')
 @login_required
 def users_active_matches():
 	matches_res = authorized_api_request(f'/match/query', requests.post,
+		params={ 'after': request.args.get('after') },
 		json={
 			'user_id': current_user.id,
 			'in_progress': True,
 		}
 	)
 	# TODO: Handle errors
+	matches_json = matches_res.json()
 	return render_template('match/active_match_list.html',
 		title='My Active Matches',
-		matches=matches_res.json()
+		matches=matches_json['matches'],
+		next_cursor=matches_json['next_cursor']
 	)
 
 @match.route('/<int:id>')
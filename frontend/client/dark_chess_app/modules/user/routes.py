@@ -39,17 +39,34 @@ def user_profile(id):
 def user_search():
 	form = UserSearchForm()
 	results = None
+	next_cursor = None
+	username = None
+	after = None
 	if form.validate_on_submit():
+		# A new search starts from the first page, even when submitted from a
+		# later one (whose cursor is still in the url).
+		username = form.username.data
+	elif request.method == 'GET' and request.args.get('username'):
+		# Following the "More" link from a previous page of results
+		username = request.args.get('username')
+		after = request.args.get('after')
+		form.username.data = username
+	if username is not None:
 		search_request = authorized_api_request('/user/search',
 			method=requests.post,
-			json={ 'username': form.username.data }
+			params={ 'after': after },
+			json={ 'username': username }
 		)
 		if search_request.status_code != 200:
 			flash('Unable to load search results', 'error')
 			return redirect(url_for('main.index'))
-		results = search_request.json()
+		search_json = search_request.json()
+		results = search_json['users']
+		next_cursor = search_json['next_cursor']
 	return render_template('user/user_search.html',
 		title='Search Results',
 		form=form,
-		results=results
+		results=results,
+		next_cursor=next_cursor,
+		username=username
 	)
\ No newline at end of file
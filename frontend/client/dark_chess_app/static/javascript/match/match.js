@@ -41,13 +41,24 @@ function swapEl(el1, el2) {
 }
 
 // WebsocketHandler listens to events from the backend on behalf of the other
-// classes. Since we don't want to leak player positions, most of these simply
-// prompt the API handler to request a new model state.
+// classes. Players present the side token they're given with the match, and
+// are then sent the squares of their own side's view that each move changed,
+// so there's no need to request a new model state after each one. Anyone else
+// is a spectator.
+//
+// Every (re)connection authenticates with the last ply the model has seen, and
+// the server sends back any moves made since then, so dropped connections
+// don't need the match to be reloaded either.
+//
+// Players also make their moves over the connection, which saves a trip through
+// the frontend and the api for each one. The api is still used if the
+// connection is down.
 class WebsocketHandler {
 
-	constructor(config, connectionToken) {
+	constructor(config, connectionToken, sideToken = null) {
 		logDebug('Constructing WebsocketHandler.', 'Websocket');
 		this._connectionToken = connectionToken;
+		this._sideToken = sideToken;
 		this._conn = this._setupServerConn(config.apiRoot);
 		this._registerEventListeners();
 	}
@@ -67,8 +78,9 @@ class WebsocketHandler {
 			logDebug('Connected to server.', 'Websocket');
 			logDebug('Authenticating...', 'Websocket');
 			this._conn.emit('authenticate', {
-				token: config.token,
-				connectionToken: this._connectionToken 
+				connectionToken: this._connectionToken,
+				sideToken: this._sideToken,
+				lastSeenPly: this._listener?.lastSeenPly ?? null
 			});
 		});
 		this._conn.on('authenticated', event => {
@@ -79,13 +91,17 @@ class WebsocketHandler {
 			logDebug('Match begun', 'Websocket');
 			this._listener.handleMatchBegin();
 		});
-		this._conn.on('move-made', event => {
+		this._conn.on('move-delta', event => {
 			logDebug('Move made', 'Websocket');
 			if (config.debug) {
 				console.debug(event);
 			}
 			this._listener.handleMoveEvent(event);
 		});
+		this._conn.on('snapshot', event => {
+			logDebug('Snapshot', 'Websocket');
+			this._listener.handleSnapshot(event);
+		});
 		this._conn.on('match-finish', event => {
 			logDebug('Match Finished', 'Websocket');
 			this._listener.handleMatchFinish(
@@ -94,6 +110,26 @@ class WebsocketHandler {
 		});
 	}
 
+	get canMove() {
+		return this._sideToken != null && this._conn.connected;
+	}
+
+	// `callback` is passed the server's reply, which has the status and
+	// message the api would have answered with, and if the move was made, this
+	// side's new position as a snapshot.
+	requestMove(move, callback) {
+		logDebug('(WS Event) requesting move: ' + move, 'Websocket');
+		this._conn.emit('make-move', { uci_string: move }, callback);
+	}
+
+	requestSnapshot() {
+		logDebug('Requesting snapshot', 'Websocket');
+		this._conn.emit('request-snapshot', {
+			connectionToken: this._connectionToken,
+			sideToken: this._sideToken
+		});
+	}
+
 }
 
 
@@ -336,8 +372,53 @@ class MatchModel {
 		return ret !== undefined ? ret : [];
 	}
 
-	moveMade(player, uciString, currentFen) {
-		this.reload(currentFen);
+	get ply() {
+		return this._matchData.ply;
+	}
+
+	// Applies a move delta from the websocket, which carries the squares of
+	// this side's view that changed. Deltas only apply on top of the one
+	// before, so this returns false if one's been missed, in which case a
+	// snapshot should be requested.
+	applyMoveDelta(event) {
+		logDebug(`(Move Event) Match model applying delta ${event.seq}.`);
+		if (this._board === undefined || this.ply === undefined) {
+			return false;
+		}
+		if (event.seq <= this.ply) {
+			// Already applied, or covered by a snapshot
+			return true;
+		}
+		if (event.seq != this.ply + 1) {
+			return false;
+		}
+		Object.assign(this._board, event.squares);
+		this._update(event);
+		return true;
+	}
+
+	// Applies a snapshot from the websocket. Returns false for finished
+	// matches, which should be reloaded from the api instead.
+	applySnapshot(snapshot) {
+		logDebug(`(Snapshot Event) Match model applying snapshot ${snapshot.seq}.`);
+		if (snapshot.is_finished) {
+			return false;
+		}
+		if (snapshot.current_dark_fen) {
+			this._board = this.loadFromDarkFen(snapshot.current_dark_fen);
+		} else {
+			this._board = this.loadFromFen(snapshot.current_fen);
+		}
+		this._update(snapshot);
+		return true;
+	}
+
+	_update(event) {
+		this._matchData.ply = event.seq;
+		this._matchData.current_side = event.current_side;
+		this._matchData.current_player_id = event.current_player_id;
+		this._matchData.possible_moves = event.possible_moves || {};
+		this._listener.handleModelReload();
 	}
 
 	setListener(listener) {
@@ -1855,7 +1936,9 @@ class Match {
 
 		this._bvc.setListener(this);
 		this._api = new APIHandler(config);
-		this._wsh = new WebsocketHandler(config, matchData.connection_token);
+		this._wsh = new WebsocketHandler(
+			config, matchData.connection_token, matchData.side_token
+		);
 		this._wsh.setListener(this);
 	}
 
@@ -1871,7 +1954,7 @@ class Match {
 
 	/* Board View Controller Listener methods */
 	handleMoveRequest(move) {
-		this._api.requestMove(this._mm, move);
+		this._requestMove(move);
 	}
 
 	handlePromotionEngagement(move) {
@@ -1881,10 +1964,29 @@ class Match {
 	// Note this doesn't do any checks for corrupted state...
 	handlePromotionRequest(piece) {
 		let move = this._mm.promotionMove + piece;
-		this._api.requestMove(this._mm, move)
+		this._requestMove(move);
+	}
+
+	_requestMove(move) {
+		if (!this._wsh.canMove) {
+			this._api.requestMove(this._mm, move);
+			return;
+		}
+		this._wsh.requestMove(move, reply => {
+			logDebug(`(Server Response) ${reply.status} ${reply.message}`, 'Websocket');
+			// The move is normally applied from its move event, which arrives
+			// first. This only makes up for one that went missing.
+			if (reply.state && !(reply.state.seq <= this._mm.ply)) {
+				this.handleSnapshot(reply.state);
+			}
+		});
 	}
 
 	/* Websocket Event Listener methods */
+	get lastSeenPly() {
+		return this._mm.ply;
+	}
+
 	handleMatchBegin() {
 		this.syncModelWithRemote();
 	}
@@ -1894,7 +1996,15 @@ class Match {
 			this._mm.clearPromotion();
 		}
 		this._mm.latestMove = event.uci_string;
-		this.syncModelWithRemote();
+		if (!this._mm.applyMoveDelta(event)) {
+			this._wsh.requestSnapshot();
+		}
+	}
+
+	handleSnapshot(snapshot) {
+		if (!this._mm.applySnapshot(snapshot)) {
+			this.syncModelWithRemote();
+		}
 	}
 
 	handleMatchFinish(winningPlayerJSON) {
@@ -1,5 +1,9 @@
+import threading
+from collections import OrderedDict
+
 import requests
-from flask import current_app, flash, abort, redirect, url_for
+from werkzeug.http import parse_etags, unquote_etag
+from flask import current_app, request, flash, abort, redirect, url_for
 from flask_login import current_user, logout_user
 
 def api_route(endpoint, **kwargs):
@@ -10,16 +14,78 @@ def api_route(endpoint, **kwargs):
 def api_request(endpoint, method=requests.get, **kwargs):
 	return method(api_route(endpoint), **kwargs)
 
-def authorized_api_request(endpoint, method=requests.get, **kwargs):
+# GET responses with an ETag are kept (per user, since what the API sends
+# depends on who's asking), and revalidated with `If-None-Match` the next time
+# they're requested. When the API answers with a 304, the response kept is
+# handed back in its place, so callers never see the difference. The least
+# recently used responses are dropped once there are more than
+# `API_VALIDATOR_CACHE_SIZE`.
+class ValidatorCache:
+
+	def __init__(self):
+		self._responses = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			response = self._responses.get(key)
+			if response is not None:
+				self._responses.move_to_end(key)
+			return response
+
+	def put(self, key, response):
+		with self._lock:
+			self._responses[key] = response
+			self._responses.move_to_end(key)
+			while len(self._responses) > current_app.config['API_VALIDATOR_CACHE_SIZE']:
+				self._responses.popitem(last=False)
+
+validator_cache = ValidatorCache()
+
+# With `forward_validators`, the browser's own `If-None-Match` is passed on as
+# well, and if that's what the API matched its 304 is returned, for the caller
+# to relay (see `relayed_validators`).
+def authorized_api_request(endpoint, method=requests.get,
+	forward_validators=False, **kwargs):
 	if 'headers' in kwargs:
 		kwargs['headers']['Authorization'] = f'Bearer {current_user.token}'
 	else:
 		kwargs['headers'] = {
 			'Authorization': f'Bearer {current_user.token}'
 		}
+	cache_key = None
+	cached = None
+	browser_etags = None
+	if method is requests.get:
+		cache_key = (current_user.token, endpoint, repr(kwargs.get('params')))
+		cached = validator_cache.get(cache_key)
+		validators = []
+		if forward_validators and 'If-None-Match' in request.headers:
+			browser_etags = parse_etags(request.headers['If-None-Match'])
+			validators.append(request.headers['If-None-Match'])
+		if cached is not None:
+			validators.append(cached.headers['ETag'])
+		if validators:
+			kwargs['headers']['If-None-Match'] = ', '.join(validators)
 	req = api_request(endpoint, method, **kwargs)
 	if req.status_code == 401: # token auth failed
 		flash('Your session has expired, please log in again.')
 		logout_user()
 		abort(401) # login redirect is handled by app level error handler.
-	return req
\ No newline at end of file
+	if cache_key is not None:
+		if req.status_code == 304 and cached is not None:
+			etag = req.headers.get('ETag', cached.headers['ETag'])
+			if browser_etags is None or not browser_etags.contains_weak(
+				unquote_etag(etag)[0]
+			):
+				return cached
+		elif req.status_code == 200 and 'ETag' in req.headers:
+			validator_cache.put(cache_key, req)
+	return req
+
+# The caching headers of an API response, to be sent on to the browser.
+def relayed_validators(res):
+	return {
+		header: res.headers[header]
+		for header in ['ETag', 'Cache-Control'] if header in res.headers
+	}